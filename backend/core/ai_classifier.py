@@ -1,4 +1,8 @@
+import asyncio
+import json
 import logging
+import os
+import time
 from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
 # Intento de compatibilidad Pydantic V1/V2
@@ -12,30 +16,18 @@ from typing import Literal
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# --- 1. Definir Estructura de Salida (JSON Estricto) ---
-class TaxonomyClassification(BaseModel):
-    term: str = Field(description="El término analizado")
-    classification: Literal["INDUSTRY", "CONCEPT", "PRODUCT", "UNKNOWN"] = Field(
-        description="Nivel taxonómico: INDUSTRY (Sector amplio), CONCEPT (Tipo de producto genérico), PRODUCT (Item específico/marca)."
-    )
-    parent_industry: str = Field(description="La industria madre sugerida (ej: 'Tecnología', 'Moda').")
-    reason: str = Field(description="Breve explicación de por qué se clasificó así.")
+# Subir al cambiar el prompt: invalida la caché de clasificaciones (core.taxonomy_cache)
+PROMPT_VERSION = "v7.1"
+MODEL_NAME = "llama3.1"
+# URL de host.docker.internal para conectar desde Docker al Windows Host.
+# Si corre local fuera de docker, usar localhost (o el mock: `manage.py mock_ollama`).
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://host.docker.internal:11434")
+# Llamadas simultáneas a Ollama (alinear con OLLAMA_NUM_PARALLEL del servidor)
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "4"))
+# Productos por llamada en modo multi-item (1 = una llamada por producto)
+TAXONOMY_BATCH_SIZE = int(os.getenv("TAXONOMY_BATCH_SIZE", "1"))
 
-# --- 2. El Taxónomo ---
-class TaxonomistAI:
-    def __init__(self, model_name="llama3.1"):
-        # URL de host.docker.internal para conectar desde Docker al Windows Host
-        # Si corre local fuera de docker, usar localhost.
-        self.llm = ChatOllama(
-            model=model_name,
-            base_url="http://host.docker.internal:11434", 
-            temperature=0, # Temperatura 0 para máxima precisión y determinismo
-            format="json" # Forzar modo JSON nativo de Ollama
-        )
-        
-        # Estructura del Prompt con Few-Shot Learning (Ejemplos + Contexto Visual)
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", """Eres un experto Taxónomo de E-commerce Senior. Tu trabajo es clasificar términos de búsqueda en 3 niveles jerárquicos.
+SYSTEM_PROMPT = """Eres un experto Taxónomo de E-commerce Senior. Tu trabajo es clasificar términos de búsqueda en 3 niveles jerárquicos.
 
             NIVELES:
             1. INDUSTRY (Industria/Categoría Padre): Términos muy amplios.
@@ -69,12 +61,40 @@ class TaxonomistAI:
                 "parent_industry": "Industria Madre",
                 "reason": "Explicación breve citando patrones encontrados en Títulos y Categorías vecinas"
             }}
-            """),
-                "parent_industry": "Industria Madre",
-                "reason": "Explicación breve citando las pistas usadas"
-            }}
-            """),
-            ("user", """
+            """
+
+# Modo multi-item: varios productos en un solo mensaje, respuesta en arreglo JSON.
+# `index` permite re-asociar cada objeto con su producto aunque el modelo cambie el orden u omita alguno.
+BATCH_USER_PROMPT = """
+            Clasifica CADA UNO de estos {count} productos por separado (no los mezcles entre sí).
+            Responde SOLO un arreglo JSON con un objeto por producto, con el campo "index" (número del producto)
+            además de los campos habituales:
+            [{{"index": 1, "term": "...", "classification": "NIVEL", "concept_name": "...", "parent_industry": "...", "reason": "..."}}]
+
+            {items}
+            """
+
+# --- 1. Definir Estructura de Salida (JSON Estricto) ---
+class TaxonomyClassification(BaseModel):
+    term: str = Field(description="El término analizado")
+    classification: Literal["INDUSTRY", "CONCEPT", "PRODUCT", "UNKNOWN"] = Field(
+        description="Nivel taxonómico: INDUSTRY (Sector amplio), CONCEPT (Tipo de producto genérico), PRODUCT (Item específico/marca)."
+    )
+    parent_industry: str = Field(description="La industria madre sugerida (ej: 'Tecnología', 'Moda').")
+    reason: str = Field(description="Breve explicación de por qué se clasificó así.")
+
+# --- 2. El Taxónomo ---
+class TaxonomistAI:
+    def __init__(self, model_name=MODEL_NAME, cache=None, base_url=OLLAMA_BASE_URL):
+        self.model_name = model_name
+        self.base_url = base_url
+        # Caché semántica por título (evita re-clasificar publicaciones casi idénticas)
+        self.cache = cache
+        self.llm = self._make_llm()
+        
+        # Estructura del Prompt con Few-Shot Learning (Ejemplos + Contexto Visual)
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
             ("user", """
             Clasifica este producto:
             Título Objetivo: '{input}'
@@ -84,70 +104,223 @@ class TaxonomistAI:
             {context_visual}
             """)
         ])
+        self.batch_prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("user", BATCH_USER_PROMPT)
+        ])
 
         # Chain: Prompt -> LLM -> JSON Parser (implícito en el prompt o via structured_output)
         # Llama 3 suele ser muy bueno respondiendo JSON si se le pide format="json" en el constructor.
         self.chain = self.prompt | self.llm
 
-    def classify(self, term, visual_context=None, source_categories=None):
+    def _make_llm(self):
+        return ChatOllama(
+            model=self.model_name,
+            base_url=self.base_url,
+            temperature=0, # Temperatura 0 para máxima precisión y determinismo
+            format="json" # Forzar modo JSON nativo de Ollama
+        )
+
+    def classify(self, term, visual_context=None, source_categories=None, cache_key=None):
         """
         Clasifica un término usando Llama 3 con contexto enriquecido.
         visual_context: Lista de DICCIONARIOS (Rich Objects del vecino).
         source_categories: Lista de strings (categorías del scraper).
+        cache_key: texto con el que se busca/guarda en la caché (ej: solo el título); default `term`.
+        """
+        if self.cache is None:
+            return self._classify_llm(term, visual_context, source_categories)
+
+        key = cache_key or term
+        cached, vector = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        t0 = time.perf_counter()
+        data = self._classify_llm(term, visual_context, source_categories)
+        if data and data.get('concept_name'):
+            self.cache.put(key, data, time.perf_counter() - t0, vector)
+        return data
+
+    def classify_many(self, items, concurrency=OLLAMA_CONCURRENCY, batch_size=TAXONOMY_BATCH_SIZE):
+        """
+        Clasifica varios ítems con llamadas concurrentes a Ollama (máximo `concurrency` en vuelo).
+        items: lista de dicts {term, visual_context, source_categories, cache_key} (solo `term` es obligatorio).
+        batch_size > 1: modo multi-item, `batch_size` productos por llamada con respuesta en arreglo JSON;
+        los que falten o no se puedan parsear se reintentan uno a uno.
+        Retorna: lista de resultados (dict | None) en el mismo orden que `items`.
         """
+        results = [None] * len(items)
+        pending, vectors = [], {}
+        # La caché usa el ORM (síncrono): se consulta antes y se escribe después del bloque async
+        for i, item in enumerate(items):
+            if self.cache is not None:
+                cached, vectors[i] = self.cache.get(item.get('cache_key') or item['term'])
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            pending.append(i)
+
+        if not pending:
+            return results
+
+        answers = asyncio.run(self._aclassify([items[i] for i in pending], concurrency, batch_size))
+        for i, (data, seconds) in zip(pending, answers):
+            results[i] = data
+            if self.cache is not None and data and data.get('concept_name'):
+                self.cache.put(items[i].get('cache_key') or items[i]['term'], data, seconds, vectors.get(i))
+        return results
+
+    async def _aclassify(self, items, concurrency, batch_size):
+        """Retorna: [(resultado | None, segundos de LLM por ítem)] en el orden de `items`."""
+        # LLM propio por corrida: el cliente async de Ollama queda atado al event loop que lo creó
+        llm = self._make_llm()
+        single_chain, batch_chain = self.prompt | llm, self.batch_prompt | llm
+        gate = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(item):
+            async with gate:
+                t0 = time.perf_counter()
+                data = await self._ainvoke(single_chain, item)
+                return data, time.perf_counter() - t0
+
+        async def group(chunk):
+            async with gate:
+                t0 = time.perf_counter()
+                parsed = await self._ainvoke_many(batch_chain, chunk)
+                seconds = (time.perf_counter() - t0) / len(chunk)
+            missing = [k for k in range(len(chunk)) if k not in parsed]
+            if missing:
+                logger.warning(f"⚠️ Respuesta multi-item incompleta: {len(missing)}/{len(chunk)} se reintentan uno a uno.")
+            retried = dict(zip(missing, await asyncio.gather(*(one(chunk[k]) for k in missing))))
+            return [retried.get(k) or (parsed[k], seconds) for k in range(len(chunk))]
+
+        size = max(1, batch_size)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        done = await asyncio.gather(*(group(c) if len(c) > 1 else one(c[0]) for c in chunks))
+        return [answer for chunk, out in zip(chunks, done) for answer in (out if len(chunk) > 1 else [out])]
+
+    async def _ainvoke(self, chain, item):
         try:
-            # Preparar contexto visual (Ahora es una lista de objetos, pasamos a JSON string para la IA)
-            import json
-            ctx_str = "No disponible"
-            if visual_context and len(visual_context) > 0:
-                # Formateamos bonito para que la IA lo lea fácil
-                # Ejemplo: 
-                # 1. "Titulo Vecino" (Cats: [A, B])
-                lines = []
-                for i, v in enumerate(visual_context):
-                    t = v.get('title', 'N/A')
-                    cats = ", ".join(v.get('categories', []))
-                    con = v.get('concept', '')
-                    line = f"- Vecino {i+1}: {t}"
-                    if cats: line += f" | Tags: [{cats}]"
-                    if con: line += f" | Concept: {con}"
-                    lines.append(line)
-                ctx_str = "\n".join(lines)
-            
-            # Preparar contexto categorías propias
-            cats_str = "No disponibles"
-            if source_categories and len(source_categories) > 0:
-                cats_str = ", ".join(source_categories)
-            
-            # Invocar
-            response = self.chain.invoke({
-                "input": term, 
-                "context_visual": ctx_str,
-                "source_categories": cats_str
-            })
-            
-            # Parsear contenido
-            import json
-            content = response.content.strip()
-            
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start != -1 and end != -1:
-                json_str = content[start:end]
-                data = json.loads(json_str)
-                return data
-            else:
-                logger.error(f"❌ Failed to parse JSON from AI: {content}")
-                return None
+            response = await chain.ainvoke(
+                self._prompt_inputs(item['term'], item.get('visual_context'), item.get('source_categories'))
+            )
+            return self._parse(response.content)
+        except Exception as e:
+            logger.error(f"❌ AI Classification Error: {e}")
+            return None
 
+    async def _ainvoke_many(self, chain, items):
+        """Una llamada para varios productos. Retorna: {posición en `items`: resultado} (solo los válidos)."""
+        blocks = []
+        for n, item in enumerate(items, start=1):
+            inputs = self._prompt_inputs(item['term'], item.get('visual_context'), item.get('source_categories'))
+            blocks.append(
+                f"### Producto {n}\n"
+                f"Título Objetivo: '{inputs['input']}'\n"
+                f"Categorías Objetivo: {inputs['source_categories']}\n"
+                f"--- VECINOS VISUALES (Evidencia Comparativa) ---\n{inputs['context_visual']}"
+            )
+        try:
+            response = await chain.ainvoke({"count": len(items), "items": "\n\n".join(blocks)})
+            return self._parse_array(response.content, len(items))
+        except Exception as e:
+            logger.error(f"❌ AI Multi-item Classification Error: {e}")
+            return {}
+
+    @staticmethod
+    def _prompt_inputs(term, visual_context=None, source_categories=None):
+        # Preparar contexto visual (Ahora es una lista de objetos, pasamos a texto para la IA)
+        ctx_str = "No disponible"
+        if visual_context and len(visual_context) > 0:
+            # Formateamos bonito para que la IA lo lea fácil
+            # Ejemplo: 
+            # 1. "Titulo Vecino" (Cats: [A, B])
+            lines = []
+            for i, v in enumerate(visual_context):
+                t = v.get('title', 'N/A')
+                cats = ", ".join(v.get('categories', []))
+                con = v.get('concept', '')
+                line = f"- Vecino {i+1}: {t}"
+                if cats: line += f" | Tags: [{cats}]"
+                if con: line += f" | Concept: {con}"
+                lines.append(line)
+            ctx_str = "\n".join(lines)
+        
+        # Preparar contexto categorías propias
+        cats_str = "No disponibles"
+        if source_categories and len(source_categories) > 0:
+            cats_str = ", ".join(source_categories)
+
+        return {"input": term, "context_visual": ctx_str, "source_categories": cats_str}
+
+    @staticmethod
+    def _parse(content):
+        content = content.strip()
+        start = content.find('{')
+        end = content.rfind('}') + 1
+        if start != -1 and end > start:
+            return json.loads(content[start:end])
+        logger.error(f"❌ Failed to parse JSON from AI: {content}")
+        return None
+
+    @staticmethod
+    def _parse_array(content, n):
+        """
+        Respuesta multi-item -> {posición: resultado}. Acepta el arreglo suelto o envuelto en un objeto
+        ({"items": [...]}, típico con format="json"). Descarta objetos sin concept_name o con index fuera de rango.
+        """
+        content = content.strip()
+        try:
+            data = json.loads(content)
+        except ValueError:
+            start, end = content.find('['), content.rfind(']') + 1
+            if start == -1 or end <= start:
+                return {}
+            try:
+                data = json.loads(content[start:end])
+            except ValueError:
+                return {}
+        if isinstance(data, dict):
+            data = next((v for v in data.values() if isinstance(v, list)), [data])
+        if not isinstance(data, list):
+            return {}
+
+        parsed = {}
+        for pos, entry in enumerate(data):
+            if not isinstance(entry, dict) or not entry.get('concept_name'):
+                continue
+            try:
+                idx = int(entry.get('index')) - 1
+            except (TypeError, ValueError):
+                idx = pos
+            if 0 <= idx < n and idx not in parsed:
+                parsed[idx] = entry
+        return parsed
+
+    def _classify_llm(self, term, visual_context=None, source_categories=None):
+        try:
+            response = self.chain.invoke(self._prompt_inputs(term, visual_context, source_categories))
+            return self._parse(response.content)
         except Exception as e:
             logger.error(f"❌ AI Classification Error: {e}")
             return None
 
 # Singleton Helper
 _taxonomist = None
-def classify_term(term, visual_context=None, source_categories=None):
+def get_taxonomist():
     global _taxonomist
     if _taxonomist is None:
-        _taxonomist = TaxonomistAI()
-    return _taxonomist.classify(term, visual_context, source_categories)
+        from core.taxonomy_cache import TaxonomyCache
+        _taxonomist = TaxonomistAI(MODEL_NAME, cache=TaxonomyCache(MODEL_NAME, PROMPT_VERSION))
+    return _taxonomist
+
+def classify_term(term, visual_context=None, source_categories=None, cache_key=None):
+    return get_taxonomist().classify(term, visual_context, source_categories, cache_key)
+
+def classify_many(items, concurrency=OLLAMA_CONCURRENCY, batch_size=TAXONOMY_BATCH_SIZE):
+    return get_taxonomist().classify_many(items, concurrency, batch_size)
+
+def classify_terms(terms, concurrency=OLLAMA_CONCURRENCY):
+    """Términos sueltos (sin contexto visual) en paralelo. Retorna: resultados en el orden de `terms`."""
+    return classify_many([{"term": t} for t in terms], concurrency)
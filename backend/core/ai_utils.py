@@ -1,9 +1,12 @@
+import re
 import logging
+import numpy as np
 import torch
 from sentence_transformers import SentenceTransformer
 
 # Singleton Pattern para cargar el modelo solo una vez en memoria
 _model_instance = None
+TEXT_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
 
 def get_model():
     global _model_instance
@@ -11,7 +14,7 @@ def get_model():
         # Usamos 'all-MiniLM-L6-v2' (o multilingual)
         # Es muy rápido y genera vectores de dimensión 384 (compatible con nuestra DB)
         logging.info("🧠 Loading Unified AI Brain (MiniLM-L6-v2)...")
-        _model_instance = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2', cache_folder='/app/cache_huggingface')
+        _model_instance = SentenceTransformer(TEXT_MODEL_NAME, cache_folder='/app/cache_huggingface')
     return _model_instance
 
 def encode_text(text):
@@ -27,18 +30,78 @@ def encode_text(text):
     embedding = model.encode(text, convert_to_tensor=False)
     return embedding.tolist()
 
-def encode_batch(texts):
-    """Para procesar listas grandes de una sola vez."""
+def encode_batch(texts, normalize=False, batch_size=64):
+    """
+    Para procesar listas grandes de una sola vez.
+    normalize=True: vectores L2-normalizados (similitud coseno == producto punto).
+    """
     if not texts:
         return []
     model = get_model()
-    embeddings = model.encode(texts, convert_to_tensor=False)
+    embeddings = model.encode(texts, convert_to_tensor=False, normalize_embeddings=normalize, batch_size=batch_size)
     return embeddings.tolist()
 
-def get_image_embedding(image_path):
+def build_product_text(title, description=None, max_desc=200):
+    """Texto canónico para el embedding de producto: Título + intro de la Descripción (sin HTML)."""
+    title = (title or "").strip()
+    desc = re.sub(r'<[^>]+>', ' ', description or "")
+    desc = re.sub(r'\s+', ' ', desc).strip()[:max_desc]
+    return f"{title} | {desc}" if desc else title
+
+def as_vector(value):
+    """
+    Convierte lo que devuelve la DB para una columna pgvector (str '[...]', list o ndarray)
+    a np.ndarray float32. Retorna None si no hay vector.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip('[]')
+        if not value:
+            return None
+        return np.array(value.split(','), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+def text_scores(title, title_vec, cand_titles, cand_vecs):
     """
-    Legacy/Placeholder para compatibilidad.
-    TODO: Implementar CLIP real si necesitamos search visual.
+    Similitud de texto objetivo vs N candidatos en una sola llamada, en la escala legacy
+    (SequenceMatcher) con la que se fijaron weight_text / threshold_hybrid / threshold_text_rescue.
+    Una sola escala por lote de candidatos:
+    - Objetivo y TODOS los candidatos con embedding_text, y calibración "embedding" disponible:
+      producto punto en bloque (vectores normalizados) llevado a la escala legacy.
+    - Si no: kernel difuso calibrado (core.text_similarity) para todo el lote.
+    Retorna: np.ndarray [N] con scores en [0, 1].
     """
-    logging.warning("⚠️ get_image_embedding called but CLIP not loaded. Returning zeros.")
-    return [0.0] * 384
+    from .text_similarity import calibrate, title_similarity
+
+    target = as_vector(title_vec)
+    if target is not None and len(cand_vecs):
+        vecs = [as_vector(v) for v in cand_vecs]
+        if all(v is not None for v in vecs):
+            scores = calibrate(np.clip(np.stack(vecs) @ target, 0.0, 1.0), "embedding")
+            if scores is not None:
+                return scores
+    return title_similarity(title, cand_titles)
+
+def get_image_embedding(image_file):
+    """
+    Vector visual SigLIP (1152d, normalizado) de una imagen subida o ruta local,
+    calculado por el embedding service compartido (mismo espacio que product_embeddings).
+    Retorna: Lista de floats, o None si la imagen es inválida o el servicio no responde.
+    """
+    from .embedding_service import get_client, EmbeddingServiceError
+
+    try:
+        if isinstance(image_file, bytes):
+            data = image_file
+        elif isinstance(image_file, str):
+            with open(image_file, 'rb') as f:
+                data = f.read()
+        else:
+            data = image_file.read() # UploadedFile de Django
+        vectors, _ = get_client().embed_images([data])
+    except (OSError, EmbeddingServiceError) as e:
+        logging.error(f"❌ get_image_embedding failed: {e}")
+        return None
+
+    return vectors[0].tolist() if vectors[0] is not None else None
@@ -0,0 +1,262 @@
+"""
+Agregados de Cluster Mantenidos por Deltas.
+
+Cada cluster guarda total_competitors (miembros), price_sum / price_count (miembros con precio),
+min_price / max_price, average_price = price_sum / price_count y centroid_visual (SUMA de los
+vectores SigLIP de sus miembros: la distancia coseno no depende de la escala, así que la suma
+sirve como centroide sin dividir y se actualiza con + / -). priority_score (core.priority) se
+recalcula en el mismo UPDATE porque depende del tamaño.
+Toda alta, baja o movimiento de membresía debe pasar por estas funciones, con el MISMO cursor
+(y por tanto la misma transacción) que el cambio: clusterizer (psycopg2) y Cluster Lab
+(connection.cursor() de Django) comparten el código.
+
+- Altas: O(1) (LEAST/GREATEST).
+- Bajas: O(1), salvo que el precio que sale sea el mínimo/máximo; entonces solo ese
+  extremo se recalcula sobre los miembros de ESE cluster.
+- Si el producto que sale era el representante, se elige otro entre los miembros que quedan
+  (mayor match_confidence): representative_product_id nunca apunta fuera del cluster.
+- Si sale el último miembro, el cluster se elimina en la misma transacción (sin clusters
+  fantasma con total_competitors = 0); sus market_intelligence_logs pasan al cluster destino.
+- merge_clusters(): fusión set-based de clusters completos (merge de centroides convergentes);
+  el historial de market_intelligence_logs de los absorbidos pasa al sobreviviente.
+- reconcile(): recálculo set-based de todos los clusters + reporte de drift
+  (comando `reconcile_cluster_metrics`).
+"""
+
+from core.priority import cluster_priority_sql, refresh_cluster_priorities
+
+# sign = +1 (entra) / -1 (sale). Se ejecuta DESPUÉS de escribir la membresía,
+# así el recálculo de extremos ya no ve al producto que salió.
+_DELTA_SQL = f"""
+    UPDATE unique_product_clusters c SET
+        total_competitors = GREATEST(c.total_competitors + %(sign)s, 0),
+        price_sum = c.price_sum + %(sign)s * COALESCE(p.sale_price, 0),
+        price_count = c.price_count + CASE WHEN p.sale_price IS NULL THEN 0 ELSE %(sign)s END,
+        average_price = ROUND(
+            (c.price_sum + %(sign)s * COALESCE(p.sale_price, 0))
+            / NULLIF(c.price_count + CASE WHEN p.sale_price IS NULL THEN 0 ELSE %(sign)s END, 0), 2),
+        min_price = CASE
+            WHEN %(sign)s > 0 THEN LEAST(c.min_price, p.sale_price)
+            WHEN p.sale_price <= c.min_price THEN (
+                SELECT MIN(pp.sale_price) FROM product_cluster_membership m
+                JOIN products pp ON pp.product_id = m.product_id
+                WHERE m.cluster_id = c.cluster_id)
+            ELSE c.min_price END,
+        max_price = CASE
+            WHEN %(sign)s > 0 THEN GREATEST(c.max_price, p.sale_price)
+            WHEN p.sale_price >= c.max_price THEN (
+                SELECT MAX(pp.sale_price) FROM product_cluster_membership m
+                JOIN products pp ON pp.product_id = m.product_id
+                WHERE m.cluster_id = c.cluster_id)
+            ELSE c.max_price END,
+        centroid_visual = CASE
+            WHEN pe.embedding_visual IS NULL THEN c.centroid_visual
+            WHEN %(sign)s > 0 THEN COALESCE(c.centroid_visual + pe.embedding_visual, pe.embedding_visual)
+            WHEN c.total_competitors <= 1 THEN NULL
+            ELSE c.centroid_visual - pe.embedding_visual END,
+        priority_score = {cluster_priority_sql("GREATEST(c.total_competitors + %(sign)s, 0)")},
+        updated_at = NOW()
+    FROM products p
+    LEFT JOIN product_embeddings pe ON pe.product_id = p.product_id
+    WHERE c.cluster_id = %(cluster_id)s AND p.product_id = %(product_id)s
+"""
+
+
+def apply_delta(cur, cluster_id, product_id, sign):
+    cur.execute(_DELTA_SQL, {"cluster_id": cluster_id, "product_id": product_id, "sign": sign})
+
+
+def release_cluster(cur, cluster_id, leaving_product_id, destination_id=None):
+    """
+    Tras la salida de `leaving_product_id` de `cluster_id`:
+    - Cluster sin miembros: sus market_intelligence_logs (ON DELETE CASCADE) pasan a `destination_id`
+      (baja sin destino: quedan con cluster_id NULL) y el cluster se elimina.
+    - Si no, y el que salió era el representante, se elige el miembro de mayor confianza.
+      La prioridad depende del margen del representante.
+    Retorna: True si el cluster se eliminó.
+    """
+    cur.execute("""
+        SELECT NOT EXISTS (SELECT 1 FROM product_cluster_membership WHERE cluster_id = %s)
+    """, (cluster_id,))
+    if cur.fetchone()[0]:
+        cur.execute(
+            "UPDATE market_intelligence_logs SET cluster_id = %s WHERE cluster_id = %s",
+            (destination_id, cluster_id)
+        )
+        cur.execute("DELETE FROM unique_product_clusters WHERE cluster_id = %s", (cluster_id,))
+        return True
+
+    cur.execute("""
+        UPDATE unique_product_clusters c SET
+            representative_product_id = (
+                SELECT m.product_id FROM product_cluster_membership m
+                WHERE m.cluster_id = c.cluster_id
+                ORDER BY m.match_confidence DESC NULLS LAST, m.product_id
+                LIMIT 1
+            ),
+            updated_at = NOW()
+        WHERE c.cluster_id = %s AND c.representative_product_id = %s
+    """, (cluster_id, leaving_product_id))
+    if cur.rowcount:
+        refresh_cluster_priorities(cur, [cluster_id])
+    return False
+
+
+def create_cluster(cur, product_id, saturation_score=None):
+    """Nuevo cluster con `product_id` como representante (hereda su concept_id). Retorna: cluster_id"""
+    cur.execute("""
+        INSERT INTO unique_product_clusters
+            (representative_product_id, concept_id, total_competitors, price_sum, price_count, saturation_score,
+             created_at, updated_at)
+        SELECT %s, (SELECT concept_id FROM products WHERE product_id = %s), 0, 0, 0, %s, NOW(), NOW()
+        RETURNING cluster_id
+    """, (product_id, product_id, saturation_score))
+    cluster_id = cur.fetchone()[0]
+    assign_membership(cur, product_id, cluster_id, 1.0, 'REPRESENTATIVE')
+    return cluster_id
+
+
+def assign_membership(cur, product_id, cluster_id, confidence, method):
+    """
+    Alta o movimiento de un producto a `cluster_id`, con deltas en origen y destino
+    (un origen que queda vacío se elimina: ver `release_cluster`).
+    clustered_at se fija solo en el alta (latencia del pipeline: ver `pipeline_latency`).
+    Retorna: cluster_id anterior (None si no tenía).
+    """
+    cur.execute(
+        "SELECT cluster_id FROM product_cluster_membership WHERE product_id = %s FOR UPDATE",
+        (product_id,)
+    )
+    row = cur.fetchone()
+    previous = row[0] if row else None
+
+    cur.execute("""
+        INSERT INTO product_cluster_membership (product_id, cluster_id, match_confidence, match_method, clustered_at)
+        VALUES (%s, %s, %s, %s, NOW())
+        ON CONFLICT (product_id) DO UPDATE SET
+            cluster_id = EXCLUDED.cluster_id,
+            match_confidence = EXCLUDED.match_confidence,
+            match_method = EXCLUDED.match_method
+    """, (product_id, cluster_id, confidence, method))
+
+    if previous != cluster_id:
+        if previous is not None:
+            apply_delta(cur, previous, product_id, -1)
+            release_cluster(cur, previous, product_id, destination_id=cluster_id)
+        apply_delta(cur, cluster_id, product_id, +1)
+    return previous
+
+
+def remove_membership(cur, product_id):
+    """
+    Baja de un producto de su cluster (si era el último, el cluster se elimina).
+    Retorna: cluster_id del que salió (o None).
+    Llamar ANTES de borrar su embedding, para descontarlo del centroide.
+    """
+    cur.execute(
+        "DELETE FROM product_cluster_membership WHERE product_id = %s RETURNING cluster_id",
+        (product_id,)
+    )
+    row = cur.fetchone()
+    if row:
+        apply_delta(cur, row[0], product_id, -1)
+        release_cluster(cur, row[0], product_id)
+    return row[0] if row else None
+
+
+def merge_clusters(cur, survivor_id, absorbed_ids):
+    """
+    Mueve todos los miembros de `absorbed_ids` a `survivor_id` y elimina los absorbidos.
+    Lo que referencia a los absorbidos (market_intelligence_logs, ON DELETE CASCADE) se re-apunta
+    antes al sobreviviente: el historial de análisis de mercado no se pierde. El representante del
+    sobreviviente no cambia (sus miembros no se mueven).
+    Los agregados del sobreviviente se recalculan de una vez (no miembro a miembro).
+    Retorna: miembros movidos.
+    """
+    absorbed_ids = list(absorbed_ids)
+    cur.execute(
+        "UPDATE product_cluster_membership SET cluster_id = %s WHERE cluster_id = ANY(%s)",
+        (survivor_id, absorbed_ids)
+    )
+    moved = cur.rowcount
+    cur.execute(
+        "UPDATE market_intelligence_logs SET cluster_id = %s WHERE cluster_id = ANY(%s)",
+        (survivor_id, absorbed_ids)
+    )
+    cur.execute("DELETE FROM unique_product_clusters WHERE cluster_id = ANY(%s)", (absorbed_ids,))
+    reconcile(cur, cluster_ids=[survivor_id])
+    return moved
+
+
+_RECONCILE_SQL = """
+    WITH truth AS (
+        SELECT c.cluster_id,
+               COUNT(m.product_id) AS members,
+               COALESCE(SUM(p.sale_price), 0) AS price_sum,
+               COUNT(p.sale_price) AS price_count,
+               MIN(p.sale_price) AS min_price,
+               MAX(p.sale_price) AS max_price,
+               SUM(pe.embedding_visual) AS centroid
+        FROM unique_product_clusters c
+        LEFT JOIN product_cluster_membership m ON m.cluster_id = c.cluster_id
+        LEFT JOIN products p ON p.product_id = m.product_id
+        LEFT JOIN product_embeddings pe ON pe.product_id = m.product_id
+        {scope}
+        GROUP BY c.cluster_id
+    ),
+    drift AS (
+        SELECT t.*, c.total_competitors AS old_members, c.average_price AS old_avg
+        FROM truth t
+        JOIN unique_product_clusters c ON c.cluster_id = t.cluster_id
+        WHERE c.total_competitors IS DISTINCT FROM t.members
+        OR c.price_sum IS DISTINCT FROM t.price_sum
+        OR c.price_count IS DISTINCT FROM t.price_count
+        OR c.min_price IS DISTINCT FROM t.min_price
+        OR c.max_price IS DISTINCT FROM t.max_price
+        OR c.average_price IS DISTINCT FROM ROUND(t.price_sum / NULLIF(t.price_count, 0), 2)
+        OR (c.centroid_visual IS NULL) <> (t.centroid IS NULL)
+        {force}
+    ){update}
+    SELECT COUNT(*),
+           COALESCE(SUM(ABS(members - old_members)), 0),
+           COUNT(*) FILTER (WHERE old_members IS DISTINCT FROM members),
+           COUNT(*) FILTER (WHERE old_avg IS DISTINCT FROM ROUND(price_sum / NULLIF(price_count, 0), 2)),
+           COUNT(*) FILTER (WHERE members = 0)
+    FROM drift
+"""
+
+_RECONCILE_UPDATE = f""",
+    fixed AS (
+        UPDATE unique_product_clusters c SET
+            total_competitors = d.members,
+            price_sum = d.price_sum,
+            price_count = d.price_count,
+            min_price = d.min_price,
+            max_price = d.max_price,
+            average_price = ROUND(d.price_sum / NULLIF(d.price_count, 0), 2),
+            centroid_visual = d.centroid,
+            priority_score = {cluster_priority_sql("d.members")}
+        FROM drift d
+        WHERE c.cluster_id = d.cluster_id
+    )"""
+
+
+def reconcile(cur, fix=True, cluster_ids=None):
+    """
+    Recalcula los agregados de TODOS los clusters (o solo `cluster_ids`) desde las membresías (set-based).
+    Con `cluster_ids` se reescriben siempre (ej: tras un merge), haya drift o no.
+    Retorna: dict con el drift encontrado (antes de corregir).
+    """
+    # El centroide acumula ruido de punto flotante con +/-: solo cuenta como drift si falta o sobra
+    scope, force, params = "", "", None
+    if cluster_ids is not None:
+        scope, force, params = "WHERE c.cluster_id = ANY(%s)", "OR TRUE", (list(cluster_ids),)
+    cur.execute(_RECONCILE_SQL.format(scope=scope, force=force, update=_RECONCILE_UPDATE if fix else ""), params)
+    clusters, member_drift, count_mismatch, avg_mismatch, empty = cur.fetchone()
+    return {
+        "clusters_with_drift": clusters,
+        "member_count_mismatch": count_mismatch,
+        "total_member_drift": int(member_drift),
+        "average_price_mismatch": avg_mismatch,
+        "empty_clusters": empty,
+    }
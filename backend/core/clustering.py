@@ -0,0 +1,463 @@
+"""
+Lógica de Clustering Híbrido Compartida.
+
+Reglas de decisión (pesos por concepto + rescates), fast path exacto (SKU / imagen),
+union-find, grafo KNN por concepto, merge de clusters con centroides convergentes y
+re-evaluación de membresías dudosas cuando cambian los pesos de un concepto.
+La usan el daemon incremental (`clusterizer`) y el re-clustering completo (`recluster`),
+para que ambos decidan exactamente igual.
+"""
+
+import logging
+import os
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+from core.ai_utils import as_vector, text_scores
+from core.cluster_metrics import assign_membership, create_cluster, merge_clusters
+
+logger = logging.getLogger("clusterizer")
+
+# ─────── CONFIGURACIÓN DINÁMICA (CEREBRO POR CONCEPTO) ───────
+DEFAULT_CONFIG = {
+    "weight_visual": 0.6,
+    "weight_text": 0.4,
+    "threshold_visual_rescue": 0.92, # Hardcoded defaults baselines
+    "threshold_text_rescue": 0.95,
+    "threshold_hybrid": 0.68
+}
+
+CANDIDATES_PER_TARGET = 5
+TEXT_RESCUE_MIN_VISUAL = 0.6 # El rescate por texto exige además un mínimo de parecido visual
+
+def load_all_configs(cur):
+    """
+    Carga TODAS las personalidades de concept_weights en una sola query.
+    Retorna: dict {concepto: config}. Se consulta con config_for().
+    """
+    configs = {}
+    try:
+        cur.execute("SELECT concept, weight_visual, weight_text, threshold_hybrid FROM concept_weights")
+        for concept, w_visual, w_text, threshold in cur.fetchall():
+            config = dict(DEFAULT_CONFIG)
+            config["weight_visual"] = float(w_visual)
+            config["weight_text"] = float(w_text)
+            config["threshold_hybrid"] = float(threshold)
+            # Por seguridad, mantenemos los rescues visuales muy altos (0.92) siempre.
+            configs[concept] = config
+    except Exception as e:
+        logger.error(f"⚠️ Error cargando configs dinámicas: {e}. Usando defaults.")
+        cur.connection.rollback()
+    return configs
+
+def config_for(configs, concept_name):
+    """Personalidad del concepto. Si no existe para 'Perfume', usa la 'DEFAULT'."""
+    return configs.get(concept_name) or configs.get("DEFAULT") or dict(DEFAULT_CONFIG)
+
+# ─────── REGLAS DE DECISIÓN ───────
+
+def evaluate_pair(config, visual_score, text_score):
+    """
+    Reglas híbridas + rescates para un par.
+    Retorna: (is_match, method, final_score)
+    """
+    final_score = (config['weight_visual'] * visual_score) + (config['weight_text'] * text_score)
+
+    if final_score >= config['threshold_hybrid']:
+        return True, "HYBRID_MATCH", final_score
+    if visual_score >= config['threshold_visual_rescue']: # Muy parecidos visualmente
+        return True, "VISUAL_Rescue", max(final_score, visual_score) # Boost score
+    if text_score >= config['threshold_text_rescue'] and visual_score > TEXT_RESCUE_MIN_VISUAL:
+        return True, "TEXT_Rescue", max(final_score, text_score)
+    return False, "REJECTED", final_score
+
+def audit_reason(method, final_score):
+    """
+    REGLA DE AUDITORÍA INTELIGENTE:
+    Auto-Pilot: Score > 0.85 | Human-Review: 0.65 < Score < 0.85 (Zona Gris)
+    """
+    return "NEEDS_AUDIT" if final_score < 0.85 else method
+
+def stored_confidence(final_score):
+    """match_confidence es numeric(3,2): el score tal como lo guarda Postgres (redondeo half-up)."""
+    return Decimal(repr(float(final_score))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+class UnionFind:
+    """Componentes conexas de los matches del lote (independiente del orden de llegada)."""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+    def groups(self):
+        components = {}
+        for i in range(len(self.parent)):
+            components.setdefault(self.find(i), []).append(i)
+        return list(components.values())
+
+# ─────── FAST PATH EXACTO (SKU / IMAGEN) ───────
+# Mismo SKU de proveedor (normalizado) o mismos bytes de imagen que un miembro existente del
+# mismo concepto: se une directo a su cluster, sin KNN ni scoring.
+EXACT_SKU_MIN_LENGTH = 5 # SKUs más cortos ("001", "A1") se repiten entre proveedores
+
+# Debe coincidir con normalize_sku() y con el índice hash idx_products_sku_key
+SKU_KEY_SQL = "upper(regexp_replace({col}, '[^a-zA-Z0-9]', '', 'g'))"
+
+def normalize_sku(sku):
+    if not sku: return ""
+    return re.sub(r'[^a-zA-Z0-9]', '', str(sku)).upper()
+
+def exact_matches(cur, concept, targets):
+    """
+    Busca en los índices hash (SKU normalizado, image_digest) un miembro de un cluster existente
+    (no descartado) del mismo concepto para cada objetivo.
+    targets: lista de (product_id, sku, image_digest)
+    Retorna: dict {product_id: (cluster_id, method, anchor_pid)}; EXACT_SKU tiene prioridad.
+    Ante varios clusters posibles gana el más antiguo (menor cluster_id), igual en cada corrida.
+    """
+    matches = {}
+    by_sku = [(pid, normalize_sku(sku)) for pid, sku, _ in targets]
+    by_sku = [(pid, key) for pid, key in by_sku if len(key) >= EXACT_SKU_MIN_LENGTH]
+    if by_sku:
+        cur.execute(f"""
+            SELECT DISTINCT ON (t.product_id) t.product_id, m.cluster_id, p.product_id
+            FROM unnest(%s::bigint[], %s::text[]) AS t(product_id, sku_key)
+            JOIN products p ON {SKU_KEY_SQL.format(col='p.sku')} = t.sku_key
+            JOIN product_cluster_membership m ON m.product_id = p.product_id
+            JOIN unique_product_clusters c ON c.cluster_id = m.cluster_id
+            WHERE p.taxonomy_concept = %s
+            AND p.product_id <> t.product_id
+            AND NOT c.is_discarded
+            ORDER BY t.product_id, m.cluster_id, p.product_id
+        """, ([pid for pid, _ in by_sku], [key for _, key in by_sku], concept))
+        for pid, cluster_id, anchor in cur.fetchall():
+            matches[pid] = (cluster_id, "EXACT_SKU", anchor)
+
+    by_image = [(pid, digest) for pid, _, digest in targets if digest and pid not in matches]
+    if by_image:
+        cur.execute("""
+            SELECT DISTINCT ON (t.product_id) t.product_id, m.cluster_id, pe.product_id
+            FROM unnest(%s::bigint[], %s::text[]) AS t(product_id, digest)
+            JOIN product_embeddings pe ON pe.image_digest = t.digest
+            JOIN products p ON p.product_id = pe.product_id
+            JOIN product_cluster_membership m ON m.product_id = pe.product_id
+            JOIN unique_product_clusters c ON c.cluster_id = m.cluster_id
+            WHERE p.taxonomy_concept = %s
+            AND pe.product_id <> t.product_id
+            AND NOT c.is_discarded
+            ORDER BY t.product_id, m.cluster_id, pe.product_id
+        """, ([pid for pid, _ in by_image], [digest for _, digest in by_image], concept))
+        for pid, cluster_id, anchor in cur.fetchall():
+            matches[pid] = (cluster_id, "EXACT_IMAGE", anchor)
+    return matches
+
+# ─────── GRAFO KNN POR CONCEPTO ───────
+
+def knn_pairs(vectors, k, block=1024):
+    """
+    Pares (i, j, similitud) con i < j donde j está en el top-k de i o viceversa.
+    `vectors` normalizados [N, D]; la matriz N x N se calcula por bloques de filas.
+    """
+    n = len(vectors)
+    k = min(k, n - 1)
+    if k <= 0:
+        return []
+    pairs = {}
+    for start in range(0, n, block):
+        sims = vectors[start:start + block] @ vectors.T
+        rows = np.arange(len(sims))
+        sims[rows, rows + start] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        for r, neighbours in enumerate(top):
+            i = start + r
+            for j in neighbours:
+                key = (min(i, int(j)), max(i, int(j)))
+                pairs[key] = float(sims[r, j])
+    return [(i, j, sim) for (i, j), sim in pairs.items()]
+
+def cluster_graph(config, titles, text_vecs, vectors, k=CANDIDATES_PER_TARGET, must_link=()):
+    """
+    Clustering completo de un concepto: grafo KNN -> reglas híbridas -> union-find.
+    must_link: pares (i, j) que deben quedar juntos (merges humanos).
+    Retorna: (componentes [[i, ...]], best_edge [(final_score, method) | None], degree [int], n_matches)
+    """
+    n = len(titles)
+    uf = UnionFind(n)
+    best_edge = [None] * n
+    degree = [0] * n
+
+    by_source = {}
+    for i, j, sim in knn_pairs(vectors, k):
+        by_source.setdefault(i, []).append((j, sim))
+
+    n_matches = 0
+    for i, neighbours in by_source.items():
+        scores_text = text_scores(titles[i], text_vecs[i], [titles[j] for j, _ in neighbours], [text_vecs[j] for j, _ in neighbours])
+        for (j, sim), text_score in zip(neighbours, scores_text):
+            is_match, method, final_score = evaluate_pair(config, max(0.0, sim), float(text_score))
+            if not is_match:
+                continue
+            n_matches += 1
+            uf.union(i, j)
+            degree[i] += 1
+            degree[j] += 1
+            for node in (i, j):
+                if best_edge[node] is None or final_score > best_edge[node][0]:
+                    best_edge[node] = (final_score, method)
+
+    for i, j in must_link:
+        uf.union(i, j)
+        for node in (i, j):
+            if best_edge[node] is None:
+                best_edge[node] = (1.0, "HUMAN_MERGE")
+
+    return uf.groups(), best_edge, degree, n_matches
+
+# ─────── MERGE DE CENTROIDES CONVERGENTES ───────
+# Dos clusters del mismo concepto cuyos centroides casi coinciden son el mismo producto que
+# el clusterizer partió (típicamente porque el primer miembro llegó antes que su puente).
+CENTROID_MERGE_THRESHOLD = float(os.getenv("CLUSTER_MERGE_THRESHOLD", "0.95"))
+CENTROID_MERGE_NEIGHBOURS = 5
+
+def converged_cluster_pairs(cur, threshold=CENTROID_MERGE_THRESHOLD, k=CENTROID_MERGE_NEIGHBOURS, shard=0, n_shards=1):
+    """
+    Pares de clusters (mismo concepto, no descartados) con coseno de centroides >= threshold.
+    Usa el HNSW idx_cluster_centroid: k vecinos por cluster. Solo conceptos del shard.
+    Retorna: lista de (cluster_a, cluster_b, similitud, concepto)
+    """
+    cur.execute("SET LOCAL hnsw.ef_search = 100")
+    cur.execute("""
+        SELECT c.cluster_id, n.cluster_id, n.similarity, rp.taxonomy_concept
+        FROM unique_product_clusters c
+        JOIN products rp ON rp.product_id = c.representative_product_id
+        CROSS JOIN LATERAL (
+            SELECT c2.cluster_id, 1 - (c2.centroid_visual <=> c.centroid_visual) AS similarity
+            FROM unique_product_clusters c2
+            WHERE c2.cluster_id <> c.cluster_id
+            AND c2.centroid_visual IS NOT NULL
+            ORDER BY c2.centroid_visual <=> c.centroid_visual
+            LIMIT %s
+        ) n
+        JOIN unique_product_clusters c2 ON c2.cluster_id = n.cluster_id
+        JOIN products rp2 ON rp2.product_id = c2.representative_product_id
+        WHERE c.centroid_visual IS NOT NULL
+        AND NOT c.is_discarded AND NOT c2.is_discarded
+        AND rp.taxonomy_concept = rp2.taxonomy_concept
+        AND n.similarity >= %s
+        AND (hashtext(rp.taxonomy_concept) & 2147483647) %% %s = %s
+    """, (k, threshold, n_shards, shard))
+    return cur.fetchall()
+
+def merge_converged_clusters(cur, threshold=CENTROID_MERGE_THRESHOLD, k=CENTROID_MERGE_NEIGHBOURS, dry_run=False,
+                             shard=0, n_shards=1):
+    """
+    Job periódico: agrupa con union-find los pares convergentes y fusiona cada grupo en un
+    sobreviviente (mayor analysis_level, luego más miembros, luego el más antiguo).
+    Solo toca los conceptos del shard, y antes de fusionar toma el lock de cada uno en orden
+    estable (por nombre, como el ciclo de clustering): ningún otro proceso asigna miembros a
+    un cluster que se está moviendo o borrando.
+    Retorna: dict con pares, grupos, clusters absorbidos, miembros movidos, huérfanos antes/después
+    y los conceptos fusionados (para invalidar el índice en memoria).
+    """
+    cur.execute("SELECT COUNT(*) FROM unique_product_clusters WHERE total_competitors = 1")
+    orphans_before = cur.fetchone()[0]
+    stats = {"pairs": 0, "groups": 0, "absorbed": 0, "moved": 0,
+             "orphans_before": orphans_before, "orphans_after": orphans_before, "concepts": []}
+
+    pairs = converged_cluster_pairs(cur, threshold, k, shard, n_shards)
+    locked = sorted({concept for *_, concept in pairs})
+    if not dry_run and locked:
+        waited = [concept for concept in locked if not lock_concept(cur, concept)]
+        if waited:
+            # Otro proceso cambió esos conceptos antes del lock: pares frescos, solo de los conceptos bloqueados
+            owned = set(locked)
+            pairs = [p for p in converged_cluster_pairs(cur, threshold, k, shard, n_shards) if p[3] in owned]
+    stats["pairs"] = len(pairs)
+    ids = sorted({cid for a, b, _, _ in pairs for cid in (a, b)})
+    if not ids:
+        return stats
+
+    positions = {cid: i for i, cid in enumerate(ids)}
+    concept_of = {}
+    uf = UnionFind(len(ids))
+    for a, b, _, concept in pairs:
+        uf.union(positions[a], positions[b])
+        concept_of[a] = concept_of[b] = concept
+
+    cur.execute(
+        "SELECT cluster_id, analysis_level, total_competitors FROM unique_product_clusters WHERE cluster_id = ANY(%s)",
+        (ids,)
+    )
+    rank = {cid: (level or 0, members or 0, -cid) for cid, level, members in cur.fetchall()}
+
+    orphans_absorbed = 0
+    merged = set()
+    for component in uf.groups():
+        if len(component) < 2:
+            continue
+        group = [ids[i] for i in component]
+        survivor = max(group, key=rank.get)
+        absorbed = [cid for cid in group if cid != survivor]
+        stats["groups"] += 1
+        stats["absorbed"] += len(absorbed)
+        orphans_absorbed += sum(1 for cid in group if rank[cid][1] == 1)
+        merged.add(concept_of[survivor])
+        if not dry_run:
+            stats["moved"] += merge_clusters(cur, survivor, absorbed)
+    stats["concepts"] = sorted(merged)
+
+    if dry_run:
+        # Cada grupo deja un solo cluster, con más de un miembro
+        stats["orphans_after"] = orphans_before - orphans_absorbed
+    else:
+        cur.execute("SELECT COUNT(*) FROM unique_product_clusters WHERE total_competitors = 1")
+        stats["orphans_after"] = cur.fetchone()[0]
+    return stats
+
+# ─────── LOCK POR CONCEPTO ───────
+
+def lock_concept(cur, concept):
+    """
+    pg_advisory_xact_lock por concepto (se libera con el commit): dos procesos nunca deciden
+    sobre el mismo concepto a la vez (clusterizer en paralelo, re-evaluación).
+    Retorna: False si hubo que esperar a otro proceso (su trabajo ya está confirmado).
+    """
+    cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('clusterizer'), hashtext(%s))", (concept,))
+    if cur.fetchone()[0]:
+        return True
+    logger.info(f"   🔒 Concepto '{concept}' bloqueado por otro proceso. Esperando...")
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('clusterizer'), hashtext(%s))", (concept,))
+    return False
+
+# ─────── RE-EVALUACIÓN TRAS CAMBIO DE PESOS ───────
+# Cuando ai_trainer cambia los pesos / threshold_hybrid de un concepto, solo las membresías
+# dudosas de ESE concepto se vuelven a puntuar (costo proporcional al concepto, no un recluster).
+# Marca de agua: concept_weights.reevaluated_at = último last_updated ya re-evaluado.
+REEVAL_BORDERLINE = float(os.getenv("CLUSTER_REEVAL_BORDERLINE", "0.90"))
+# Decisiones que no dependen de los pesos: nunca se re-evalúan
+REEVAL_PROTECTED_METHODS = ["REPRESENTATIVE", "HUMAN_MERGE", "EXACT_SKU", "EXACT_IMAGE"]
+
+def stale_concepts(cur, shard=0, n_shards=1):
+    """
+    Conceptos cuyos pesos cambiaron desde la última re-evaluación (solo los del shard).
+    Retorna: lista de (concepto, last_updated)
+    """
+    cur.execute("""
+        SELECT concept, last_updated FROM concept_weights
+        WHERE last_updated > COALESCE(reevaluated_at, '-infinity')
+        AND (hashtext(concept) & 2147483647) %% %s = %s
+        ORDER BY concept
+    """, (n_shards, shard))
+    return cur.fetchall()
+
+def mark_reevaluated(cur, concept, watermark):
+    cur.execute("UPDATE concept_weights SET reevaluated_at = %s WHERE concept = %s", (watermark, concept))
+
+def reevaluate_concept(cur, index, concept, config, borderline=REEVAL_BORDERLINE, dry_run=False):
+    """
+    Re-puntúa con `config` las membresías NEEDS_AUDIT o con confianza < `borderline` del concepto,
+    desde los embeddings guardados (vecinos visuales dentro de su cluster, en una sola query).
+    - Sigue habiendo match con su cluster: se confirma (método/confianza actualizados).
+    - Ya no: se mueve al mejor cluster del concepto que sí matchee (índice en memoria)
+      o queda como cluster propio.
+    Retorna: dict con evaluados, confirmados, reetiquetados, movidos y separados.
+    """
+    cur.execute("""
+        SELECT m.product_id, m.cluster_id, m.match_method, m.match_confidence, p.title, p.url_image_s3,
+               pe.embedding_visual, pe.embedding_text,
+               n.title, n.embedding_text, n.distance
+        FROM product_cluster_membership m
+        JOIN products p ON p.product_id = m.product_id
+        JOIN product_embeddings pe ON pe.product_id = m.product_id
+        JOIN unique_product_clusters c ON c.cluster_id = m.cluster_id
+        LEFT JOIN LATERAL (
+            SELECT p2.title, pe2.embedding_text, pe2.embedding_visual <=> pe.embedding_visual AS distance
+            FROM product_cluster_membership m2
+            JOIN products p2 ON p2.product_id = m2.product_id
+            JOIN product_embeddings pe2 ON pe2.product_id = m2.product_id
+            WHERE m2.cluster_id = m.cluster_id
+            AND m2.product_id <> m.product_id
+            AND pe2.embedding_visual IS NOT NULL
+            ORDER BY distance
+            LIMIT %s
+        ) n ON TRUE
+        WHERE p.taxonomy_concept = %s
+        AND pe.embedding_visual IS NOT NULL
+        AND m.product_id <> c.representative_product_id
+        AND m.match_method <> ALL(%s)
+        AND (m.match_method = 'NEEDS_AUDIT' OR m.match_confidence < %s)
+        ORDER BY m.product_id, n.distance
+    """, (CANDIDATES_PER_TARGET, concept, REEVAL_PROTECTED_METHODS, borderline))
+
+    members = {}
+    for pid, cluster_id, method, confidence, title, image, visual, text, n_title, n_text, distance in cur.fetchall():
+        entry = members.setdefault(pid, {
+            "cluster_id": cluster_id, "method": method, "confidence": confidence, "title": title,
+            "image": image, "visual": visual, "text": text, "neighbours": [],
+        })
+        if distance is not None:
+            entry["neighbours"].append((n_title, n_text, float(distance)))
+
+    stats = {"evaluated": len(members), "confirmed": 0, "relabelled": 0, "moved": 0, "split": 0}
+
+    def best_match(entry, candidates):
+        """candidates: [(título, text_vec, distancia, payload)] -> (final_score, method, payload) del mejor match"""
+        scores_text = text_scores(entry["title"], entry["text"], [c[0] for c in candidates], [c[1] for c in candidates])
+        best = None
+        for (_, _, distance, payload), text_score in zip(candidates, scores_text):
+            is_match, method, final_score = evaluate_pair(config, max(0.0, 1.0 - distance), float(text_score))
+            if is_match and (best is None or final_score > best[0]):
+                best = (final_score, method, payload)
+        return best
+
+    for pid, entry in members.items():
+        best = best_match(entry, [(t, v, d, None) for t, v, d in entry["neighbours"]]) if entry["neighbours"] else None
+        if best:
+            final_score, method, _ = best
+            new_method = audit_reason(method, final_score)
+            stats["confirmed"] += 1
+            # Comparar a la precisión guardada (2 decimales): si no, casi todo contaría como cambio
+            if (new_method, stored_confidence(final_score)) != (entry["method"], entry["confidence"]):
+                stats["relabelled"] += 1
+                if not dry_run:
+                    cur.execute(
+                        "UPDATE product_cluster_membership SET match_method = %s, match_confidence = %s WHERE product_id = %s",
+                        (new_method, final_score, pid)
+                    )
+            continue
+
+        # Sin match con su cluster: buscar otro del concepto
+        vector = as_vector(entry["visual"])
+        found = index.search(cur, concept, vector, k=CANDIDATES_PER_TARGET, exclude_id=pid)
+        others = [(c_title, c_text, dist, c_pid) for c_pid, c_title, _, c_cluster, dist, c_text in found
+                  if c_cluster != entry["cluster_id"]]
+        best = best_match(entry, others) if others else None
+        target = None
+        if best:
+            cur.execute("SELECT cluster_id FROM product_cluster_membership WHERE product_id = %s", (best[2],))
+            row = cur.fetchone()
+            target = row[0] if row and row[0] != entry["cluster_id"] else None
+
+        if target:
+            stats["moved"] += 1
+            if not dry_run:
+                assign_membership(cur, pid, target, best[0], audit_reason(best[1], best[0]))
+        else:
+            stats["split"] += 1
+            if not dry_run:
+                target = create_cluster(cur, pid, "LOW_DATA")
+        if not dry_run:
+            index.add(concept, pid, target, entry["title"], entry["image"], vector, entry["text"])
+    return stats
@@ -0,0 +1,111 @@
+"""
+Diccionario Canónico de Conceptos.
+
+El LLM devuelve concept_name en texto libre: el mismo tipo de producto llega como "Silla Gamer",
+"Silla gamer ergonómica" o "Silla Gaming", y cada variante abre su propio bucket
+taxonomy_concept en el clusterizer (menos candidatos -> menos recall). Antes de guardar una
+clasificación, resolve():
+1. Exacto: nombre normalizado (core.taxonomy_cache.normalize_title) == name_key o alias ya visto.
+2. Semántico: vecino MiniLM más cercano en `concepts` (HNSW idx_concepts_embedding); si la
+   similitud coseno >= CONCEPT_MATCH_SIMILARITY se usa ese concepto y la variante queda como alias.
+3. Si no: concepto nuevo, con ese nombre como canónico.
+Productos y clusters guardan concept_id (clave entera para agrupar) y taxonomy_concept = nombre canónico.
+"""
+
+import json
+import logging
+import os
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Q
+
+from core.models import Concept
+from core.taxonomy_cache import normalize_title
+
+logger = logging.getLogger(__name__)
+
+CONCEPT_MATCH_SIMILARITY = float(os.getenv("CONCEPT_MATCH_SIMILARITY", "0.88"))
+
+# Etiquetas de relleno del classifier: no son conceptos
+NOT_A_CONCEPT = {"unknown", "n a", "none"}
+
+
+def _encode(text):
+    from core.ai_utils import encode_batch
+    return encode_batch([text], normalize=True)[0]
+
+
+class ConceptDictionary:
+    """Resolución nombre libre -> Concept. `encoder`: callable texto -> vector MiniLM normalizado."""
+
+    def __init__(self, similarity=CONCEPT_MATCH_SIMILARITY, encoder=None):
+        self.similarity = similarity
+        self.encoder = encoder or _encode
+        self.memo = {} # name_key -> Concept (los nombres se repiten mucho dentro de un lote)
+        self.counts = Counter()
+
+    def resolve(self, name, industry=None):
+        """
+        Retorna: (Concept | None, método 'exact' | 'semantic' | 'new').
+        None si el nombre no es un concepto (vacío o UNKNOWN).
+        """
+        key = normalize_title(name)[:255]
+        if not key or key in NOT_A_CONCEPT:
+            return None, None
+        if key in self.memo:
+            self.counts["exact"] += 1
+            return self.memo[key], "exact"
+
+        concept = Concept.objects.filter(Q(name_key=key) | Q(aliases__contains=[key])).first()
+        method = "exact"
+        if concept is None:
+            vector = self._embed(key)
+            concept = self._nearest(vector)
+            if concept is not None:
+                method = "semantic"
+                self._add_alias(concept, key)
+            else:
+                method = "new"
+                concept, created = Concept.objects.get_or_create(
+                    name_key=key,
+                    defaults={"name": str(name).strip()[:255], "industry": industry,
+                              "embedding": list(vector) if vector is not None else None},
+                )
+                if created:
+                    logger.info(f"🆕 Concepto nuevo en el diccionario: [{concept.name}]")
+
+        self.memo[key] = concept
+        self.counts[method] += 1
+        return concept, method
+
+    def _embed(self, key):
+        try:
+            return self.encoder(key)
+        except Exception as e:
+            # Sin MiniLM: solo resolución exacta (cada variante nueva crea su concepto)
+            logger.warning(f"⚠️ Embedding de concepto no disponible ({e}). Resolución solo exacta.")
+            return None
+
+    def _nearest(self, vector):
+        if vector is None or self.similarity >= 1.0:
+            return None
+        with connection.cursor() as cur:
+            cur.execute("""
+                SELECT id, 1 - (embedding <=> %s::vector) AS similarity
+                FROM concepts
+                WHERE embedding IS NOT NULL
+                ORDER BY embedding <=> %s::vector
+                LIMIT 1
+            """, (list(vector), list(vector)))
+            row = cur.fetchone()
+        if row and row[1] >= self.similarity:
+            return Concept.objects.get(id=row[0])
+        return None
+
+    def _add_alias(self, concept, key):
+        with connection.cursor() as cur:
+            cur.execute("""
+                UPDATE concepts SET aliases = aliases || %s::jsonb
+                WHERE id = %s AND NOT aliases @> %s::jsonb
+            """, (json.dumps([key]), concept.id, json.dumps([key])))
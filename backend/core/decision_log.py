@@ -0,0 +1,195 @@
+"""
+Escritor Asíncrono de ClusterDecisionLog.
+
+El clusterizer genera una decisión por par evaluado; escribirlas en el hilo principal
+frenaba el ciclo y la tabla crecía más rápido que cualquier otra:
+- Muestreo: todo MATCH (incluye los NEEDS_AUDIT) se guarda; los REJECT solo en una
+  fracción DECISION_LOG_SAMPLE_REJECT, determinista por par (el mismo par siempre cae
+  del mismo lado). Cada fila guarda su `sample_rate` para poder re-ponderar conteos.
+- Sin copias: títulos e imágenes se resuelven por product_id / candidate_id al leer.
+- Asíncrono: cola acotada + hilo de fondo que hace bulk_create cada `batch_size` filas o
+  `flush_interval` segundos. Si la cola se llena se descartan filas (se cuentan), nunca
+  se bloquea al clusterizer.
+- Particionado: cluster_decision_logs está particionada por mes sobre "timestamp";
+  maintain_partitions() crea las particiones próximas y elimina las que superan la
+  retención (DROP de la partición completa, sin DELETE masivo).
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from django.db import connection
+
+from core.models import ClusterDecisionLog
+
+logger = logging.getLogger("clusterizer")
+
+DECISION_LOG_SAMPLE_REJECT = float(os.getenv("DECISION_LOG_SAMPLE_REJECT", "0.1"))
+DECISION_LOG_RETENTION_DAYS = int(os.getenv("DECISION_LOG_RETENTION_DAYS", "90"))
+
+PARTITION_PREFIX = "cluster_decision_logs_p"
+DEFAULT_PARTITION = "cluster_decision_logs_default"
+
+_STOP = object()
+
+
+def sample_rate(decision, sample_reject=DECISION_LOG_SAMPLE_REJECT):
+    """Fracción de decisiones de este tipo que se persisten."""
+    return 1.0 if decision == "MATCH" else sample_reject
+
+
+def is_sampled(pid_a, pid_b, rate):
+    """Muestreo determinista por par (independiente del orden a/b)."""
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0:
+        return False
+    key = f"{min(pid_a, pid_b)}:{max(pid_a, pid_b)}".encode()
+    return zlib.crc32(key) % 10_000 < rate * 10_000
+
+
+class DecisionLogWriter:
+    """Cola + hilo de fondo. Uso: writer.log(...) en el ciclo; writer.close() al salir."""
+
+    def __init__(self, sample_reject=DECISION_LOG_SAMPLE_REJECT, batch_size=1000, flush_interval=2.0, max_queue=50_000):
+        self.sample_reject = sample_reject
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.counts = Counter()
+        self._thread = threading.Thread(target=self._run, name="decision-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, pid_a, pid_b, visual_score, text_score, final_score, decision, method, active_weights):
+        rate = sample_rate(decision, self.sample_reject)
+        if not is_sampled(pid_a, pid_b, rate):
+            self.counts["sampled_out"] += 1
+            return
+        entry = ClusterDecisionLog(
+            product_id=pid_a,
+            candidate_id=pid_b,
+            visual_score=visual_score,
+            text_score=text_score,
+            final_score=final_score,
+            decision=decision,
+            match_method=method,
+            active_weights=active_weights,
+            sample_rate=rate,
+        )
+        try:
+            self.queue.put_nowait(entry)
+            self.counts["queued"] += 1
+        except queue.Full:
+            self.counts["dropped"] += 1
+
+    def flush(self, timeout=30):
+        """Bloquea hasta que todo lo encolado hasta ahora esté escrito."""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=30):
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return dict(self.counts, pending=self.queue.qsize())
+
+    def _run(self):
+        pending = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, ClusterDecisionLog):
+                pending.append(item)
+                if len(pending) < self.batch_size:
+                    continue
+
+            self._write(pending)
+            pending = []
+            deadline = time.monotonic() + self.flush_interval
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                connection.close()
+                return
+
+    def _write(self, entries):
+        if not entries:
+            return
+        try:
+            ClusterDecisionLog.objects.bulk_create(entries, batch_size=self.batch_size)
+            self.counts["written"] += len(entries)
+        except Exception as e:
+            self.counts["failed"] += len(entries)
+            logger.error(f"Error saving audit logs to DB: {e}")
+            # Conexión del hilo posiblemente rota: se reabre en la próxima escritura
+            connection.close()
+
+
+# ─────── PARTICIONES Y RETENCIÓN ───────
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def maintain_partitions(cur, retention_days=DECISION_LOG_RETENTION_DAYS, months_ahead=1, dry_run=False):
+    """
+    Crea las particiones mensuales del mes actual + `months_ahead` y elimina las que
+    terminan antes de now - retention_days.
+    Retorna: dict {"created": [...], "dropped": [...], "purged_default": n}
+    """
+    today = datetime.now(timezone.utc).date()
+    created, dropped = [], []
+
+    month = _month_start(today)
+    for _ in range(months_ahead + 1):
+        name = f"{PARTITION_PREFIX}{month:%Y%m}"
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            if not dry_run:
+                cur.execute(
+                    f"CREATE TABLE {name} PARTITION OF cluster_decision_logs FOR VALUES FROM (%s) TO (%s)",
+                    (month, _next_month(month))
+                )
+            created.append(name)
+        month = _next_month(month)
+
+    cutoff = today - timedelta(days=retention_days)
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        WHERE parent.relname = 'cluster_decision_logs' AND c.relname LIKE %s
+    """, (PARTITION_PREFIX + "%",))
+    for (name,) in cur.fetchall():
+        suffix = name[len(PARTITION_PREFIX):]
+        if not suffix.isdigit():
+            continue
+        # La partición YYYYMM cubre hasta el inicio del mes siguiente
+        if _next_month(date(int(suffix[:4]), int(suffix[4:]), 1)) <= cutoff:
+            if not dry_run:
+                cur.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+
+    # Filas que cayeron en la partición DEFAULT (fuera de todo rango mensual)
+    purged = 0
+    if not dry_run:
+        cur.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE \"timestamp\" < %s", (cutoff,))
+        purged = cur.rowcount
+
+    return {"created": created, "dropped": sorted(dropped), "purged_default": purged}
@@ -0,0 +1,287 @@
+"""
+Servicio de Embeddings Compartido (SigLIP).
+
+Un único proceso de larga vida mantiene SigLIP so400m en memoria (GPU si existe) y atiende
+por IPC (multiprocessing.connection sobre TCP) a todos los consumidores de `core`:
+vectorizer, market_agent, GoldMine (búsqueda visual), etc.
+
+- API: embeddings de imagen (bytes crudos) y de texto (torre de texto SigLIP).
+- Micro-batching: las peticiones concurrentes de distintos clientes que llegan dentro de
+  una ventana de pocos ms se agrupan en un solo forward pass.
+- Cada respuesta lleva `model_version`, que se persiste junto a cada vector para no
+  comparar nunca vectores de espacios incompatibles.
+- El IPC usa pickle: servidor y clientes se autentican con EMBEDDING_SERVICE_KEY (obligatoria,
+  sin valor por defecto). Sin clave el servidor no arranca y el cliente no conecta.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+logger = logging.getLogger("embedding_service")
+
+MODEL_NAME = "google/siglip-so400m-patch14-384" # 384px - 1152 dims
+MODEL_VERSION = os.getenv("EMBEDDING_MODEL_VERSION", MODEL_NAME)
+EMBEDDING_DIM = 1152
+
+SERVICE_HOST = os.getenv("EMBEDDING_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("EMBEDDING_SERVICE_PORT", "6010"))
+SERVICE_AUTHKEY = os.getenv("EMBEDDING_SERVICE_KEY", "").encode() or None
+
+MAX_IMAGE_BATCH = int(os.getenv("EMBEDDING_MAX_IMAGE_BATCH", "50"))
+MAX_TEXT_BATCH = int(os.getenv("EMBEDDING_MAX_TEXT_BATCH", "128"))
+MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingServiceError(Exception):
+    """El servicio no está disponible o respondió con error."""
+
+
+def require_authkey():
+    """Retorna la clave del IPC; sin EMBEDDING_SERVICE_KEY no se sirve ni se conecta (pickle sin autenticar)."""
+    if not SERVICE_AUTHKEY:
+        raise EmbeddingServiceError("EMBEDDING_SERVICE_KEY no definida: el IPC del embedding service exige clave")
+    return SERVICE_AUTHKEY
+
+
+# ─────── SERVIDOR ───────
+
+class MicroBatcher:
+    """
+    Cola de items individuales -> lotes.
+    Toma el primer item (bloqueante) y espera como máximo `max_wait_ms` para completar
+    `max_batch` items; luego ejecuta `forward_fn(items)` una sola vez y resuelve cada Future.
+    """
+
+    def __init__(self, name, forward_fn, max_batch, max_wait_ms):
+        self.name = name
+        self.forward_fn = forward_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.jobs = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True).start()
+
+    def submit(self, item):
+        future = Future()
+        self.jobs.put((item, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self.jobs.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                vectors = self.forward_fn(items)
+                for (_, future), vec in zip(batch, vectors):
+                    future.set_result(vec)
+            except Exception as e:
+                logger.error(f"❌ Error en forward ({self.name}, lote de {len(batch)}): {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+            self.batches += 1
+            self.items += len(batch)
+
+
+class EmbeddingServer:
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        import torch
+        from transformers import AutoProcessor, SiglipModel
+        from core.image_preprocessing import ImagePreprocessor
+
+        self.authkey = require_authkey() # Antes de cargar el modelo: sin clave no se arranca
+        self.torch = torch
+        self.address = (host, port)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        logger.info(f"🧠 Cargando modelo SigLIP ({MODEL_NAME}) en {self.device.upper()}...")
+        self.model = SiglipModel.from_pretrained(MODEL_NAME).to(self.device).eval()
+        self.processor = AutoProcessor.from_pretrained(MODEL_NAME)
+        self.preprocessor = ImagePreprocessor.from_processor(
+            self.processor, max_batch=MAX_IMAGE_BATCH, pin_memory=(self.device == "cuda")
+        )
+        logger.info(f"✅ SigLIP listo. Versión de vectores: {MODEL_VERSION}")
+
+        self.image_batcher = MicroBatcher("image", self._forward_images, MAX_IMAGE_BATCH, MAX_WAIT_MS)
+        self.text_batcher = MicroBatcher("text", self._forward_texts, MAX_TEXT_BATCH, MAX_WAIT_MS)
+
+    # --- Forward passes (solo los llaman los hilos de los batchers) ---
+
+    def _normalize(self, features):
+        features = features / features.norm(p=2, dim=-1, keepdim=True)
+        return features.float().cpu().numpy()
+
+    def _forward_images(self, images):
+        pixel_values = self.preprocessor.preprocess_batch(images).to(self.device, non_blocking=True)
+        with self.torch.no_grad():
+            features = self.model.get_image_features(pixel_values=pixel_values)
+        return self._normalize(features)
+
+    def _forward_texts(self, texts):
+        # SigLIP fue entrenado con padding fijo a 64 tokens
+        inputs = self.processor(text=texts, padding="max_length", truncation=True, return_tensors="pt").to(self.device)
+        with self.torch.no_grad():
+            features = self.model.get_text_features(**inputs)
+        return self._normalize(features)
+
+    # --- API ---
+
+    def embed_images(self, blobs):
+        # Decodificación (draft mode) en el pool, fuera del hilo de inferencia
+        images = self.preprocessor.load_batch(blobs)
+        futures = [self.image_batcher.submit(img) if img is not None else None for img in images]
+        return self._collect(futures)
+
+    def embed_texts(self, texts):
+        futures = [self.text_batcher.submit(str(t)) for t in texts]
+        return self._collect(futures)
+
+    def _collect(self, futures):
+        vectors = np.zeros((len(futures), EMBEDDING_DIM), dtype=np.float32)
+        valid = []
+        for i, future in enumerate(futures):
+            if future is None:
+                valid.append(False)
+                continue
+            vectors[i] = future.result()
+            valid.append(True)
+        return {"vectors": vectors, "valid": valid, "model_version": MODEL_VERSION}
+
+    def handle_request(self, op, payload):
+        if op == "images":
+            return self.embed_images(payload)
+        if op == "texts":
+            return self.embed_texts(payload)
+        if op == "info":
+            return {
+                "model_version": MODEL_VERSION,
+                "device": self.device,
+                "dim": EMBEDDING_DIM,
+                "batches": {
+                    "image": (self.image_batcher.batches, self.image_batcher.items),
+                    "text": (self.text_batcher.batches, self.text_batcher.items),
+                },
+            }
+        raise ValueError(f"Operación desconocida: {op}")
+
+    def _serve_connection(self, conn):
+        try:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except EOFError:
+                    break
+                try:
+                    conn.send(("ok", self.handle_request(op, payload)))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logger.info(f"🚀 Embedding service escuchando en {self.address[0]}:{self.address[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning(f"⚠️ Conexión rechazada: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+# ─────── CLIENTE ───────
+
+class EmbeddingClient:
+    """
+    Cliente IPC. Una conexión por hilo (threading.local) para que las peticiones concurrentes
+    de un mismo proceso (ej: runserver multi-hilo) lleguen en paralelo al micro-batcher.
+    """
+
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT, retries=3):
+        self.address = (host, port)
+        self.retries = retries
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=require_authkey())
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local.conn = None
+
+    def _call(self, op, payload=None):
+        last_error = None
+        for attempt in range(self.retries):
+            try:
+                conn = self._connection()
+                conn.send((op, payload))
+                status, result = conn.recv()
+                if status != "ok":
+                    raise EmbeddingServiceError(result)
+                return result
+            except (OSError, EOFError, ConnectionError) as e:
+                last_error = e
+                self._reset()
+                time.sleep(0.5 * (attempt + 1))
+        raise EmbeddingServiceError(f"Embedding service inaccesible en {self.address}: {last_error}")
+
+    def embed_images(self, blobs):
+        """
+        blobs: lista de bytes (JPEG/PNG/...).
+        Retorna: (lista de np.ndarray[1152] o None si la imagen no se pudo decodificar, model_version)
+        """
+        if not blobs:
+            return [], MODEL_VERSION
+        result = self._call("images", list(blobs))
+        vectors = [vec if ok else None for vec, ok in zip(result["vectors"], result["valid"])]
+        return vectors, result["model_version"]
+
+    def embed_texts(self, texts):
+        """Retorna: (np.ndarray [N, 1152] normalizado, model_version)"""
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32), MODEL_VERSION
+        result = self._call("texts", list(texts))
+        return result["vectors"], result["model_version"]
+
+    def info(self):
+        return self._call("info")
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Singleton del cliente por proceso."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = EmbeddingClient()
+    return _client
@@ -0,0 +1,107 @@
+"""
+Preprocesamiento de Imágenes para SigLIP (CPU).
+
+Reemplaza el camino `Image.open(...).convert("RGB")` + `AutoProcessor` en el hilo principal:
+1. Decodificación en 'draft mode': los JPEG se decodifican directamente a una escala
+   cercana (>=) al tamaño objetivo de 384px usando el escalado DCT de libjpeg,
+   en lugar de decodificar la resolución nativa completa (ej: 1500x1500).
+2. Resize + Rescale + Normalize en un pool de workers, escribiendo directo en un
+   buffer float32 pre-asignado [N, 3, H, W] (sin tensores intermedios por imagen).
+"""
+
+import os
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Valores por defecto de SigLIP (google/siglip-so400m-patch14-384)
+DEFAULT_SIZE = 384
+DEFAULT_MEAN = (0.5, 0.5, 0.5)
+DEFAULT_STD = (0.5, 0.5, 0.5)
+DEFAULT_RESCALE = 1 / 255
+
+
+def load_image(data, target_size=DEFAULT_SIZE):
+    """
+    Decodifica bytes de imagen a PIL RGB.
+    Para JPEG activa draft mode: libjpeg reduce (1/2, 1/4, 1/8) durante la decodificación
+    manteniendo ambos lados >= target_size, así el resize posterior es casi gratis.
+    Retorna: PIL.Image (RGB) o None si no se puede decodificar.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        if image.format == "JPEG":
+            image.draft("RGB", (target_size, target_size))
+        return image.convert("RGB")
+    except Exception:
+        return None
+
+
+class ImagePreprocessor:
+    """
+    Equivalente CPU del image processor de SigLIP con buffer pre-asignado.
+    Se construye desde el `AutoProcessor` para respetar tamaño, resample, mean y std del modelo.
+    """
+
+    def __init__(self, max_batch, size=DEFAULT_SIZE, mean=DEFAULT_MEAN, std=DEFAULT_STD,
+                 rescale_factor=DEFAULT_RESCALE, resample=Image.BICUBIC, workers=None, pin_memory=False):
+        import torch
+
+        self.max_batch = max_batch
+        self.size = size
+        self.resample = resample
+
+        # Folding: ((x * rescale) - mean) / std  ==  x * scale + shift  (por canal)
+        mean = np.asarray(mean, dtype=np.float32).reshape(3, 1, 1)
+        std = np.asarray(std, dtype=np.float32).reshape(3, 1, 1)
+        self.scale = (rescale_factor / std).astype(np.float32)
+        self.shift = (-mean / std).astype(np.float32)
+
+        # Buffer reutilizable entre lotes (pinned si hay GPU para copias H2D asíncronas)
+        self.buffer = torch.empty((max_batch, 3, size, size), dtype=torch.float32, pin_memory=pin_memory)
+        self._buffer_np = self.buffer.numpy()
+
+        self.workers = workers or os.cpu_count() or 4
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="preprocess")
+
+    @classmethod
+    def from_processor(cls, processor, max_batch, **kwargs):
+        """Lee la configuración (size/mean/std/resample) del AutoProcessor de HuggingFace."""
+        ip = getattr(processor, "image_processor", processor)
+        size = getattr(ip, "size", None) or {}
+        return cls(
+            max_batch=max_batch,
+            size=size.get("height", DEFAULT_SIZE),
+            mean=getattr(ip, "image_mean", None) or DEFAULT_MEAN,
+            std=getattr(ip, "image_std", None) or DEFAULT_STD,
+            rescale_factor=getattr(ip, "rescale_factor", None) or DEFAULT_RESCALE,
+            resample=getattr(ip, "resample", None) or Image.BICUBIC,
+            **kwargs
+        )
+
+    def _fill_slot(self, index, image):
+        # Resize (PIL libera el GIL) -> HWC uint8 -> CHW float32 escrito en el slot del buffer
+        if image.size != (self.size, self.size):
+            image = image.resize((self.size, self.size), resample=self.resample)
+        arr = np.asarray(image, dtype=np.uint8).transpose(2, 0, 1)
+        out = self._buffer_np[index]
+        np.multiply(arr, self.scale, out=out)
+        out += self.shift
+
+    def preprocess_batch(self, images):
+        """
+        Procesa una lista de PIL RGB en paralelo.
+        Retorna: vista torch [N, 3, H, W] sobre el buffer compartido (válida hasta el siguiente lote).
+        """
+        n = len(images)
+        if n > self.max_batch:
+            raise ValueError(f"Batch de {n} imágenes excede el buffer ({self.max_batch})")
+
+        list(self.pool.map(self._fill_slot, range(n), images))
+        return self.buffer[:n]
+
+    def load_batch(self, blobs):
+        """Decodifica (draft mode) una lista de bytes en el pool. Retorna lista de PIL o None."""
+        return list(self.pool.map(lambda b: load_image(b, self.size), blobs))
@@ -4,10 +4,10 @@ import time
 import logging
 import sys
 import pathlib
-import pandas as pd
+from collections import defaultdict
 import numpy as np
 import django
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import SGDClassifier
 from sklearn.ensemble import RandomForestClassifier
 from django.db import connection
 from django.core.management.base import BaseCommand
@@ -20,6 +20,7 @@ load_dotenv()
 # django.setup()
 
 from core.models import AIFeedback
+from core.replay import pair_truth, wins_in_replay
 
 # ─────── Configuración de Logs ───────
 LOG_DIR = pathlib.Path("/app/logs")
@@ -37,63 +38,107 @@ ch = logging.StreamHandler(sys.stdout)
 ch.setFormatter(formatter)
 logger.addHandler(ch)
 
+CLASSES = np.array([0, 1])
+PARTIAL_FIT_EPOCHS = 5 # Pasadas de SGD sobre el feedback nuevo de cada ciclo
+# L2 del SGD: coeficientes / intercepto en la escala de LogisticRegression(C=1) con ~100 muestras,
+# que es la que asume la heurística de threshold_hybrid (0.68 - bias * 0.05)
+SGD_ALPHA = 0.01
+
+
 class AITrainer:
+    """
+    Entrenamiento incremental: marca de agua = último ai_feedback.id visto. Cada ciclo lee solo el
+    feedback nuevo y reentrena solo los conceptos que lo recibieron, con partial_fit sobre un
+    modelo logístico (SGD, log-loss) por concepto que vive en memoria: costo O(feedback nuevo).
+    Al reiniciar el daemon la marca vuelve a 0 y el primer ciclo reconstruye todo una vez.
+    Los pesos nuevos solo se adoptan si no empeoran el F1 en replay (core.replay) sobre el
+    historial del concepto.
+    """
+
     def __init__(self):
         self.min_samples_required = 20
         self.check_interval = 60 # Segundos entre chequeos
+        self.watermark = 0
+        self.unassigned = set() # ai_feedback.id cuyo producto aún no tiene concepto
+        self.models = {} # concept_id -> SGDClassifier
+        self.samples = defaultdict(lambda: np.zeros(2, dtype=int)) # concept_id -> conteo por target
+        self.history = {} # concept_id -> (X, target) acumulados, para el replay
 
     def fetch_training_data(self):
-        """Descarga el feedback humano enriquecido con el concepto del producto."""
-        # JOIN implícito vía Django ORM (feedback -> product -> taxonomy_concept)
-        # Asumiendo que AIFeedback tiene FK a Product. Si no, usamos product_id.
-        # AIFeedback model doesn't explicitly have a relation field usually, just integer.
-        # Let's check models.py first? No, assuming product_id is integer based on context.
-        # We'll fetch raw and join in python or raw SQL. Raw SQL is safer for aggregations.
-        
+        """
+        Feedback humano NUEVO (id > marca de agua) más el que quedó pendiente por no tener concepto.
+        La marca avanza sobre todo lo leído; el feedback de productos aún sin concept_id (antes de
+        build_concept_dictionary o del classifier) queda en self.unassigned y se reintenta cada ciclo.
+        Retorna: dict de arrays NumPy (id, X [N, 2] visual/texto, target, concept_id, concept) o None.
+        """
         with connection.cursor() as cur:
             cur.execute("""
                 SELECT 
-                    f.visual_score, f.text_score, f.final_score, f.decision, f.feedback,
-                    p.taxonomy_concept
+                    f.id, f.visual_score, f.text_score, f.decision, f.feedback,
+                    p.product_id, p.concept_id, c.name
                 FROM ai_feedback f
-                JOIN products p ON f.product_id = p.product_id
-                WHERE f.visual_score IS NOT NULL 
+                LEFT JOIN products p ON f.product_id = p.product_id
+                LEFT JOIN concepts c ON c.id = p.concept_id
+                WHERE (f.id > %s OR f.id = ANY(%s))
+                AND f.visual_score IS NOT NULL 
                 AND f.text_score IS NOT NULL
-                AND p.taxonomy_concept IS NOT NULL
-            """)
+                ORDER BY f.id
+            """, (self.watermark, sorted(self.unassigned)))
             rows = cur.fetchall()
-            
+
+        if rows:
+            self.watermark = max(self.watermark, rows[-1][0])
+        # Producto borrado: no se reintenta
+        self.unassigned = {r[0] for r in rows if r[5] is not None and r[7] is None}
+        rows = [r for r in rows if r[7] is not None]
         if not rows: return None
         
-        df = pd.DataFrame(rows, columns=['visual_score', 'text_score', 'final_score', 'decision', 'feedback', 'concept'])
-        
-        def calculate_target(row):
-            machine_good = 1 if row['decision'] in ['MATCH', 'CANDIDATE'] else 0
-            human_agrees = 1 if row['feedback'] == 'CORRECT' else 0
-            
-            if machine_good and human_agrees: return 1      # TP
-            if machine_good and not human_agrees: return 0  # FP
-            if not machine_good and human_agrees: return 0  # TN
-            if not machine_good and not human_agrees: return 1 # FN
-            return 0
-
-        df['target'] = df.apply(calculate_target, axis=1)
-        return df
+        ids, visual, text, decisions, feedback, _, concept_ids, concepts = zip(*rows)
+        return {
+            "id": np.array(ids, dtype=np.int64),
+            "X": np.column_stack([visual, text]).astype(np.float64),
+            # 1 = mismo producto según el humano (TP confirmado o FN corregido)
+            "target": pair_truth(decisions, feedback),
+            "concept_id": np.array(concept_ids),
+            "concept": concepts,
+        }
 
     def train_and_optimize(self):
         logger.info("🧠 Brain Scan: Buscando patrones por Concepto...")
         
-        df_all = self.fetch_training_data()
-        if df_all is None or df_all.empty:
-            logger.info("   Zzz... Sin datos para aprender.")
+        data = self.fetch_training_data()
+        if data is None:
+            logger.info(f"   Zzz... Sin feedback nuevo ({len(self.unassigned)} pendientes de concepto).")
             return
 
-        # Agrupar por Concepto
-        grouped = df_all.groupby('concept')
+        # Agrupar por Concepto (clave entera del diccionario canónico; concept_weights va por nombre)
+        # Solo los conceptos con feedback nuevo se reentrenan
+        concept_ids, first, group = np.unique(data['concept_id'], return_index=True, return_inverse=True)
+        logger.info(f"   📥 {len(data['id'])} feedbacks nuevos -> {len(concept_ids)} conceptos a reentrenar "
+                    f"({len(self.unassigned)} pendientes de concepto)")
         
-        for concept, df_concept in grouped:
-            count = len(df_concept)
-            # Solo entrenar si hay suficientes datos para este concepto
+        for k, concept_id in enumerate(concept_ids.tolist()):
+            concept = data['concept'][first[k]]
+            rows = group == k
+            X, y = data['X'][rows], data['target'][rows]
+
+            # --- MACHINE LEARNING (incremental) ---
+            try:
+                clf = self.models.get(concept_id)
+                if clf is None:
+                    clf = self.models[concept_id] = SGDClassifier(loss='log_loss', alpha=SGD_ALPHA, random_state=0)
+                for _ in range(PARTIAL_FIT_EPOCHS):
+                    clf.partial_fit(X, y, classes=CLASSES)
+                counts = self.samples[concept_id]
+                counts += np.bincount(y, minlength=2)
+                X_all, y_all = self.history.get(concept_id, (X[:0], y[:0]))
+                self.history[concept_id] = (np.vstack([X_all, X]), np.concatenate([y_all, y]))
+                count = int(counts.sum())
+            except Exception as e:
+                logger.error(f"Error entrenando {concept}: {e}")
+                continue
+
+            # Solo ajustar pesos si hay suficientes datos para este concepto
             # Bajamos el umbral a 5 para testing rápido (prod debería ser 20+)
             MIN_SAMPLES = 5 
             
@@ -101,20 +146,13 @@ class AITrainer:
                 logger.debug(f"   Skip '{concept}': Pocos datos ({count}/{MIN_SAMPLES})")
                 continue
                 
-            logger.info(f"   🎓 Entrenando personalidad para: '{concept}' (N={count})")
+            logger.info(f"   🎓 Entrenando personalidad para: '{concept}' (N={count}, +{len(y)} nuevos)")
 
-            # --- MACHINE LEARNING ---
             try:
-                X = df_concept[['visual_score', 'text_score']]
-                y = df_concept['target']
-                
-                # Check variance (if all targets are 1 or 0, we can't train logistic)
-                if len(y.unique()) < 2:
+                # Check variance (if all targets are 1 or 0, the logistic weights mean nothing)
+                if counts.min() == 0:
                     logger.warning(f"      ⚠️ '{concept}' data is skewed (all correct/incorrect). Skipping.")
                     continue
-
-                clf = LogisticRegression(fit_intercept=True)
-                clf.fit(X, y)
                 
                 coef_visual = abs(clf.coef_[0][0])
                 coef_text = abs(clf.coef_[0][1])
@@ -140,11 +178,20 @@ class AITrainer:
                 
                 # Diff check
                 diff = abs(new_w_vis - float(current_conf['weight_visual']))
-                if diff > 0.01:
+                if diff <= 0.01:
+                    logger.info(f"      🔹 Estable.")
+                    continue
+
+                # Replay: la config nueva no debe empeorar el F1 sobre el historial del concepto
+                X_all, y_all = self.history[concept_id]
+                proposed = dict(current_conf, weight_visual=new_w_vis, weight_text=new_w_txt, threshold_hybrid=new_threshold)
+                wins, f1 = wins_in_replay(X_all[:, 0], X_all[:, 1], y_all, current_conf, proposed)
+                if wins:
                     self.update_db_config(concept, new_w_vis, new_w_txt, new_threshold, count)
-                    logger.info(f"      ✅ Ajustado: Vis={new_w_vis:.2f}, Txt={new_w_txt:.2f}, Th={new_threshold:.2f}")
+                    logger.info(f"      ✅ Ajustado: Vis={new_w_vis:.2f}, Txt={new_w_txt:.2f}, Th={new_threshold:.2f} "
+                                f"(F1 replay {f1[0]:.3f} -> {f1[1]:.3f})")
                 else:
-                    logger.info(f"      🔹 Estable.")
+                    logger.info(f"      🔸 Rechazado en replay: F1 {f1[0]:.3f} -> {f1[1]:.3f}. Se mantiene la config actual.")
                     
             except Exception as e:
                 logger.error(f"Error entrenando {concept}: {e}")
@@ -152,11 +199,11 @@ class AITrainer:
     def get_current_config(self, concept):
         # Leer de tabla nueva
         with connection.cursor() as cur:
-            cur.execute("SELECT weight_visual, weight_text FROM concept_weights WHERE concept = %s", (concept,))
+            cur.execute("SELECT weight_visual, weight_text, threshold_hybrid FROM concept_weights WHERE concept = %s", (concept,))
             row = cur.fetchone()
-            if row: return {"weight_visual": row[0], "weight_text": row[1]}
+            if row: return {"weight_visual": row[0], "weight_text": row[1], "threshold_hybrid": row[2]}
             # Fallback a default global o hardcoded
-            return {"weight_visual": 0.6, "weight_text": 0.4}
+            return {"weight_visual": 0.6, "weight_text": 0.4, "threshold_hybrid": 0.68}
 
     def update_db_config(self, concept, w_vis, w_txt, threshold, n_samples):
         with connection.cursor() as cur:
@@ -1,6 +1,7 @@
 
 from django.core.management.base import BaseCommand
-from core.models import Product, UniqueProductCluster, Category
+from core.models import Product, UniqueProductCluster, Category, Concept
+from django.db.models import Count
 from django.db import connection
 
 class Command(BaseCommand):
@@ -16,12 +17,20 @@ class Command(BaseCommand):
         for ind in valid_industries[:10]:
              self.stdout.write(f"   - {ind}")
 
-        # Nivel 2: Conceptos
-        concepts = Product.objects.values_list('taxonomy_concept', flat=True).distinct()
-        valid_concepts = [c for c in concepts if c]
-        self.stdout.write(f"\n2️⃣ NIVEL 2 (Conceptos Generados): {len(valid_concepts)}")
-        for con in valid_concepts[:10]:
-             self.stdout.write(f"   - {con}")
+        # Nivel 2: Conceptos (diccionario canónico: GROUP BY sobre concept_id)
+        concepts = (
+            Product.objects.filter(concept__isnull=False)
+            .values('concept_id', 'concept__name')
+            .annotate(products=Count('product_id'), clusters=Count('cluster_membership__cluster', distinct=True))
+            .order_by('-products')
+        )
+        self.stdout.write(f"\n2️⃣ NIVEL 2 (Conceptos Canónicos): {len(concepts)} de {Concept.objects.count()} en el diccionario")
+        for con in concepts[:10]:
+             self.stdout.write(f"   - {con['concept__name']} ({con['products']} productos, {con['clusters']} clusters)")
+        unresolved = Product.objects.filter(concept__isnull=True, taxonomy_concept__isnull=False).exclude(taxonomy_concept='UNKNOWN')
+        unresolved_names = unresolved.values('taxonomy_concept').distinct().count()
+        if unresolved_names:
+             self.stdout.write(f"   ⚠️ {unresolved_names} nombres sin resolver al diccionario (correr build_concept_dictionary)")
 
         # Nivel 3: Clusters de Producto
         clusters = UniqueProductCluster.objects.count()
@@ -30,8 +39,8 @@ class Command(BaseCommand):
         # Validar Coherencia: ¿Cuántos productos tienen la cadena completa?
         full_chain = Product.objects.filter(
             taxonomy_industry__isnull=False,
-            taxonomy_concept__isnull=False
-        ).exclude(taxonomy_industry='', taxonomy_concept='').count()
+            concept__isnull=False
+        ).exclude(taxonomy_industry='').count()
         
         total = Product.objects.count()
         
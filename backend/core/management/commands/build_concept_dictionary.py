@@ -0,0 +1,86 @@
+"""
+Construcción / Backfill del Diccionario de Conceptos (Django Command).
+Resuelve cada products.taxonomy_concept distinto contra `concepts` (core.concept_dictionary),
+del más frecuente al menos frecuente: así la variante más usada queda como nombre canónico y
+las demás se unifican con ella si su similitud MiniLM >= --similarity.
+Después reescribe en bloque products.concept_id / taxonomy_concept (nombre canónico) y
+unique_product_clusters.concept_id (concepto del representante).
+--dry-run: reporta las variantes que se unificarían sin modificar nada.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.concept_dictionary import CONCEPT_MATCH_SIMILARITY, ConceptDictionary
+
+
+class Command(BaseCommand):
+    help = 'Unifica los concept_name del LLM en el diccionario canónico de conceptos (concept_id)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--similarity', type=float, default=CONCEPT_MATCH_SIMILARITY,
+                            help='Similitud MiniLM mínima para unificar variantes (default CONCEPT_MATCH_SIMILARITY)')
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta qué se unificaría')
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        dictionary = ConceptDictionary(similarity=options['similarity'])
+
+        with transaction.atomic():
+            with connection.cursor() as cur:
+                cur.execute("""
+                    SELECT taxonomy_concept, MODE() WITHIN GROUP (ORDER BY taxonomy_industry), COUNT(*)
+                    FROM products
+                    WHERE taxonomy_concept IS NOT NULL AND taxonomy_concept <> 'UNKNOWN'
+                    GROUP BY taxonomy_concept
+                    ORDER BY COUNT(*) DESC, taxonomy_concept
+                """)
+                variants = cur.fetchall()
+
+            names, ids, canonical, merged = [], [], [], []
+            for name, industry, count in variants:
+                concept, method = dictionary.resolve(name, industry)
+                if concept is None:
+                    continue
+                names.append(name)
+                ids.append(concept.id)
+                canonical.append(concept.name)
+                if concept.name != name:
+                    merged.append((name, concept.name, count))
+
+            with connection.cursor() as cur:
+                cur.execute("""
+                    UPDATE products p SET concept_id = v.concept_id, taxonomy_concept = v.canonical
+                    FROM unnest(%s::text[], %s::int[], %s::text[]) AS v(name, concept_id, canonical)
+                    WHERE p.taxonomy_concept = v.name
+                    AND (p.concept_id IS DISTINCT FROM v.concept_id OR p.taxonomy_concept <> v.canonical)
+                """, (names, ids, canonical))
+                products_updated = cur.rowcount
+                cur.execute("""
+                    UPDATE unique_product_clusters c SET concept_id = p.concept_id
+                    FROM products p
+                    WHERE p.product_id = c.representative_product_id
+                    AND c.concept_id IS DISTINCT FROM p.concept_id
+                """)
+                clusters_updated = cur.rowcount
+
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        counts = dictionary.counts
+        self.stdout.write(f"\n📖 DICCIONARIO DE CONCEPTOS (similitud >= {options['similarity']:.2f})\n")
+        self.stdout.write(f"   Nombres distintos en products: {len(variants)}")
+        self.stdout.write(f"   -> {len(set(ids))} conceptos canónicos ({counts['new']} nuevos, "
+                          f"{counts['semantic']} variantes unificadas por similitud)")
+        if merged:
+            self.stdout.write(f"\n   {'Variante':<35} {'Canónico':<30} {'Productos':>9}")
+            for name, target, count in sorted(merged, key=lambda m: -m[2])[:30]:
+                self.stdout.write(f"   {name[:35]:<35} {target[:30]:<30} {count:>9}")
+        self.stdout.write(f"\n   Productos actualizados: {products_updated} | Clusters: {clusters_updated}")
+        self.stdout.write(f"   ⏱️ {time.perf_counter() - t0:.2f}s")
+        if options['dry_run']:
+            self.stdout.write("🧪 Dry-run: no se modificó nada.")
+        else:
+            self.stdout.write("✅ Diccionario actualizado.")
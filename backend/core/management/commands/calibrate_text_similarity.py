@@ -0,0 +1,88 @@
+"""
+Calibración de los Scores de Texto (Django Command).
+Ajusta los mapeos (score nuevo -> SequenceMatcher legacy) sobre pares reales de
+cluster_decision_logs, para que umbrales como threshold_text_rescue=0.95 conserven su significado:
+- "fuzzy": rapidfuzz sobre títulos normalizados (lotes sin embedding_text).
+- "embedding": producto punto de embedding_text (lotes con embedding en ambos lados).
+"""
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.ai_utils import as_vector
+from core.text_similarity import fit_quantile_map, legacy_similarity, raw_similarity, save_calibration
+
+MIN_PAIRS = 100
+
+
+class Command(BaseCommand):
+    help = 'Calibra los scores de texto (fuzzy y embedding) contra SequenceMatcher usando pares de cluster_decision_logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=5000, help='Pares a muestrear (default: 5000)')
+        parser.add_argument('--dry-run', action='store_true', help='Reporta sin guardar la calibración')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cur:
+            cur.execute("""
+                SELECT pa.title, pb.title, ea.embedding_text, eb.embedding_text
+                FROM cluster_decision_logs l
+                JOIN products pa ON pa.product_id = l.product_id
+                JOIN products pb ON pb.product_id = l.candidate_id
+                LEFT JOIN product_embeddings ea ON ea.product_id = l.product_id
+                LEFT JOIN product_embeddings eb ON eb.product_id = l.candidate_id
+                WHERE pa.title IS NOT NULL AND pb.title IS NOT NULL
+                ORDER BY random()
+                LIMIT %s
+            """, (options['sample'],))
+            rows = cur.fetchall()
+
+        if len(rows) < MIN_PAIRS:
+            self.stdout.write(f"⚠️ Solo {len(rows)} pares en cluster_decision_logs. Se necesitan al menos {MIN_PAIRS}.")
+            return
+
+        t0 = time.perf_counter()
+        legacy = np.array([legacy_similarity(a, b) for a, b, _, _ in rows])
+        t_legacy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        fuzzy = np.concatenate([raw_similarity(a, [b]) for a, b, _, _ in rows])
+        t_fuzzy = time.perf_counter() - t0
+        scores = {"fuzzy": (fuzzy, legacy)}
+
+        with_vec = [i for i, r in enumerate(rows) if r[2] is not None and r[3] is not None]
+        if len(with_vec) >= MIN_PAIRS:
+            vec_a = np.stack([as_vector(rows[i][2]) for i in with_vec])
+            vec_b = np.stack([as_vector(rows[i][3]) for i in with_vec])
+            scores["embedding"] = (np.clip(np.einsum('ij,ij->i', vec_a, vec_b), 0.0, 1.0), legacy[with_vec])
+        else:
+            self.stdout.write(f"⚠️ Solo {len(with_vec)} pares con embedding_text en ambos lados: "
+                              f"sin calibración 'embedding' (text_scores usa el kernel difuso).")
+
+        calibrations = {kind: fit_quantile_map(new, ref) for kind, (new, ref) in scores.items()}
+        if not options['dry_run']:
+            save_calibration(calibrations)
+
+        # Comparar tasas de aceptación en los umbrales que usa el sistema
+        self.stdout.write(f"\n📐 CALIBRACIÓN TEXTO (N={len(rows)} pares)\n")
+        for kind, (new, ref) in scores.items():
+            calibrated = np.interp(new, calibrations[kind]["x"], calibrations[kind]["y"])
+            self.stdout.write(f"   [{kind}] N={len(new)}")
+            self.stdout.write(f"{'UMBRAL':>6} | {'LEGACY':>8} | {'CRUDO':>8} | {'CALIBRADO':>9}")
+            self.stdout.write("-" * 42)
+            for threshold in (0.5, 0.68, 0.85, 0.95):
+                self.stdout.write(
+                    f"{threshold:>6.2f} | {(ref >= threshold).mean() * 100:>7.1f}% | "
+                    f"{(new >= threshold).mean() * 100:>7.1f}% | {(calibrated >= threshold).mean() * 100:>8.1f}%"
+                )
+            self.stdout.write("")
+        self.stdout.write(
+            f"⏱️ µs/par: SequenceMatcher {t_legacy / len(rows) * 1e6:.1f} | kernel {t_fuzzy / len(rows) * 1e6:.1f}"
+        )
+        if options['dry_run']:
+            self.stdout.write("🧪 Dry-run: calibración NO guardada.")
+        else:
+            self.stdout.write(f"✅ Calibración ({', '.join(calibrations)}) guardada en text_calibrations")
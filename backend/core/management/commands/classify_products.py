@@ -1,12 +1,40 @@
 
 from django.core.management.base import BaseCommand
 from core.models import Product
-from core.ai_classifier import classify_term
-from core.ai_classifier import classify_term
+from core.ai_classifier import classify_many, get_taxonomist, OLLAMA_CONCURRENCY, TAXONOMY_BATCH_SIZE
+import re
 import sys
+import time
 import pathlib
 import logging
 from django.db import connection, close_old_connections # Required for stability
+from core.concept_dictionary import ConceptDictionary
+from core.priority import dequeue
+from core.pipeline_events import PipelineListener, PRODUCTS_VECTORIZED, PRODUCTS_CLASSIFIED, notify
+from core.visual_consensus import (
+    TAXONOMY_CONSENSUS_MODE, TAXONOMY_CONSENSUS_K, TAXONOMY_CONSENSUS_SIMILARITY, VISUAL_CONSENSUS,
+    visual_consensus
+)
+from core.embedding_service import EmbeddingServiceError, get_client
+from core.zero_shot import (
+    TAXONOMY_ZERO_SHOT_MODE, TAXONOMY_ZERO_SHOT_MIN_SCORE, TAXONOMY_ZERO_SHOT_MARGIN, TAXONOMY_ZERO_SHOT_PAGE,
+    refresh_concept_text_embeddings, load_concept_matrix, pending_vectors, zero_shot_assign, apply_assignments
+)
+from collections import Counter, defaultdict
+
+VISUAL_NEIGHBOURS = 5 # Vecinos visuales que se le muestran al LLM (y votan en el consenso)
+
+
+class QueryCounter:
+    """execute_wrapper de Django: cuenta las consultas SQL ejecutadas dentro del bloque."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
 
 # Setup Logging
 LOG_DIR = pathlib.Path("/app/logs")
@@ -32,148 +60,328 @@ if not logger.handlers:
 class Command(BaseCommand):
     help = 'Agent 1: Taxonomy Classifier (The Labeler). Uses Visual Consensus.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=OLLAMA_CONCURRENCY,
+                            help='Llamadas simultáneas a Ollama (default: OLLAMA_CONCURRENCY)')
+        parser.add_argument('--batch-size', type=int, default=TAXONOMY_BATCH_SIZE,
+                            help='Productos por llamada al LLM; >1 activa el modo multi-item (default: TAXONOMY_BATCH_SIZE)')
+
     def handle(self, *args, **options):
         logger.info("🏷️ AGENT 1: TAXONOMY CLASSIFIER STARTED (SCHOOL MODE 🏫)")
+        self.concurrency = options['concurrency']
+        self.batch_size = options['batch_size']
+        logger.info(f"   🧠 Ollama: {self.concurrency} llamadas en vuelo, {self.batch_size} productos por llamada")
+        logger.info(
+            f"   🤝 Consenso visual: modo {TAXONOMY_CONSENSUS_MODE} "
+            f"(k={TAXONOMY_CONSENSUS_K}, similitud >= {TAXONOMY_CONSENSUS_SIMILARITY})"
+        )
+        # fast_path / llm / shadow_agree / shadow_disagree; predicciones en sombra: product_id -> concept_name
+        self.consensus_counts = Counter()
+        self.consensus_predictions = {}
+        # concept_name libre del LLM -> concepto canónico (evita buckets fragmentados en el clusterizer)
+        self.concepts = ConceptDictionary()
+        logger.info(
+            f"   🔭 Zero-shot SigLIP: modo {TAXONOMY_ZERO_SHOT_MODE} "
+            f"(score >= {TAXONOMY_ZERO_SHOT_MIN_SCORE}, margen >= {TAXONOMY_ZERO_SHOT_MARGIN})"
+        )
+        # assigned / shadow_agree / shadow_disagree; predicciones en sombra: product_id -> concept_id
+        self.zero_shot_counts = Counter()
+        self.zero_shot_predictions = {}
+        self.zero_shot_after = 0 # marca de agua del barrido de pendientes (product_id)
+        self.zero_shot_concepts = None
+        # Despierta cuando el vectorizer confirma vectores (los productos con ojos van primero)
+        listener = PipelineListener(PRODUCTS_VECTORIZED)
+        # Caché del Taxonomist: descartar clasificaciones de otro modelo / versión de prompt
+        cache = get_taxonomist().cache
+        stale = cache.invalidate_stale()
+        if stale:
+            logger.info(f"🗑️ Caché taxonomist: {stale} entradas de otro modelo/prompt eliminadas.")
         
         while True:
             # 0. Stability: Close old DB connections to prevent timeouts overnight
             close_old_connections()
             
+            # 0.5 ZERO-SHOT: una página de pendientes con vector contra el diccionario, en un solo pase
+            if TAXONOMY_ZERO_SHOT_MODE in ("on", "shadow"):
+                self.zero_shot_pass()
+            
             # 1. Fetch Candidates (Priority: Products with EYES 👀)
             # Queremos priorizar productos que YA tienen vector visual para aplicar el consenso.
             # Si procesamos productos sin vector, el classifier estaría "ciego" y perderíamos la oportunidad de aprender.
             
+            # Dentro de cada query: carril prioritario (priority_score) + carril de backfill (core.priority)
             # Query A: Sin clasificar + CON Vector (Los mejores alumnos)
-            pending_products = Product.objects.filter(
+            pending_products = dequeue(Product.objects.filter(
                 taxonomy_concept__isnull=True,
                 is_active=True,
                 productembedding__embedding_visual__isnull=False
-            ).order_by('-created_at')[:50]
+            ), 50)
             
             # Query B: Fallback (Si no hay productos vectorizados listos, procesar lo que haya)
-            if not pending_products.exists():
-                pending_products = Product.objects.filter(
+            if not pending_products:
+                pending_products = dequeue(Product.objects.filter(
                     taxonomy_concept__isnull=True,
                     is_active=True
-                ).order_by('-created_at')[:50]
+                ), 50)
             
-            if not pending_products.exists():
-                logger.info("💤 Todo limpio. Esperando nuevos productos... (30s)")
-                time.sleep(30)
+            if not pending_products:
+                logger.info("💤 Todo limpio. Esperando nuevos productos (LISTEN)...")
+                listener.wait()
                 continue
             
-            logger.info(f"⚡ Procesando lote de {pending_products.count()} productos... (Prioridad Visual)")
+            logger.info(f"⚡ Procesando lote de {len(pending_products)} productos... (Prioridad Visual)")
+            t0 = time.perf_counter()
+            self.classify_batch(pending_products)
+            elapsed = time.perf_counter() - t0
+            logger.info(f"   ⏱️ Lote en {elapsed:.1f}s ({len(pending_products) / elapsed:.2f} productos/s)")
             
-            for prod in pending_products:
-                try:
-                    self.classify_product(prod)
-                    # Rate limit suave para no saturar Ollama
-                    time.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"❌ Error classifying product {prod.product_id}: {e}")
+            c = self.consensus_counts
+            shadow = c['shadow_agree'] + c['shadow_disagree']
+            logger.info(
+                f"   🤝 Consenso visual: {c['fast_path']} sin LLM, {c['llm']} al LLM"
+                + (f" | sombra: {c['shadow_agree']}/{shadow} de acuerdo ({c['shadow_agree'] / shadow:.1%})" if shadow else "")
+            )
+            z = self.zero_shot_counts
+            z_shadow = z['shadow_agree'] + z['shadow_disagree']
+            logger.info(
+                f"   🔭 Zero-shot: {z['assigned']} asignados sin LLM"
+                + (f" | sombra: {z['shadow_agree']}/{z_shadow} de acuerdo ({z['shadow_agree'] / z_shadow:.1%})" if z_shadow else "")
+            )
+            resolved = self.concepts.counts
+            logger.info(
+                f"   📖 Diccionario de conceptos: {resolved['exact']} exactos, {resolved['semantic']} variantes unificadas, "
+                f"{resolved['new']} nuevos"
+            )
+            stats = cache.stats()
+            logger.info(
+                f"   🗃️ Caché taxonomist: {stats['hit_rate']:.1%} aciertos ({stats['exact_hits']} exactos, "
+                f"{stats['semantic_hits']} semánticos, {stats['misses']} al LLM) | "
+                f"~{stats['seconds_saved']:.0f}s de LLM ahorrados vs {stats['llm_seconds']:.0f}s usados"
+            )
+            
+            # Despertar al clusterizer (autocommit: se entrega de inmediato)
+            with connection.cursor() as cur:
+                notify(cur, PRODUCTS_CLASSIFIED, len(pending_products))
             
             # Sleep between batches
             time.sleep(2)
 
-    def classify_product(self, prod):
-        # 0. COMBINED CONTEXT: Title + Intro of Description
-        term = prod.title or ""
-        desc = prod.description or ""
-        
-        # Limpiamos HTML basico
-        import re
-        clean_desc = re.sub(r'<[^>]+>', ' ', desc)[:200]
-        full_context = f"{term} | {clean_desc}".strip()[:300]
-        
-        # 1. FETCH SOURCE CATEGORIES (Brújula de Contexto)
-        source_cats = []
+    def zero_shot_pass(self):
+        """
+        Puntúa en un solo producto de matrices la siguiente página de pendientes con vector visual
+        contra los conceptos conocidos (core.zero_shot). Las páginas avanzan por product_id y al
+        terminar el barrido vuelve a empezar (recoge los nuevos y los ambiguos). Modo on: los seguros
+        se etiquetan con un UPDATE en bloque y no llegan al LLM. Modo sombra: la predicción se guarda
+        para medir el acuerdo.
+        """
         try:
-            # Importar aquí para evitar circular imports si fuera el caso, aunque models ya está importado arriba
-            from core.models import ProductCategory
-            # Obtener nombres de categorías vinculadas
-            cats_qs = ProductCategory.objects.filter(product=prod).select_related('category')
-            source_cats = [pc.category.name for pc in cats_qs]
-            if source_cats:
-                logger.info(f"   🗺️  Source Context: {source_cats}")
-        except Exception as e:
-            logger.warning(f"   ⚠️ Error fetching source categories: {e}")
+            # Versión del servicio conectado (la que llevan los vectores), no la del entorno local
+            client = get_client()
+            model_version = client.info()['model_version']
+            refreshed = refresh_concept_text_embeddings(client, model_version)
+        except EmbeddingServiceError as e:
+            logger.warning(f"⚠️ Zero-shot sin torre de texto SigLIP ({e}). Tier omitido en este lote.")
+            return
+        if refreshed:
+            logger.info(f"   🔭 Zero-shot: {refreshed} conceptos embebidos con la torre de texto")
+
+        concepts, matrix = load_concept_matrix(model_version)
+        if len(concepts) < 2:
+            return
+        # Conceptos nuevos: los ambiguos de antes pueden dejar de serlo, se reinicia el barrido
+        key = tuple(c[0] for c in concepts)
+        if key != self.zero_shot_concepts:
+            self.zero_shot_concepts = key
+            self.zero_shot_after = 0
+
+        ids, vectors = pending_vectors(model_version, self.zero_shot_after, TAXONOMY_ZERO_SHOT_PAGE)
+        # Página incompleta: fin del barrido, el próximo pase empieza desde el principio
+        self.zero_shot_after = ids[-1] if len(ids) == TAXONOMY_ZERO_SHOT_PAGE else 0
+        if not ids:
+            return
+        t0 = time.perf_counter()
+        best, _, _ = zero_shot_assign(vectors, matrix)
+        confident = [(pid, concepts[i][0]) for pid, i in zip(ids, best.tolist()) if i >= 0]
+        logger.info(
+            f"   🔭 Zero-shot: {len(ids)} pendientes x {len(concepts)} conceptos en {time.perf_counter() - t0:.3f}s "
+            f"-> {len(confident)} seguros"
+        )
+        if not confident:
+            return
+
+        if TAXONOMY_ZERO_SHOT_MODE == "on":
+            with connection.cursor() as cur:
+                assigned = apply_assignments(cur, *zip(*confident))
+                notify(cur, PRODUCTS_CLASSIFIED, assigned)
+            self.zero_shot_counts['assigned'] += assigned
+        else:
+            self.zero_shot_predictions.update(confident)
+
+    def classify_batch(self, products):
+        """
+        Contexto y consenso producto a producto; las llamadas al LLM del lote van juntas
+        (concurrentes y, con --batch-size > 1, varios productos por llamada). Ollama limita
+        el paralelismo real: --concurrency acota cuántas llamadas hay en vuelo.
+        """
+        decided, llm_queue = [], []
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            contexts = self.build_contexts(products)
+        logger.info(f"   🔎 Contexto del lote: {queries.count} consultas ({queries.count / len(products):.2f} por producto)")
+
+        for prod in products:
+            ctx = contexts[prod.product_id]
+
+            # 3. FAST PATH: CONSENSO VISUAL (vecinos casi idénticos ya etiquetados)
+            consensus = None
+            if TAXONOMY_CONSENSUS_MODE in ("on", "shadow"):
+                consensus = visual_consensus(ctx['visual_hints'])
+
+            if consensus and TAXONOMY_CONSENSUS_MODE == "on":
+                self.consensus_counts['fast_path'] += 1
+                logger.info(f"   🤝 {VISUAL_CONSENSUS}: {consensus['votes']} vecinos -> [{consensus['concept_name']}] (sin LLM)")
+                decided.append((prod, ctx['term'], consensus, VISUAL_CONSENSUS))
+            else:
+                self.consensus_counts['llm'] += 1
+                llm_queue.append((prod, ctx, consensus))
+
+        # 4. CALL AGENT 1 (THE BRAIN) WITH RICH CONTEXT
+        # La caché se consulta por título: publicaciones casi idénticas reutilizan la clasificación
+        results = classify_many([
+            {"term": ctx['full_context'], "visual_context": ctx['visual_hints'],
+             "source_categories": ctx['source_cats'], "cache_key": ctx['term']}
+            for _, ctx, _ in llm_queue
+        ], concurrency=self.concurrency, batch_size=self.batch_size) if llm_queue else []
+
+        for (prod, ctx, consensus), result in zip(llm_queue, results):
+            if consensus and result:
+                # Modo sombra: se compara en save_result, ya resueltos ambos nombres en el diccionario
+                self.consensus_predictions[prod.product_id] = consensus['concept_name']
+            decided.append((prod, ctx['term'], result, "LLM"))
+
+        for prod, term, result, source in decided:
+            try:
+                self.save_result(prod, term, result, source)
+            except Exception as e:
+                logger.error(f"❌ Error classifying product {prod.product_id}: {e}")
+
+    def build_contexts(self, products):
+        """
+        Contexto de TODO el lote en 2 consultas set-based (antes: 3 por producto):
+        1. Vecinos visuales de cada producto con vector (KNN LATERAL sobre el HNSW).
+        2. Categorías de los productos del lote y de sus vecinos.
+        Retorna: {product_id: {term, full_context, source_cats, visual_hints}}
+        """
+        ids = [prod.product_id for prod in products]
+        neighbours, categories = defaultdict(list), defaultdict(list)
 
         # 2. VISUAL CONSENSUS CHECK (Consultar al Agente 2 + Historial)
-        visual_hints = []
         try:
             with connection.cursor() as cur:
-                # Verificar si tiene vector
-                cur.execute("SELECT embedding_visual FROM product_embeddings WHERE product_id = %s", (prod.product_id,))
-                row = cur.fetchone()
-                
-                if row and row[0]:
-                    vector = row[0]
-                    # Buscar vecinos visuales CON sus categorías (Query Avanzada)
-                    # Usamos ARRAY_AGG para compactar las categorías de cada vecino en una sola fila
-                    sql_neighbors = """
-                        SELECT 
-                            p.title,
-                            p.taxonomy_concept,
-                            COALESCE(
-                                (
-                                    SELECT string_agg(c.name, ', ')
-                                    FROM product_categories pc
-                                    JOIN categories c ON pc.category_id = c.id
-                                    WHERE pc.product_id = p.product_id
-                                ), 
-                                ''
-                            ) as neighbor_cats
+                cur.execute("""
+                    SELECT t.product_id, n.product_id, n.title, n.taxonomy_concept, n.taxonomy_industry,
+                           n.taxonomy_level, n.similarity
+                    FROM product_embeddings t
+                    CROSS JOIN LATERAL (
+                        SELECT p.product_id, p.title, p.taxonomy_concept, p.taxonomy_industry, p.taxonomy_level,
+                               1 - (pe.embedding_visual <=> t.embedding_visual) AS similarity
                         FROM product_embeddings pe
                         JOIN products p ON pe.product_id = p.product_id
-                        WHERE pe.product_id != %s 
+                        WHERE pe.product_id != t.product_id
                         AND pe.embedding_visual IS NOT NULL
-                        ORDER BY pe.embedding_visual <=> %s
-                        LIMIT 5
-                    """
-                    cur.execute(sql_neighbors, (prod.product_id, vector))
-                    
-                    neighbors = cur.fetchall()
-                    if neighbors:
-                        # Estructura Rica: Lista de Diccionarios
-                        # [ {"title": "X", "concept": "Y", "categories": ["A", "B"]}, ... ]
-                        rich_neighbors = []
-                        for n_title, n_concept, n_cats_str in neighbors:
-                            cat_list = [c.strip() for c in n_cats_str.split(',')] if n_cats_str else []
-                            
-                            neighbor_data = {
-                                "title": n_title,
-                                "categories": cat_list
-                            }
-                            # Si ya tiene concepto, también ayuda
-                            if n_concept:
-                                neighbor_data["concept"] = n_concept
-                                
-                            rich_neighbors.append(neighbor_data)
-                            
-                        visual_hints = rich_neighbors
-                        logger.info(f"   👀 Rich Visual Context Found ({len(visual_hints)} neighbors)")
-                    else:
-                        logger.info(f"   🕶️ No visual neighbors found for context.")
+                        ORDER BY pe.embedding_visual <=> t.embedding_visual
+                        LIMIT %s
+                    ) n
+                    WHERE t.product_id = ANY(%s)
+                    AND t.embedding_visual IS NOT NULL
+                    ORDER BY t.product_id, n.similarity DESC
+                """, (VISUAL_NEIGHBOURS, ids))
+                for target_id, *neighbour in cur.fetchall():
+                    neighbours[target_id].append(neighbour)
         except Exception as e:
             logger.warning(f"   ⚠️ Error fetching visual context: {e}")
 
-        # 3. CALL AGENT 1 (THE BRAIN) WITH RICH CONTEXT
-        # Ahora pasamos visual_context Y source_categories
-        result = classify_term(full_context, visual_context=visual_hints, source_categories=source_cats)
-        
+        # 1. FETCH SOURCE CATEGORIES (Brújula de Contexto): propias y de los vecinos, de una vez
+        try:
+            wanted = set(ids) | {n[0] for rows in neighbours.values() for n in rows}
+            with connection.cursor() as cur:
+                cur.execute("""
+                    SELECT pc.product_id, c.name
+                    FROM product_categories pc
+                    JOIN categories c ON pc.category_id = c.id
+                    WHERE pc.product_id = ANY(%s)
+                    ORDER BY pc.product_id, c.name
+                """, (list(wanted),))
+                for product_id, name in cur.fetchall():
+                    categories[product_id].append(name)
+        except Exception as e:
+            logger.warning(f"   ⚠️ Error fetching source categories: {e}")
+
+        contexts = {}
+        for prod in products:
+            # 0. COMBINED CONTEXT: Title + Intro of Description
+            term = prod.title or ""
+            desc = prod.description or ""
+            
+            # Limpiamos HTML basico
+            clean_desc = re.sub(r'<[^>]+>', ' ', desc)[:200]
+            full_context = f"{term} | {clean_desc}".strip()[:300]
+
+            # Estructura Rica: Lista de Diccionarios
+            # [ {"title": "X", "concept": "Y", "categories": ["A", "B"]}, ... ]
+            visual_hints = []
+            for n_id, n_title, n_concept, n_industry, n_level, n_similarity in neighbours.get(prod.product_id, []):
+                neighbor_data = {
+                    "title": n_title,
+                    "categories": categories.get(n_id, [])
+                }
+                # Si ya tiene concepto, también ayuda
+                if n_concept:
+                    neighbor_data["concept"] = n_concept
+                    neighbor_data["industry"] = n_industry
+                    neighbor_data["level"] = n_level
+                neighbor_data["similarity"] = float(n_similarity)
+                visual_hints.append(neighbor_data)
+
+            contexts[prod.product_id] = {
+                "term": term, "full_context": full_context,
+                "source_cats": categories.get(prod.product_id, []), "visual_hints": visual_hints
+            }
+
+        with_eyes = sum(1 for ctx in contexts.values() if ctx['visual_hints'])
+        logger.info(f"   👀 Rich Visual Context: {with_eyes}/{len(products)} productos con vecinos")
+        return contexts
+
+    def save_result(self, prod, term, result, source):
         if result:
             # Extract fields
             concept_name = result.get('concept_name')
             industry = result.get('parent_industry')
             level = result.get('classification') # INDUSTRY, CONCEPT, PRODUCT
             
-            if concept_name:
-                prod.taxonomy_concept = concept_name
+            concept, method = self.concepts.resolve(concept_name, industry) if concept_name else (None, None)
+            consensus_name = self.consensus_predictions.pop(prod.product_id, None)
+            if concept is not None:
+                if method == "semantic":
+                    logger.info(f"   🔗 '{concept_name}' -> [{concept.name}] (variante unificada)")
+                if consensus_name is not None:
+                    # Modo sombra: ¿el consenso habría acertado? Por concepto canónico (sinónimos / plurales unificados)
+                    predicted, _ = self.concepts.resolve(consensus_name)
+                    agree = predicted is not None and predicted.id == concept.id
+                    self.consensus_counts['shadow_agree' if agree else 'shadow_disagree'] += 1
+                    source = "LLM_CONSENSUS_AGREE" if agree else "LLM_CONSENSUS_DISAGREE"
+                prod.concept = concept
+                prod.taxonomy_concept = concept.name
                 prod.taxonomy_industry = industry
                 prod.taxonomy_level = level
+                prod.taxonomy_source = source
                 # UPDATE SPECIFIC FIELDS ONLY to avoid touching generated columns like profit_margin
-                prod.save(update_fields=['taxonomy_concept', 'taxonomy_industry', 'taxonomy_level'])
-                logger.info(f"   ✅ {term[:30]}... -> [{industry}] > [{concept_name}]")
+                prod.save(update_fields=['concept', 'taxonomy_concept', 'taxonomy_industry', 'taxonomy_level', 'taxonomy_source'])
+                logger.info(f"   ✅ {term[:30]}... -> [{industry}] > [{concept.name}]")
+                predicted = self.zero_shot_predictions.pop(prod.product_id, None)
+                if predicted is not None:
+                    # Modo sombra: ¿el zero-shot habría acertado?
+                    self.zero_shot_counts['shadow_agree' if predicted == concept.id else 'shadow_disagree'] += 1
             else:
                 logger.warning(f"   ⚠️ No concept name returned for {term}")
                 prod.taxonomy_concept = "UNKNOWN"
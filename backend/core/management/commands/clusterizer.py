@@ -8,12 +8,13 @@ import os
 import time
 import logging
 import psycopg2
-import re
 import pathlib
 import sys
 import json
-from difflib import SequenceMatcher
+import multiprocessing
+import numpy as np
 from django.core.management.base import BaseCommand
+from django.db import connections
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,51 +36,15 @@ ch = logging.StreamHandler(sys.stdout)
 ch.setFormatter(formatter)
 logger.addHandler(ch)
 
-# ─────── CONFIGURACIÓN DINÁMICA ───────
-# ─────── CONFIGURACIÓN DINÁMICA (CEREBRO POR CONCEPTO) ───────
-def load_config(cur, concept_name="DEFAULT"):
-    """
-    Carga los pesos específicos para un concepto (Personalidad Dinámica).
-    Si no existe personalidad para 'Perfume', usa la 'DEFAULT'.
-    """
-    config = {
-        "weight_visual": 0.6,
-        "weight_text": 0.4,
-        "threshold_visual_rescue": 0.92, # Hardcoded defaults baselines
-        "threshold_text_rescue": 0.95,
-        "threshold_hybrid": 0.68
-    }
-    try:
-        # Intentar cargar config específica para el concepto
-        cur.execute("""
-            SELECT weight_visual, weight_text, threshold_hybrid
-            FROM concept_weights 
-            WHERE concept = %s
-        """, (concept_name,))
-        row = cur.fetchone()
-        
-        # Si no hay, cargar DEFAULT
-        if not row:
-            cur.execute("""
-                SELECT weight_visual, weight_text, threshold_hybrid
-                FROM concept_weights 
-                WHERE concept = 'DEFAULT'
-            """)
-            row = cur.fetchone()
-            
-        if row:
-            config["weight_visual"] = float(row[0])
-            config["weight_text"] = float(row[1])
-            config["threshold_hybrid"] = float(row[2])
-            
-            # Ajuste dinámico de umbrales de rescate basado en pesos
-            # Si el texto es muy importante (w_text > 0.7), relajamos el visual rescue?
-            # Por seguridad, mantenemos los rescues visuales muy altos (0.92) siempre.
-            
-    except Exception as e:
-        logger.error(f"⚠️ Error cargando config dinámica para {concept_name}: {e}. Usando defaults.")
-    
-    return config
+# ─────── CONFIGURACIÓN ───────
+# Objetivos por ciclo: con union-find el resultado no depende del orden, así que el lote puede ser grande
+BATCH_SIZE = int(os.getenv("CLUSTER_BATCH_SIZE", "500"))
+# Cada cuánto (s) se fusionan los clusters con centroides convergentes (0 = nunca)
+MERGE_INTERVAL = int(os.getenv("CLUSTER_MERGE_INTERVAL", "3600"))
+# Mantenimiento de particiones de cluster_decision_logs (crear próximas / retención)
+PARTITION_INTERVAL = 24 * 3600
+# Cada cuánto (s) se buscan conceptos con pesos nuevos para re-evaluar sus membresías dudosas (0 = nunca)
+REEVAL_INTERVAL = int(os.getenv("CLUSTER_REEVAL_INTERVAL", "300"))
 
 # ─────── HELPERS ───────
 
@@ -114,210 +79,396 @@ def get_db_connection():
         logger.error(f"Error conectando a DB: {e}")
         return None
 
-def normalize_sku(sku):
-    if not sku: return ""
-    return re.sub(r'[^a-zA-Z0-9]', '', str(sku)).upper()
+from core.decision_log import DecisionLogWriter, maintain_partitions
+from core.pipeline_events import PipelineListener, PRODUCTS_CLASSIFIED, CLUSTERS_UPDATED, notify
+from core.priority import two_lane_fetch
+from core.ai_utils import text_scores, as_vector
+from core.vector_index import ConceptVectorIndex
+from core import cluster_metrics
+from core.clustering import (
+    CANDIDATES_PER_TARGET, load_all_configs, config_for, evaluate_pair, audit_reason, UnionFind,
+    merge_converged_clusters, exact_matches, lock_concept, stale_concepts, mark_reevaluated, reevaluate_concept
+)
 
-from core.models import ClusterDecisionLog
+def log_decision(writer, pid_a, pid_b, visual_score, text_score, final_score, decision, method, active_weights):
+    """Encola la decisión en el escritor asíncrono (muestreo + bulk en segundo plano, ver core.decision_log)"""
+    writer.log(pid_a, pid_b, visual_score, text_score, final_score, decision, method, active_weights)
 
-def log_decision(pid_a, pid_b, visual_score, text_score, final_score, decision, method, title_a, title_b, active_weights, image_a=None, image_b=None):
-    """Guarda la decisión en la Base de Datos (Persistente)"""
-    try:
-        ClusterDecisionLog.objects.create(
-            product_id=pid_a,
-            candidate_id=pid_b,
-            title_a=title_a,
-            title_b=title_b,
-            image_a=image_a,
-            image_b=image_b,
-            visual_score=visual_score,
-            text_score=text_score,
-            final_score=final_score,
-            decision=decision,
-            match_method=method,
-            active_weights=active_weights
-        )
-    except Exception as e:
-        logger.error(f"Error saving audit log to DB: {e}")
+def still_pending(cur, group):
+    """Filtra los objetivos que otro proceso ya clusterizó mientras esperábamos el lock."""
+    cur.execute(
+        "SELECT product_id FROM product_cluster_membership WHERE product_id = ANY(%s)",
+        ([row[0] for row in group],)
+    )
+    done = {row[0] for row in cur.fetchall()}
+    return [row for row in group if row[0] not in done]
 
 # ─────── FUNCIONES CORE DE CLUSTERING ───────
 
-def create_cluster(cur, pid, saturation_score, avg_price):
-    cur.execute("""
-        INSERT INTO unique_product_clusters (representative_product_id, total_competitors, saturation_score, average_price, created_at, updated_at)
-        VALUES (%s, 1, %s, %s, NOW(), NOW())
-        RETURNING cluster_id
-    """, (pid, saturation_score, avg_price))
-    cluster_id = cur.fetchone()[0]
-    
-    cur.execute("""
-        INSERT INTO product_cluster_membership (product_id, cluster_id, match_confidence, match_method)
-        VALUES (%s, %s, 1.0, 'REPRESENTATIVE')
-        ON CONFLICT (product_id) DO UPDATE SET cluster_id = EXCLUDED.cluster_id
-    """, (pid, cluster_id))
-    return cluster_id
+# Los agregados del cluster (miembros, suma/min/max/promedio de precio) se mantienen
+# por deltas en la misma transacción: ver core.cluster_metrics
+
+def create_cluster(cur, pid, saturation_score):
+    return cluster_metrics.create_cluster(cur, pid, saturation_score)
 
 def add_to_cluster(cur, cluster_id, pid, method, confidence):
-    cur.execute("""
-        INSERT INTO product_cluster_membership (product_id, cluster_id, match_confidence, match_method)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (product_id) DO UPDATE SET cluster_id = EXCLUDED.cluster_id
-    """, (pid, cluster_id, confidence, method))
-    
-    # Actualizar contador del cluster
-    cur.execute("""
-        UPDATE unique_product_clusters 
-        SET total_competitors = total_competitors + 1, updated_at = NOW()
-        WHERE cluster_id = %s
-    """, (cluster_id,))
-
-def update_cluster_metrics(cur):
-    """Recalcula precio promedio y saturación para clusters modificados recientemente"""
-    # Simplificado: Recalcular todo o los ultimos 100
-    # En producción esto debería ser más selectivo
-    pass 
-
-def run_hybrid_clustering(conn):
+    # Si el producto ya estaba en otro cluster (ON CONFLICT), el origen se descuenta
+    cluster_metrics.assign_membership(cur, pid, cluster_id, confidence, method)
+
+def current_cluster_of(cur, candidate_pid):
+    """
+    Cluster ACTUAL del candidato (el índice en memoria puede tener un cluster_id
+    desactualizado si el Cluster Lab movió/incineró al candidato). None si ya no tiene.
+    """
+    cur.execute("SELECT cluster_id FROM product_cluster_membership WHERE product_id = %s", (candidate_pid,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def exact_fast_path(cur, index, concept, group, config, writer):
+    """
+    Etapa previa al grafo: los objetivos con el mismo SKU normalizado o la misma imagen
+    (sha256) que un miembro existente se unen directo a ese cluster (EXACT_SKU / EXACT_IMAGE).
+    Retorna: (objetivos restantes para el camino híbrido, unidos por fast path)
+    """
+    matches = exact_matches(cur, concept, [(row[0], row[7], row[8]) for row in group])
+    if not matches:
+        return group, 0
+    rest = []
+    for row in group:
+        match = matches.get(row[0])
+        if match is None:
+            rest.append(row)
+            continue
+        cluster_id, method, anchor = match
+        add_to_cluster(cur, cluster_id, row[0], method, 1.0)
+        index.add(concept, row[0], cluster_id, row[1], row[4], row[3], row[6])
+        log_decision(writer, row[0], anchor, None, None, 1.0, "MATCH", method, config)
+    return rest, len(group) - len(rest)
+
+def cluster_concept_batch(cur, index, concept, group, config, writer, timings):
+    """
+    Clustering de los objetivos de UN concepto como grafo:
+    1. Aristas objetivo -> miembros existentes (índice en memoria del concepto).
+    2. Aristas objetivo <-> objetivo (matriz de similitud visual del lote, top-k por fila).
+    3. Union-find sobre los matches entre objetivos; cada componente se une al cluster existente
+       con la mejor arista, o crea uno nuevo cuyo representante es el objetivo más conectado.
+    Retorna: (unidos, nuevos)
+    """
+    t0 = time.perf_counter()
+    n = len(group)
+    pids = [row[0] for row in group]
+    titles = [row[1] for row in group]
+    images = [row[4] for row in group]
+    text_vecs = [row[6] for row in group]
+    vectors = np.stack([as_vector(row[3]) for row in group])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    existing = [index.search(cur, concept, vectors[i], k=CANDIDATES_PER_TARGET, exclude_id=pids[i]) for i in range(n)]
+
+    # Vecinos dentro del lote (excluyendo a sí mismo)
+    k_intra = min(CANDIDATES_PER_TARGET, n - 1)
+    intra = [[] for _ in range(n)]
+    if k_intra > 0:
+        sims = vectors @ vectors.T
+        np.fill_diagonal(sims, -np.inf)
+        top = np.argpartition(-sims, k_intra - 1, axis=1)[:, :k_intra]
+        for i in range(n):
+            intra[i] = [(int(j), float(sims[i, j])) for j in top[i]]
+    t1 = time.perf_counter()
+    timings["knn"] += t1 - t0
+
+    uf = UnionFind(n)
+    best_existing = [None] * n # (final_score, method, candidate_pid)
+    best_edge = [None] * n # (final_score, method) mejor match propio (existente o del lote)
+    degree = [0] * n
+    seen_pairs = set()
+
+    def register(i, is_match, method, final_score):
+        if is_match and (best_edge[i] is None or final_score > best_edge[i][0]):
+            best_edge[i] = (final_score, method)
+
+    for i in range(n):
+        # --- Contra miembros existentes ---
+        cands = existing[i]
+        scores_text = text_scores(titles[i], text_vecs[i], [c[1] for c in cands], [c[5] for c in cands])
+        for (c_pid, c_title, c_image, _, dist, _), text_score in zip(cands, scores_text):
+            visual_score = max(0, 1.0 - float(dist))
+            text_score = float(text_score)
+            is_match, method, final_score = evaluate_pair(config, visual_score, text_score)
+            if is_match or final_score > 0.5:
+                log_decision(writer, pids[i], c_pid, visual_score, text_score, final_score,
+                             "MATCH" if is_match else "REJECT", method, config)
+            register(i, is_match, method, final_score)
+            if is_match and (best_existing[i] is None or final_score > best_existing[i][0]):
+                best_existing[i] = (final_score, method, c_pid)
+
+        # --- Contra otros objetivos del lote (cada par se evalúa una sola vez) ---
+        pairs = [(j, sim) for j, sim in intra[i] if (min(i, j), max(i, j)) not in seen_pairs]
+        seen_pairs.update((min(i, j), max(i, j)) for j, _ in pairs)
+        scores_text = text_scores(titles[i], text_vecs[i], [titles[j] for j, _ in pairs], [text_vecs[j] for j, _ in pairs])
+        for (j, sim), text_score in zip(pairs, scores_text):
+            visual_score = max(0, sim)
+            text_score = float(text_score)
+            is_match, method, final_score = evaluate_pair(config, visual_score, text_score)
+            if is_match or final_score > 0.5:
+                log_decision(writer, pids[i], pids[j], visual_score, text_score, final_score,
+                             "MATCH" if is_match else "REJECT", method, config)
+            register(i, is_match, method, final_score)
+            register(j, is_match, method, final_score)
+            if is_match:
+                uf.union(i, j)
+                degree[i] += 1
+                degree[j] += 1
+    t2 = time.perf_counter()
+    timings["scoring"] += t2 - t1
+
+    # --- Acción Final por componente ---
+    count_joined = 0
+    count_new = 0
+    for members in uf.groups():
+        cluster_id = None
+        anchors = sorted((best_existing[i] for i in members if best_existing[i]), reverse=True)
+        for _, _, c_pid in anchors:
+            cluster_id = current_cluster_of(cur, c_pid)
+            if cluster_id:
+                break
+
+        if cluster_id:
+            pending = members
+        else:
+            # Crear nuevo cluster con el objetivo más conectado como representante
+            rep = max(members, key=lambda i: (degree[i], -i))
+            cluster_id = create_cluster(cur, pids[rep], "LOW_DATA")
+            index.add(concept, pids[rep], cluster_id, titles[rep], images[rep], vectors[rep], text_vecs[rep])
+            count_new += 1
+            pending = [i for i in members if i != rep]
+
+        for i in pending:
+            final_score, method = best_edge[i]
+            add_to_cluster(cur, cluster_id, pids[i], audit_reason(method, final_score), final_score)
+            # El nuevo miembro ya es candidato para los siguientes objetivos
+            index.add(concept, pids[i], cluster_id, titles[i], images[i], vectors[i], text_vecs[i])
+            count_joined += 1
+    timings["writes"] += time.perf_counter() - t2
+
+    return count_joined, count_new
+
+def run_hybrid_clustering(conn, index=None, writer=None, shard=0, n_shards=1):
+    """
+    Un ciclo de clustering. `index` (ConceptVectorIndex) y `writer` (DecisionLogWriter)
+    deben vivir entre ciclos: el índice no reconstruye las matrices de cada concepto y el
+    escritor persiste las decisiones en segundo plano.
+    Con `n_shards` > 1 el proceso solo toma los conceptos con hash(concepto) mod n_shards == shard:
+    cada concepto tiene un único dueño, así el resultado es el mismo que el de un proceso serial.
+    Todo el lote se confirma en una sola transacción (commit del Command).
+    Retorna: productos procesados (0 = cola vacía).
+    """
+    if index is None:
+        index = ConceptVectorIndex()
     cur = conn.cursor()
+    timings = {}
+    t0 = time.perf_counter()
     
-    # 1. Configuración cargada bajo demanda por producto
-    # CONFIG = load_config(cur) # <-- REMOVED GLOBAL LOAD
-    
-    # 2. Obtener productos SIN cluster pero CON vector y CON concepto (Agent 1 Ready)
-    # limitamos a 50 por ciclo para no bloquear
+    # 1. Obtener productos SIN cluster pero CON vector y CON concepto (Agent 1 Ready)
+    #    Carril prioritario (priority_score) + carril de backfill (core.priority)
     sql_targets = """
-        SELECT p.product_id, p.title, p.sale_price, pe.embedding_visual, p.url_image_s3, p.taxonomy_concept
+        SELECT p.product_id, p.title, p.sale_price, pe.embedding_visual, p.url_image_s3, p.taxonomy_concept, pe.embedding_text,
+               p.sku, pe.image_digest
         FROM products p
         JOIN product_embeddings pe ON p.product_id = pe.product_id
         LEFT JOIN product_cluster_membership pcm ON p.product_id = pcm.product_id
         WHERE pcm.cluster_id IS NULL 
         AND pe.embedding_visual IS NOT NULL
         AND p.taxonomy_concept IS NOT NULL
-        LIMIT 50
+        AND (hashtext(p.taxonomy_concept) & 2147483647) %% %s = %s
     """
-    cur.execute(sql_targets)
-    targets = cur.fetchall()
+    # Dentro del lote, por concepto (un bucket por grupo) como antes
+    targets = sorted(two_lane_fetch(cur, sql_targets, (n_shards, shard), BATCH_SIZE), key=lambda row: (row[5], row[0]))
+    timings["targets"] = time.perf_counter() - t0
     
     if not targets:
         logger.info("✨ No hay productos clasificados pendientes. Esperando al Taxonomist...")
         cur.close()
-        return
+        return 0
+
+    logger.info(f"⚡ Procesando {len(targets)} productos con Lógica Híbrida (Bucket Strategy + Union-Find)...")
+
+    # 2. Personalidades Dinámicas de todos los conceptos (una sola query)
+    t0 = time.perf_counter()
+    configs = load_all_configs(cur)
+    timings["config"] = time.perf_counter() - t0
 
-    logger.info(f"⚡ Procesando {len(targets)} productos con Lógica Híbrida (Bucket Strategy)...")
+    groups = {}
+    for row in targets:
+        groups.setdefault(row[5], []).append(row)
     
+    owns_writer = writer is None
+    if owns_writer:
+        writer = DecisionLogWriter()
+
     count_joined = 0
     count_new = 0
+    count_exact = 0
+    logged_before = writer.counts["queued"]
+    timings["exact"] = 0.0
+    timings["knn"] = 0.0
+    timings["scoring"] = 0.0
+    timings["writes"] = 0.0
 
-    for row in targets:
-        pid, title, price, vector, img_a, concept = row
-        
-        # 1.5 Cargar Personalidad Dinámica para este concepto
-        CONFIG = load_config(cur, concept_name=concept)
-        
-        # 3. Buscar Candidatos (Vector Search RESTRINGIDO al Bucket)
-        # Solo buscamos items que sean del mismo concepto taxonómico
-        sql_candidates = """
-            SELECT 
-                p.product_id, p.title, p.url_image_s3,
-                pcm.cluster_id,
-                (pe.embedding_visual <=> %s) as distance
-            FROM product_embeddings pe
-            JOIN products p ON pe.product_id = p.product_id
-            JOIN product_cluster_membership pcm ON p.product_id = pcm.product_id
-            WHERE pe.product_id != %s
-            AND p.taxonomy_concept = %s  -- <-- OPTIMIZACIÓN CRÍTICA (Nivel 2)
-            ORDER BY distance ASC
-            LIMIT 5
-        """
-        cur.execute(sql_candidates, (vector, pid, concept))
-        raw_candidates = cur.fetchall()
-        
-        best_score = 0.0
-        best_match = None
-        match_reason = "NONE"
-        
-        for cand in raw_candidates:
-            c_pid, c_title, c_image, c_cluster_id, dist = cand
-            
-            # 4. Calcular Scores
-            visual_score = max(0, 1.0 - float(dist))
-            text_score = SequenceMatcher(None, str(title).lower(), str(c_title).lower()).ratio()
-            
-            final_score = (CONFIG['weight_visual'] * visual_score) + (CONFIG['weight_text'] * text_score)
-            
-            # Lógica de "Rescate"
-            method = "REJECTED"
-            is_match = False
-            
-            if final_score >= CONFIG['threshold_hybrid']:
-                method = "HYBRID_MATCH"
-                is_match = True
-            elif visual_score >= 0.92: # Muy parecidos visualmente
-                method = "VISUAL_Rescue"
-                is_match = True
-                final_score = max(final_score, visual_score) # Boost score
-            elif text_score >= CONFIG['threshold_text_rescue'] and visual_score > 0.6:
-                method = "TEXT_Rescue"
-                is_match = True
-                final_score = max(final_score, text_score)
-            
-            # Loguear decisión (incluso los rejected para debug)
-            # Solo guardamos el mejor log o muestreamos para no llenar la DB?
-            # Por ahora guardamos todo "intento serio"
-            if is_match or final_score > 0.5:
-                 log_decision(pid, c_pid, visual_score, text_score, final_score, 
-                              "MATCH" if is_match else "REJECT", 
-                              method, title, c_title, CONFIG, img_a, c_image)
-
-            if is_match and final_score > best_score:
-                best_score = final_score
-                best_match = {
-                    "cluster_id": c_cluster_id,
-                    "title": c_title,
-                    "image": c_image
-                }
-                match_reason = method
-                
-                # REGLA DE AUDITORÍA INTELIGENTE:
-                # Si es un match, pero no es abrumadoramente obvio (ej: >0.95), márcarlo como "Duda" para auditoría humana.
-                # Auto-Pilot: Score > 0.85
-                # Human-Review: 0.65 < Score < 0.85 (Zona Gris)
-                if final_score < 0.85:
-                    match_reason = "NEEDS_AUDIT"
-
-        # 5. Acción Final
-        if best_match:
-            add_to_cluster(cur, best_match['cluster_id'], pid, match_reason, best_score)
-            count_joined += 1
-        else:
-            # Crear nuevo cluster con 1 solo miembro
-            create_cluster(cur, pid, "LOW_DATA", price)
-            count_new += 1
+    # 3. Cada concepto es un grafo independiente
+    for concept, group in groups.items():
+        if not lock_concept(cur, concept):
+            # Otro proceso tocó el concepto: su bucket en memoria y nuestra lista están viejos
+            index.invalidate(concept)
+            group = still_pending(cur, group)
+            if not group:
+                continue
+        config = config_for(configs, concept)
+        t_exact = time.perf_counter()
+        group, exact = exact_fast_path(cur, index, concept, group, config, writer)
+        timings["exact"] += time.perf_counter() - t_exact
+        count_exact += exact
+        if not group:
+            continue
+        joined, new = cluster_concept_batch(cur, index, concept, group, config, writer, timings)
+        count_joined += joined
+        count_new += new
+
+    # 4. Auditoría: las decisiones ya están en la cola del escritor asíncrono
+    n_logs = writer.counts["queued"] - logged_before
+    if owns_writer:
+        writer.close()
             
-    logger.info(f"   📊 Resultado Ciclo: {count_joined} unidos, {count_new} nuevos clusters.")
+    logger.info(f"   📊 Resultado Ciclo: {count_joined} unidos, {count_new} nuevos clusters, {n_logs} decisiones ({len(groups)} conceptos).")
+    logger.info(f"   🎯 Fast path exacto (SKU/imagen): {count_exact}/{len(targets)} ({count_exact / len(targets):.1%}) sin KNN.")
+    logger.info("   ⏱️ Fases (ms): " + " | ".join(f"{k}={v * 1000:.1f}" for k, v in timings.items()))
+    log_stats = writer.stats()
+    logger.info(
+        f"   📝 Decision logs: {log_stats.get('written', 0)} escritas, {log_stats.get('sampled_out', 0)} fuera de muestra, "
+        f"{log_stats.get('dropped', 0)} descartadas, {log_stats['pending']} en cola."
+    )
+    stats = index.stats()
+    logger.info(f"   🧮 Índice en memoria: {stats['concepts']} conceptos, {stats['vectors']} vectores, {stats['clusters']} centroides.")
+    # Despertar al market agent (se entrega con el commit del Command)
+    notify(cur, CLUSTERS_UPDATED, count_new)
+    cur.close()
+    return len(targets)
+
+def run_partition_maintenance(conn):
+    """Particiones mensuales de cluster_decision_logs: crea las próximas y aplica la retención."""
+    cur = conn.cursor()
+    result = maintain_partitions(cur)
+    cur.close()
+    if result["created"] or result["dropped"] or result["purged_default"]:
+        logger.info(
+            f"🗂️ Decision logs: particiones creadas {result['created']}, eliminadas {result['dropped']}, "
+            f"{result['purged_default']} filas vencidas en DEFAULT."
+        )
+
+def run_centroid_merge(conn, index, shard=0, n_shards=1):
+    """Job periódico: fusiona clusters cuyos centroides convergieron (ver core.clustering), solo conceptos del shard."""
+    cur = conn.cursor()
+    stats = merge_converged_clusters(cur, shard=shard, n_shards=n_shards)
+    cur.close()
+    # Los miembros cambiaron de cluster en la DB: esos buckets se recargan en el próximo ciclo
+    for concept in stats["concepts"]:
+        index.invalidate(concept)
+    logger.info(
+        f"🧲 Merge de centroides: {stats['groups']} grupos ({len(stats['concepts'])} conceptos), "
+        f"{stats['absorbed']} clusters absorbidos, huérfanos {stats['orphans_before']} -> {stats['orphans_after']}."
+    )
+
+def run_reevaluation(conn, index, shard=0, n_shards=1):
+    """Job periódico: re-puntúa las membresías dudosas de los conceptos cuyos pesos cambió el ai_trainer."""
+    cur = conn.cursor()
+    stale = stale_concepts(cur, shard, n_shards)
+    if stale:
+        configs = load_all_configs(cur)
+    for concept, watermark in stale:
+        if not lock_concept(cur, concept):
+            index.invalidate(concept)
+        stats = reevaluate_concept(cur, index, concept, config_for(configs, concept))
+        mark_reevaluated(cur, concept, watermark)
+        logger.info(
+            f"♻️ Re-evaluación '{concept}' (pesos nuevos): {stats['evaluated']} evaluadas, {stats['confirmed']} confirmadas "
+            f"({stats['relabelled']} reetiquetadas), {stats['moved']} movidas, {stats['split']} separadas."
+        )
     cur.close()
 
 # ─────── COMMAND ───────
 
+def serve(shard=0, n_shards=1):
+    """
+    Loop del daemon para un shard. Cada shard corre el merge de centroides de sus conceptos;
+    el shard 0 además mantiene las particiones.
+    """
+    index = ConceptVectorIndex()
+    writer = DecisionLogWriter()
+    last_merge = time.monotonic()
+    last_partition_check = None
+    last_reeval = None
+    # Despierta cuando el classifier etiqueta productos (el timeout es solo red de seguridad)
+    listener = PipelineListener(PRODUCTS_CLASSIFIED, connect=get_db_connection)
+    if n_shards > 1:
+        logger.info(f"🧩 Worker {shard + 1}/{n_shards} iniciado (conceptos con hash mod {n_shards} = {shard}).")
+    while True:
+        conn = get_db_connection()
+        if conn:
+            try:
+                if shard == 0 and (last_partition_check is None or time.monotonic() - last_partition_check > PARTITION_INTERVAL):
+                    run_partition_maintenance(conn)
+                    conn.commit()
+                    last_partition_check = time.monotonic()
+                processed = run_hybrid_clustering(conn, index, writer, shard, n_shards)
+                conn.commit()
+                if REEVAL_INTERVAL and (last_reeval is None or time.monotonic() - last_reeval > REEVAL_INTERVAL):
+                    run_reevaluation(conn, index, shard, n_shards)
+                    conn.commit()
+                    last_reeval = time.monotonic()
+                if MERGE_INTERVAL and time.monotonic() - last_merge > MERGE_INTERVAL:
+                    run_centroid_merge(conn, index, shard, n_shards)
+                    conn.commit()
+                    last_merge = time.monotonic()
+                conn.close()
+                # Con trabajo: siguiente lote de inmediato. Cola vacía: esperar aviso.
+                if not processed:
+                    listener.wait()
+            except Exception as e:
+                logger.error(f"❌ Error CRITICO: {e}")
+                # El ciclo no se confirmó: el índice puede tener miembros que no existen en la DB
+                index.clear()
+                import traceback
+                traceback.print_exc()
+                time.sleep(10)
+        else:
+            logger.error("⚠️ DB Unreachable, retrying...")
+            time.sleep(10)
+
 class Command(BaseCommand):
     help = 'Product Clusterizer Daemon V3'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Procesos en paralelo; cada uno es dueño de los conceptos con hash mod N = i')
+
     def handle(self, *args, **options):
         self.stdout.write("🚀 INICIANDO CLUSTERIZER HÍBRIDO (REPARADO)...")
+        n_workers = max(1, options['workers'])
+        if n_workers == 1:
+            serve()
+            return
+
+        connections.close_all() # cada worker abre sus propias conexiones
+        ctx = multiprocessing.get_context("fork")
+        workers = {}
         while True:
-            conn = get_db_connection()
-            if conn:
-                try:
-                    run_hybrid_clustering(conn)
-                    conn.commit()
-                    conn.close()
-                    # Dormir un poco pero no tanto
-                    time.sleep(10) 
-                except Exception as e:
-                    self.stderr.write(f"❌ Error CRITICO: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    time.sleep(10)
-            else:
-                self.stderr.write("⚠️ DB Unreachable, retrying...")
-                time.sleep(10)
+            # Supervisor: (re)lanza los workers caídos
+            for shard in range(n_workers):
+                proc = workers.get(shard)
+                if proc is None or not proc.is_alive():
+                    if proc is not None:
+                        self.stderr.write(f"⚠️ Worker {shard} terminó (exit {proc.exitcode}). Reiniciando...")
+                    proc = ctx.Process(target=serve, args=(shard, n_workers), name=f"clusterizer-{shard}", daemon=True)
+                    proc.start()
+                    workers[shard] = proc
+            time.sleep(10)
@@ -0,0 +1,116 @@
+"""
+Comparativa de Scores de Texto (Django Command).
+Evalúa SequenceMatcher (legacy), el kernel difuso calibrado y el producto punto de embedding_text
+(crudo y llevado a la escala legacy, que es el que ve evaluate_pair) sobre los pares auditados
+por humanos en ai_feedback (Cluster Lab). El mejor umbral de las filas calibradas es comparable
+directamente con threshold_hybrid / threshold_text_rescue.
+"""
+
+import time
+from difflib import SequenceMatcher
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.ai_utils import as_vector
+from core.text_similarity import calibrate, title_similarity
+
+
+def feedback_labels(decisions, feedbacks):
+    """
+    Ground truth por par: ¿son el mismo producto?
+    MATCH + CORRECT -> 1 | MATCH + INCORRECT -> 0 | REJECT + CORRECT -> 0 | REJECT + INCORRECT -> 1
+    (Misma tabla de verdad que usa el AI Trainer.)
+    """
+    machine_match = np.isin(decisions, ['MATCH', 'CANDIDATE'])
+    human_agrees = np.asarray(feedbacks) == 'CORRECT'
+    return (machine_match == human_agrees).astype(np.int8)
+
+
+def roc_auc(scores, labels):
+    """AUC por rangos (Mann-Whitney U). Retorna NaN si solo hay una clase."""
+    pos = labels == 1
+    n_pos, n_neg = pos.sum(), (~pos).sum()
+    if n_pos == 0 or n_neg == 0:
+        return float('nan')
+    order = scores.argsort(kind='mergesort')
+    ranks = np.empty(len(scores), dtype=np.float64)
+    ranks[order] = np.arange(1, len(scores) + 1)
+    # Empates: rango promedio
+    _, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=ranks)
+    ranks = (sums / counts)[inverse]
+    return float((ranks[pos].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def best_threshold(scores, labels):
+    """Umbral que maximiza accuracy (barrido vectorizado sobre todos los scores únicos)."""
+    thresholds = np.unique(scores)
+    predictions = scores[None, :] >= thresholds[:, None]
+    accuracy = (predictions == labels[None, :].astype(bool)).mean(axis=1)
+    idx = int(accuracy.argmax())
+    return float(thresholds[idx]), float(accuracy[idx])
+
+
+class Command(BaseCommand):
+    help = 'Compara precisión de SequenceMatcher vs embeddings de texto usando AIFeedback'
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cur:
+            cur.execute("""
+                SELECT f.decision, f.feedback,
+                       pa.title, pb.title,
+                       ea.embedding_text, eb.embedding_text
+                FROM ai_feedback f
+                JOIN products pa ON pa.product_id = f.product_id
+                JOIN products pb ON pb.product_id = f.candidate_id
+                JOIN product_embeddings ea ON ea.product_id = f.product_id
+                JOIN product_embeddings eb ON eb.product_id = f.candidate_id
+                WHERE ea.embedding_text IS NOT NULL
+                AND eb.embedding_text IS NOT NULL
+            """)
+            rows = cur.fetchall()
+
+        if not rows:
+            self.stdout.write("⚠️ No hay pares con feedback y embedding_text en ambos lados. Corre el vectorizer primero.")
+            return
+
+        labels = feedback_labels([r[0] for r in rows], [r[1] for r in rows])
+
+        t0 = time.perf_counter()
+        difflib_scores = np.array([
+            SequenceMatcher(None, str(a).lower(), str(b).lower()).ratio() for _, _, a, b, _, _ in rows
+        ])
+        t_difflib = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        fuzzy_scores = np.concatenate([title_similarity(a, [b]) for _, _, a, b, _, _ in rows])
+        t_fuzzy = time.perf_counter() - t0
+
+        vec_a = np.stack([as_vector(r[4]) for r in rows])
+        vec_b = np.stack([as_vector(r[5]) for r in rows])
+        t0 = time.perf_counter()
+        embedding_scores = np.clip(np.einsum('ij,ij->i', vec_a, vec_b), 0.0, 1.0)
+        t_embedding = time.perf_counter() - t0
+
+        self.stdout.write(f"\n📊 COMPARATIVA TEXTO (N={len(rows)} pares, {int(labels.sum())} positivos)\n")
+        self.stdout.write(f"{'MÉTODO':<16} | {'AUC':>6} | {'MEJOR UMBRAL':>12} | {'ACCURACY':>8} | {'µs/par':>8}")
+        self.stdout.write("-" * 64)
+        methods = [
+            ("SequenceMatcher", difflib_scores, t_difflib),
+            ("Fuzzy calibrado", fuzzy_scores, t_fuzzy),
+            ("Embedding dot", embedding_scores, t_embedding),
+        ]
+        calibrated = calibrate(embedding_scores, "embedding")
+        if calibrated is not None:
+            methods.append(("Emb. calibrado", calibrated, t_embedding))
+        for name, scores, elapsed in methods:
+            threshold, accuracy = best_threshold(scores, labels)
+            self.stdout.write(
+                f"{name:<16} | {roc_auc(scores, labels):>6.3f} | {threshold:>12.3f} | "
+                f"{accuracy * 100:>7.1f}% | {elapsed / len(rows) * 1e6:>8.1f}"
+            )
+        if calibrated is None:
+            self.stdout.write("\n⚠️ Sin calibración 'embedding': text_scores usa el kernel difuso. "
+                              "Corre calibrate_text_similarity.")
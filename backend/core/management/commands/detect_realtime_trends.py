@@ -4,7 +4,7 @@ from django.core.management.base import BaseCommand
 from django.db.models import F
 from core.models import MarketIntelligenceLog, Category
 from core.ai_utils import encode_text, encode_batch
-from core.ai_classifier import classify_term # El Taxónomo
+from core.ai_classifier import classify_terms # El Taxónomo
 from pytrends.request import TrendReq
 from sentence_transformers import util
 
@@ -61,6 +61,12 @@ class Command(BaseCommand):
             # Si tenemos categorías, calculamos similitud
             if cat_embeddings is not None:
                 cosine_scores = util.cos_sim(trend_embeddings, cat_embeddings)
+
+            # --- El Taxónomo Entra en Acción ---
+            # Clasificamos TODAS las tendencias de una vez (llamadas concurrentes a Ollama),
+            # independientemente de si hicieron match: esto nos permite descubrir NUEVOS Conceptos
+            logger.info(f"   🤔 Classifying {len(raw_trends)} trends (Llama 3.1)...")
+            taxonomies = classify_terms(raw_trends)
             
             for i, trend in enumerate(raw_trends):
                 matched_category_name = "New/Unknown"
@@ -73,11 +79,7 @@ class Command(BaseCommand):
                     if reliability > 0.35:
                         matched_category_name = categories[best_idx.item()]['name']
 
-                # --- El Taxónomo Entra en Acción ---
-                # Clasificamos la tendencia independientemente de si hizo match
-                # Esto nos permite descubrir NUEVOS Conceptos
-                logger.info(f"   🤔 Classifying '{trend}'...")
-                taxonomy_data = classify_term(trend) # Llama 3.1
+                taxonomy_data = taxonomies[i]
                 
                 if not taxonomy_data:
                     logger.warning(f"   ⚠️ Classifier failed for {trend}")
@@ -0,0 +1,48 @@
+"""
+Servicio de Embeddings (Django Command).
+Proceso único que mantiene SigLIP en memoria y atiende a todos los consumidores por IPC.
+"""
+
+import sys
+import logging
+import pathlib
+from django.core.management.base import BaseCommand, CommandError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from core.embedding_service import EmbeddingServer, EmbeddingServiceError, SERVICE_HOST, SERVICE_PORT, require_authkey
+
+# ─────── Configuración de Logs ───────
+LOG_DIR = pathlib.Path("/app/logs")
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+logger = logging.getLogger("embedding_service")
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+
+if not logger.handlers:
+    fh = logging.FileHandler(LOG_DIR / "embedding_service.log", encoding='utf-8')
+    fh.setFormatter(formatter)
+    logger.addHandler(fh)
+
+    ch = logging.StreamHandler(sys.stdout)
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+
+class Command(BaseCommand):
+    help = 'Shared SigLIP Embedding Service (IPC + micro-batching)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=SERVICE_HOST, help='Interfaz de escucha (0.0.0.0 en Docker)')
+        parser.add_argument('--port', type=int, default=SERVICE_PORT)
+
+    def handle(self, *args, **options):
+        try:
+            require_authkey()
+        except EmbeddingServiceError as e:
+            raise CommandError(f"❌ {e}. Definirla en .env / .env.docker (misma clave en los clientes).")
+        self.stdout.write("🚀 EMBEDDING SERVICE INICIADO")
+        server = EmbeddingServer(host=options['host'], port=options['port'])
+        server.serve_forever()
@@ -10,8 +10,12 @@ import time
 from django.core.management.base import BaseCommand
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import InterfaceError, OperationalError
 from sqlalchemy.orm import sessionmaker
 
+from core.pipeline_events import PRODUCTS_LOADED, notify
+from core.priority import PRODUCT_PRIORITY_SQL
+
 load_dotenv()
 
 # ─────── Configuración de Logs ───────
@@ -32,6 +36,12 @@ logger.addHandler(ch)
 
 # Modificado para apuntar a la ruta correcta en Docker
 RAW_DIR = pathlib.Path(os.getenv("RAW_DIR", "/app/raw_data"))
+# El scraper escribe archivos (no la DB): se revisa el tamaño de cada .jsonl con este intervalo
+# y solo se ingieren las líneas nuevas desde el último offset procesado.
+POLL_INTERVAL = int(os.getenv("LOADER_POLL_INTERVAL", "5"))
+# Un error de conexión / deadlock (transitorio) detiene el archivo en esa línea: se reintenta
+# en la próxima pasada. Un registro inválido (JSON, datos) se omite y el offset avanza.
+TRANSIENT_DB_ERRORS = (OperationalError, InterfaceError)
 
 class Command(BaseCommand):
     help = 'ETL Loader Daemon'
@@ -41,18 +51,36 @@ class Command(BaseCommand):
         
         # Setup DB connection once (or Reconnect on fail)
         session = self.get_session()
+        offsets = {} # archivo -> bytes ya ingeridos (al reiniciar se re-procesa todo: upserts idempotentes)
+        # archivo -> tamaño en la última pasada COMPLETA (una línea a medio escribir no se re-lee en
+        # cada pasada; un archivo que falló no se registra y se reintenta aunque no crezca)
+        sizes = {}
+        idle_logged = False
         
         while True:
             try:
                 files = list(RAW_DIR.glob("*.jsonl"))
-                if not files:
-                    logger.info("⏳ Sin archivos. Esperando 60s...")
+                changed = []
+                for f in files:
+                    size = f.stat().st_size
+                    if size > offsets.get(f, 0) and size != sizes.get(f):
+                        changed.append((f, size))
+                if not changed:
+                    if not idle_logged:
+                        logger.info(f"⏳ Sin datos nuevos. Revisando cada {POLL_INTERVAL}s...")
+                        idle_logged = True
                 else:
-                    for f in files:
-                        self.process_file(f, session)
+                    idle_logged = False
+                    for f, size in changed:
+                        offsets[f], loaded, complete = self.process_file(f, session, offsets.get(f, 0))
+                        if loaded:
+                            # Despertar al vectorizer (se entrega al commit)
+                            notify(session.connection().connection.cursor(), PRODUCTS_LOADED, loaded)
+                            session.commit()
+                        if complete:
+                            sizes[f] = size
                 
-                logger.info("💤 Durmiendo 60 segundos...")
-                time.sleep(60)
+                time.sleep(POLL_INTERVAL)
 
             except KeyboardInterrupt:
                 break
@@ -74,10 +102,18 @@ class Command(BaseCommand):
         Session = sessionmaker(bind=engine)
         return Session()
 
-    def process_file(self, filepath, session):
-        logger.info(f"📂 Procesando: {filepath.name}")
+    def process_file(self, filepath, session, offset=0):
+        """
+        Ingiere las líneas completas desde `offset` (bytes). Una línea sin '\\n' final
+        (el scraper la está escribiendo) queda para la próxima pasada.
+        Ante un error transitorio de DB (TRANSIENT_DB_ERRORS) se detiene: el offset queda al
+        inicio de esa línea para reintentarla.
+        Retorna: (nuevo offset, registros insertados/actualizados, si el archivo se procesó completo)
+        """
+        logger.info(f"📂 Procesando: {filepath.name} (desde byte {offset})")
         
         stats = {"total": 0, "inserted": 0, "updated": 0, "error": 0}
+        complete = False
         error_types = {}  # Contador de tipos de error
         error_samples = []  # Primeros 10 errores para debugging
         success_samples = []  # Primeros 5 registros exitosos
@@ -92,11 +128,19 @@ class Command(BaseCommand):
              encoding_strategy = 'latin-1'
 
         try:
-            with open(filepath, 'r', encoding=encoding_strategy, errors='replace') as f:
-                for line in f:
-                    if not line.strip(): continue
+            with open(filepath, 'rb') as f:
+                f.seek(offset)
+                for raw_line in f:
+                    if not raw_line.endswith(b"\n"):
+                        complete = True # Línea a medio escribir: el resto llega cuando el archivo crezca
+                        break
+                    line = raw_line.decode(encoding_strategy, errors='replace')
+                    if not line.strip():
+                        offset += len(raw_line)
+                        continue
                     stats["total"] += 1
                     
+                    record = None
                     try:
                         record = json.loads(line)
                         was_insert = self.ingest_record(record, session)
@@ -122,6 +166,13 @@ class Command(BaseCommand):
                         if (stats["inserted"] + stats["updated"]) % 100 == 0: 
                             self.print_batch_summary(filepath.name, stats)
                             
+                    except TRANSIENT_DB_ERRORS as e:
+                        # Conexión caída / deadlock: el registro no se pierde, el offset queda en esta
+                        # línea y la próxima pasada la reintenta
+                        session.rollback()
+                        stats["total"] -= 1
+                        logger.warning(f"⚠️ Error transitorio de DB en {filepath.name} (byte {offset}): {e}. Se reintentará.")
+                        break
                     except Exception as e:
                         # Contar tipo de error
                         error_type = type(e).__name__
@@ -150,6 +201,10 @@ class Command(BaseCommand):
                         session.rollback()
                         # Ya no necesitamos commit aquí porque cada registro exitoso
                         # hace su propio commit, iniciando automáticamente una nueva transacción
+                    # Registro ingerido u omitido por datos inválidos (permanente): avanzar
+                    offset += len(raw_line)
+                else:
+                    complete = True
 
             session.commit()
             self.print_batch_summary(filepath.name, stats, final=True)
@@ -180,6 +235,8 @@ class Command(BaseCommand):
         except Exception as e:
             logger.error(f"❌ Error fatal en archivo {filepath.name}: {e}")
 
+        return offset, stats["inserted"] + stats["updated"], complete
+
     def print_batch_summary(self, filename, stats, final=False):
         """Imprime una tabla bonita en el log"""
         icon = "🏁" if final else "📦"
@@ -287,5 +344,11 @@ class Command(BaseCommand):
                         VALUES (:pid, :wid, :qty)
                     """), {"pid": prod_id, "wid": wh_id, "qty": qty})
                 except: pass
+
+            # --- 5. Prioridad (margen + stock + recencia) para las colas de los daemons ---
+            session.execute(text(f"""
+                UPDATE products p SET priority_score = {PRODUCT_PRIORITY_SQL}
+                WHERE p.product_id = :pid
+            """), {"pid": prod_id})
         
         return was_insert
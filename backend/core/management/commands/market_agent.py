@@ -4,13 +4,13 @@ import time
 import requests
 import numpy as np
 import logging
-fromPIL import Image
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
 from django.db.models import Q
 from core.models import UniqueProductCluster, ProductEmbedding
-from transformers import CLIPProcessor, CLIPModel
-import torch
+from core.embedding_service import get_client, EmbeddingServiceError
+from core.pipeline_events import PipelineListener, CLUSTERS_UPDATED
+from core.priority import dequeue
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,33 +32,33 @@ MELI_API_URL = f"https://api.mercadolibre.com/sites/{MELI_SITE}/search"
 class Command(BaseCommand):
     help = 'Agent 3: Market Validator (MercadoLibre/External). Filters visually similar competitors.'
 
-    def __init__(self):
-        super().__init__()
-        # Load AI Model (Reusing CLIP logic for visual filtering)
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info(f"🧠 MarketAgent Loading CLIP ({self.device})...")
-        self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(self.device)
-        self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-        logger.info("✅ CLIP Loaded.")
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Visual filtering via the shared SigLIP embedding service:
+        # same vector space (1152d) as product_embeddings, no local model copy.
+        self.embedder = get_client()
 
     def handle(self, *args, **options):
         logger.info("🕵️ MARKET AGENT STARTED")
+        # Despierta cuando el clusterizer confirma clusters (el timeout es solo red de seguridad)
+        listener = PipelineListener(CLUSTERS_UPDATED)
         
         while True:
             # 1. Fetch Candidates (Clusters already classified LOW/MID competition in Dropi)
             # Logic: We only validate clusters that have low competition internally (meaning they passed the first funnel)
             # and haven't been fully analyzed externally (market_opportunity_score = 0 or analysis_level < 1)
-            candidates = UniqueProductCluster.objects.filter(
+            # Highest priority_score first (margin + cluster size + recency), plus a backfill lane (core.priority)
+            candidates = dequeue(UniqueProductCluster.objects.filter(
                 dropi_competition_tier__in=['LOW', 'MID'], 
                 # Avoid re-scanning constantly. 
                 # Ideally, we flag them as 'ANALYZED_EXTERNALLY' or use a timestamp.
                 # For now, let's use market_opportunity_score == 0 as "pending"
                 market_opportunity_score=0 
-            ).order_by('-created_at')[:10]
+            ), 10)
 
-            if not candidates.exists():
-                logger.info("💤 No candidates to validate. Sleeping 60s...")
-                time.sleep(60)
+            if not candidates:
+                logger.info("💤 No candidates to validate. Waiting for new clusters (LISTEN)...")
+                listener.wait()
                 continue
 
             for cluster in candidates:
@@ -106,33 +106,34 @@ class Command(BaseCommand):
             if not rep_embedding_obj.embedding_visual:
                 logger.warning("   ⚠️ Representative product has no vector. Skipping visual check.")
                 return
-            target_vector = np.array(rep_embedding_obj.embedding_visual)
+            target_vector = np.array(rep_embedding_obj.embedding_visual, dtype=np.float32)
+            target_model = rep_embedding_obj.embedding_visual_model
         except ProductEmbedding.DoesNotExist:
             return
 
-        valid_competitors = []
-        
         # Limit processing to avoid spamming downloads
-        for item in results[:20]: 
-            img_url = item.get('thumbnail', '').replace('-I.jpg', '-O.jpg') # Try to get high quality
-            if not img_url: continue
-
-            # Download & Vectorize
-            try:
-                img_vector = self.vectorize_image_from_url(img_url)
-                if img_vector is None: continue
-                
-                # Cosine Similarity
-                sim = np.dot(target_vector, img_vector)
-                
-                # Threshold: 0.85 (Strict enough to ignore cases/accessories, loose enough for different angles)
-                if sim > 0.85:
-                    valid_competitors.append(item)
-                    # logger.info(f"     ✅ Match ({sim:.2f}): {item['title'][:30]}...")
-                # else:
-                    # logger.info(f"     ❌ No Match ({sim:.2f}): {item['title'][:30]}...")
-            except Exception as e:
-                pass
+        items = [i for i in results[:20] if i.get('thumbnail')]
+        urls = [i['thumbnail'].replace('-I.jpg', '-O.jpg') for i in items] # Try to get high quality
+
+        # Download in parallel & Vectorize all thumbnails in ONE service call (one forward pass)
+        try:
+            vectors, model_version = self.vectorize_images_from_urls(urls)
+        except EmbeddingServiceError as e:
+            logger.error(f"   Embedding service error: {e}")
+            return
+
+        if target_model and target_model != model_version:
+            logger.warning(f"   ⚠️ Vector del representante es de otro modelo ({target_model} != {model_version}). Skipping.")
+            return
+
+        valid_competitors = []
+        for item, img_vector in zip(items, vectors):
+            if img_vector is None: continue
+            # Cosine Similarity (both L2-normalized)
+            sim = float(np.dot(target_vector, img_vector))
+            # Threshold: 0.85 (Strict enough to ignore cases/accessories, loose enough for different angles)
+            if sim > 0.85:
+                valid_competitors.append(item)
 
         # 3. Analyze Valid Comps
         count = len(valid_competitors)
@@ -188,18 +189,22 @@ class Command(BaseCommand):
 
         cluster.save()
 
-    def vectorize_image_from_url(self, url):
+    def download_image(self, url):
         try:
             resp = requests.get(url, timeout=3)
             if resp.status_code != 200: return None
-            image = Image.open(BytesIO(resp.content)).convert("RGB")
-            
-            inputs = self.processor(images=image, return_tensors="pt", padding=True).to(self.device)
-            with torch.no_grad():
-                features = self.model.get_image_features(**inputs)
-            
-            # Normalize
-            features = features / features.norm(p=2, dim=-1, keepdim=True)
-            return features.cpu().numpy()[0]
-        except:
+            return resp.content
+        except Exception:
             return None
+
+    def vectorize_images_from_urls(self, urls):
+        """Retorna: (lista de vectores SigLIP o None por URL, model_version)"""
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            blobs = list(executor.map(self.download_image, urls))
+
+        downloaded = [i for i, b in enumerate(blobs) if b]
+        vectors = [None] * len(urls)
+        vecs, model_version = self.embedder.embed_images([blobs[i] for i in downloaded])
+        for i, vec in zip(downloaded, vecs):
+            vectors[i] = vec
+        return vectors, model_version
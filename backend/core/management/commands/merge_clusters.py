@@ -0,0 +1,40 @@
+"""
+Merge de Clusters Convergentes (Django Command).
+Fusiona clusters del mismo concepto cuyos centroides visuales (HNSW idx_cluster_centroid)
+superan el umbral de similitud. El clusterizer lo ejecuta solo cada CLUSTER_MERGE_INTERVAL
+segundos; este comando permite lanzarlo a mano o en dry-run.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.clustering import CENTROID_MERGE_NEIGHBOURS, CENTROID_MERGE_THRESHOLD, merge_converged_clusters
+
+
+class Command(BaseCommand):
+    help = 'Fusiona clusters cuyos centroides visuales convergen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=CENTROID_MERGE_THRESHOLD,
+                            help='Coseno mínimo entre centroides (default CLUSTER_MERGE_THRESHOLD)')
+        parser.add_argument('--k', type=int, default=CENTROID_MERGE_NEIGHBOURS,
+                            help='Vecinos HNSW por cluster')
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta qué se fusionaría')
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cur:
+            stats = merge_converged_clusters(cur, options['threshold'], options['k'], options['dry_run'])
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(f"\n🧲 MERGE DE CENTROIDES (umbral {options['threshold']:.2f}, {elapsed:.2f}s)\n")
+        self.stdout.write(f"   Pares convergentes:  {stats['pairs']}")
+        self.stdout.write(f"   Grupos fusionados:   {stats['groups']} ({stats['absorbed']} clusters absorbidos)")
+        self.stdout.write(f"   Miembros movidos:    {stats['moved']}")
+        self.stdout.write(f"   Huérfanos:           {stats['orphans_before']} -> {stats['orphans_after']}")
+        if options['dry_run']:
+            self.stdout.write("🧪 Dry-run: no se fusionó nada.")
+        else:
+            self.stdout.write("✅ Merge completado.")
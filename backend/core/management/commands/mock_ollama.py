@@ -0,0 +1,189 @@
+"""
+Mock de Ollama para Benchmarks Offline (Django Command).
+Servidor HTTP mínimo compatible con POST /api/chat (streaming NDJSON o respuesta única) que
+responde clasificaciones deterministas con una latencia simulada:
+    latencia = --latency (fija por llamada) + --per-item * productos en el mensaje
+--parallel limita las llamadas atendidas a la vez (como OLLAMA_NUM_PARALLEL); el resto hace cola.
+--malformed: fracción de respuestas multi-item que llegan rotas u omiten un producto (ejercita el
+fallback uno a uno del Taxonomist).
+
+Uso:
+    python manage.py mock_ollama --port 11435                # servir; classify_products con OLLAMA_BASE_URL=http://localhost:11435
+    python manage.py mock_ollama --benchmark 200             # medir serial vs concurrente vs multi-item
+"""
+
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+ITEM_RE = re.compile(r"^\s*### Producto (\d+)", re.MULTILINE)
+TITLE_RE = re.compile(r"Título Objetivo: '(.*)'")
+
+
+def mock_classification(title):
+    """Clasificación determinista: concepto = dos primeras palabras del título."""
+    words = re.sub(r"[^\w\s]", " ", title.split("|")[0]).split()
+    concept = " ".join(words[:2]).title() or "Desconocido"
+    return {
+        "term": title,
+        "classification": "CONCEPT",
+        "concept_name": concept,
+        "parent_industry": "Mock",
+        "reason": "Respuesta del mock de Ollama",
+    }
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    server_version = "MockOllama/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._send_json({"models": []} if self.path == "/api/tags" else {"status": "ok"})
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+        content, items = self._answer(prompt)
+
+        config = self.server.config
+        with self.server.slots:
+            time.sleep(config["latency"] + config["per_item"] * items)
+        self.server.count(items)
+
+        message = {"role": "assistant", "content": content}
+        final = {"model": body.get("model", "mock"), "created_at": datetime.now(timezone.utc).isoformat(),
+                 "message": message, "done": True, "done_reason": "stop", "eval_count": len(content)}
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            self.wfile.write((json.dumps({**final, "done": False, "done_reason": None}) + "\n").encode())
+            self.wfile.write((json.dumps({**final, "message": {"role": "assistant", "content": ""}}) + "\n").encode())
+        else:
+            self._send_json(final)
+
+    def _answer(self, prompt):
+        """Retorna: (contenido de la respuesta, productos clasificados en la llamada)"""
+        blocks = ITEM_RE.split(prompt)
+        if len(blocks) == 1:
+            match = TITLE_RE.search(prompt)
+            return json.dumps(mock_classification(match.group(1) if match else ""), ensure_ascii=False), 1
+
+        # split con grupo: [preámbulo, n1, bloque1, n2, bloque2, ...]
+        results = []
+        for n, block in zip(blocks[1::2], blocks[2::2]):
+            match = TITLE_RE.search(block)
+            results.append({"index": int(n), **mock_classification(match.group(1) if match else "")})
+        if self.server.rng.random() < self.server.config["malformed"]:
+            # Mitad truncada (JSON inválido), mitad con un producto omitido
+            if self.server.rng.random() < 0.5:
+                return json.dumps(results, ensure_ascii=False)[:-20], len(results)
+            results = results[1:]
+        return json.dumps({"items": results}, ensure_ascii=False), len(results)
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, MockOllamaHandler)
+        self.config = config
+        self.slots = threading.BoundedSemaphore(config["parallel"])
+        self.rng = random.Random(42)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.items = 0
+
+    def count(self, items):
+        with self.lock:
+            self.calls += 1
+            self.items += items
+
+
+class Command(BaseCommand):
+    help = 'Servidor mock de Ollama (/api/chat) para medir el throughput del Taxonomist sin GPU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=11435, help='Puerto (default: 11435)')
+        parser.add_argument('--latency', type=float, default=0.5, help='Segundos fijos por llamada (default: 0.5)')
+        parser.add_argument('--per-item', type=float, default=0.2, help='Segundos extra por producto (default: 0.2)')
+        parser.add_argument('--parallel', type=int, default=4, help='Llamadas atendidas a la vez (default: 4)')
+        parser.add_argument('--malformed', type=float, default=0.0,
+                            help='Fracción de respuestas multi-item rotas/incompletas (default: 0)')
+        parser.add_argument('--benchmark', type=int, metavar='N',
+                            help='Clasificar N productos sintéticos en cada modo y salir')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrencia del benchmark (default: 4)')
+        parser.add_argument('--batch-size', type=int, default=5, help='Productos por llamada en multi-item (default: 5)')
+
+    def handle(self, *args, **options):
+        config = {key: options[key] for key in ("latency", "per_item", "parallel", "malformed")}
+        server = MockOllamaServer(("127.0.0.1" if options['benchmark'] else "0.0.0.0", options['port']), config)
+        self.stdout.write(
+            f"🧪 Mock Ollama en :{options['port']} (latencia {config['latency']}s + {config['per_item']}s/ítem, "
+            f"{config['parallel']} slots, {config['malformed']:.0%} multi-item defectuosas)"
+        )
+        if not options['benchmark']:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                self.stdout.write("🛑 Mock detenido.")
+            return
+
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            self.benchmark(server, options)
+        finally:
+            server.shutdown()
+
+    def benchmark(self, server, options):
+        from core.ai_classifier import TaxonomistAI
+
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        n = options['benchmark']
+        items = [{"term": f"Producto Sintetico {i} | descripción de prueba",
+                  "source_categories": ["Hogar"],
+                  "visual_context": [{"title": f"Vecino {i}", "categories": ["Hogar"], "concept": "Producto Sintetico"}]}
+                 for i in range(n)]
+        # Sin caché: se mide solo el LLM
+        taxonomist = TaxonomistAI(cache=None, base_url=f"http://127.0.0.1:{options['port']}")
+        modes = (
+            ("Serial (1 en vuelo)", 1, 1),
+            (f"Concurrente ({options['concurrency']} en vuelo)", options['concurrency'], 1),
+            (f"Multi-item ({options['batch_size']}/llamada, {options['concurrency']} en vuelo)",
+             options['concurrency'], options['batch_size']),
+        )
+
+        self.stdout.write(f"\n📊 BENCHMARK TAXONOMIST ({n} productos)\n")
+        self.stdout.write(f"   {'Modo':<42} {'Seg.':>7} {'Ítems/s':>8} {'Llamadas':>9} {'OK':>5}")
+        baseline = None
+        for label, concurrency, batch_size in modes:
+            calls = server.calls
+            t0 = time.perf_counter()
+            results = taxonomist.classify_many(items, concurrency=concurrency, batch_size=batch_size)
+            elapsed = time.perf_counter() - t0
+            ok = sum(1 for r in results if r and r.get('concept_name'))
+            rate = n / elapsed
+            baseline = baseline or rate
+            self.stdout.write(
+                f"   {label:<42} {elapsed:>7.2f} {rate:>8.2f} {server.calls - calls:>9} {ok:>5}   x{rate / baseline:.1f}"
+            )
@@ -0,0 +1,69 @@
+"""
+Latencia End-to-End del Pipeline (Django Command).
+Para los productos NUEVOS de la ventana: tiempo desde que el loader los insertó
+(products.created_at) hasta su primera asignación a un cluster (membership.clustered_at),
+con el desglose carga -> vector (product_embeddings.processed_at) -> cluster
+(incluye clasificación). Correr antes/después de cambios del pipeline para compararlos.
+También reporta qué fracción entró por el fast path exacto (EXACT_SKU / EXACT_IMAGE).
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+PERCENTILES = (0.5, 0.9, 0.99)
+EXACT_METHODS = ('EXACT_SKU', 'EXACT_IMAGE')
+
+
+class Command(BaseCommand):
+    help = 'Percentiles de latencia carga -> vector -> cluster de los productos recientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Ventana de productos nuevos (default: 24h)')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cur:
+            cur.execute("""
+                WITH recent AS (
+                    SELECT EXTRACT(EPOCH FROM m.clustered_at - p.created_at::timestamptz) AS total,
+                           EXTRACT(EPOCH FROM pe.processed_at::timestamptz - p.created_at::timestamptz) AS to_vector,
+                           EXTRACT(EPOCH FROM m.clustered_at - pe.processed_at::timestamptz) AS to_cluster
+                    FROM product_cluster_membership m
+                    JOIN products p ON p.product_id = m.product_id
+                    LEFT JOIN product_embeddings pe ON pe.product_id = m.product_id
+                    WHERE m.clustered_at IS NOT NULL
+                    AND p.created_at >= NOW() - make_interval(hours => %s)
+                )
+                SELECT COUNT(*),
+                       percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY total),
+                       percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY to_vector),
+                       percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY to_cluster)
+                FROM recent
+            """, (options['hours'], list(PERCENTILES), list(PERCENTILES), list(PERCENTILES)))
+            count, total, to_vector, to_cluster = cur.fetchone()
+
+            cur.execute("""
+                SELECT m.match_method, COUNT(*)
+                FROM product_cluster_membership m
+                JOIN products p ON p.product_id = m.product_id
+                WHERE m.clustered_at IS NOT NULL
+                AND p.created_at >= NOW() - make_interval(hours => %s)
+                AND m.match_method = ANY(%s)
+                GROUP BY m.match_method
+            """, (options['hours'], list(EXACT_METHODS)))
+            exact = dict(cur.fetchall())
+
+        self.stdout.write(f"\n⏱️ LATENCIA DEL PIPELINE (productos nuevos, últimas {options['hours']}h)\n")
+        if not count:
+            self.stdout.write("⚠️ No hay productos nuevos clusterizados en la ventana.")
+            return
+
+        header = " | ".join(f"p{int(p * 100):<6}" for p in PERCENTILES)
+        self.stdout.write(f"   Productos: {count}")
+        self.stdout.write(f"   {'Etapa':<22} {header}")
+        for label, values in (("Carga -> vector", to_vector), ("Vector -> cluster", to_cluster), ("Total (end-to-end)", total)):
+            cells = " | ".join(f"{v:>6.1f}s" if v is not None else f"{'-':>7}" for v in (values or [None] * len(PERCENTILES)))
+            self.stdout.write(f"   {label:<22} {cells}")
+
+        fast = sum(exact.values())
+        breakdown = ", ".join(f"{method} {exact.get(method, 0)}" for method in EXACT_METHODS)
+        self.stdout.write(f"\n   🎯 Fast path exacto: {fast}/{count} ({fast / count:.1%}) -> {breakdown}")
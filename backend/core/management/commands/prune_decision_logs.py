@@ -0,0 +1,31 @@
+"""
+Mantenimiento de cluster_decision_logs (Django Command).
+Crea las particiones mensuales próximas y elimina las que superan la retención.
+El clusterizer lo hace solo una vez al día; este comando permite forzarlo o cambiar la retención.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.decision_log import DECISION_LOG_RETENTION_DAYS, maintain_partitions
+
+
+class Command(BaseCommand):
+    help = 'Crea particiones próximas y aplica la retención de cluster_decision_logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=DECISION_LOG_RETENTION_DAYS,
+                            help='Días a conservar (default DECISION_LOG_RETENTION_DAYS)')
+        parser.add_argument('--months-ahead', type=int, default=1, help='Particiones futuras a pre-crear')
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta qué se crearía/eliminaría')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cur:
+            result = maintain_partitions(cur, options['retention_days'], options['months_ahead'], options['dry_run'])
+
+        self.stdout.write(f"\n🗂️ DECISION LOGS (retención {options['retention_days']} días)\n")
+        self.stdout.write(f"   Particiones creadas:   {', '.join(result['created']) or '-'}")
+        self.stdout.write(f"   Particiones eliminadas: {', '.join(result['dropped']) or '-'}")
+        self.stdout.write(f"   Filas vencidas en DEFAULT: {result['purged_default']}")
+        if options['dry_run']:
+            self.stdout.write("🧪 Dry-run: no se modificó nada.")
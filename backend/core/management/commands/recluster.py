@@ -0,0 +1,347 @@
+"""
+Re-Clustering Completo (Django Command).
+
+Reconstruye el clustering desde cero con los pesos ACTUALES de concept_weights
+(alternativa quirúrgica al reset nuclear):
+1. Bloqueo por taxonomy_concept: cada concepto es un problema independiente.
+2. Pool de procesos: por concepto, grafo KNN (top-k visual) -> reglas híbridas -> union-find.
+   Los merges humanos (HUMAN_MERGE) se respetan como must-link.
+3. El resultado se escribe en una generación sombra (tabla recluster_shadow).
+4. Reporte de diferencias sombra vs generación viva.
+5. Swap atómico (una transacción): cada componente nuevo reutiliza el cluster vivo con el que
+   más miembros comparte (conserva concept_name, análisis de mercado, etc.), los demás se crean,
+   los clusters que quedan vacíos se eliminan y los agregados se recalculan.
+"""
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from core.ai_utils import as_vector
+from core.cluster_metrics import reconcile
+from core.clustering import load_all_configs, config_for, audit_reason, cluster_graph
+
+SHADOW_TABLE = "recluster_shadow"
+DEFAULT_K = 10
+
+
+# ─────── WORKER (un proceso por concepto) ───────
+
+def recluster_concept(args):
+    """
+    Clustering completo de UN concepto. Corre en un proceso del pool con su propia conexión.
+    Retorna: (concepto, filas [(product_id, componente_local, es_representante, método, confianza)], stats)
+    """
+    concept, config, k = args
+    t0 = time.perf_counter()
+    try:
+        with connection.cursor() as cur:
+            cur.execute("""
+                SELECT p.product_id, p.title, pe.embedding_visual, pe.embedding_text
+                FROM products p
+                JOIN product_embeddings pe ON pe.product_id = p.product_id
+                WHERE p.taxonomy_concept = %s
+                AND pe.embedding_visual IS NOT NULL
+                ORDER BY p.product_id
+            """, (concept,))
+            rows = cur.fetchall()
+
+            # Merges humanos del Cluster Lab: el producto debe seguir junto al representante
+            cur.execute("""
+                SELECT m.product_id, c.representative_product_id
+                FROM product_cluster_membership m
+                JOIN unique_product_clusters c ON c.cluster_id = m.cluster_id
+                JOIN products p ON p.product_id = m.product_id
+                WHERE m.match_method = 'HUMAN_MERGE'
+                AND p.taxonomy_concept = %s
+            """, (concept,))
+            human_links = cur.fetchall()
+    finally:
+        connection.close()
+
+    if not rows:
+        return concept, [], {"products": 0, "clusters": 0, "matches": 0, "seconds": 0.0}
+
+    pids = [r[0] for r in rows]
+    titles = [r[1] for r in rows]
+    text_vecs = [as_vector(r[3]) for r in rows]
+    vectors = np.stack([as_vector(r[2]) for r in rows])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    position = {pid: i for i, pid in enumerate(pids)}
+    must_link = [
+        (position[a], position[b]) for a, b in human_links
+        if a in position and b in position and a != b
+    ]
+
+    groups, best_edge, degree, n_matches = cluster_graph(config, titles, text_vecs, vectors, k=k, must_link=must_link)
+
+    result = []
+    for local_id, members in enumerate(groups):
+        rep = max(members, key=lambda i: (degree[i], -i))
+        for i in members:
+            if i == rep:
+                method, confidence = "REPRESENTATIVE", 1.0
+            else:
+                confidence, method = best_edge[i]
+                if method != "HUMAN_MERGE":
+                    method = audit_reason(method, confidence)
+            result.append((pids[i], local_id, i == rep, method, round(min(confidence, 1.0), 2)))
+
+    stats = {
+        "products": len(pids),
+        "clusters": len(groups),
+        "matches": n_matches,
+        "seconds": time.perf_counter() - t0,
+    }
+    return concept, result, stats
+
+
+# ─────── REPORTE DE DIFERENCIAS ───────
+
+def partition_diff(live, new):
+    """
+    Compara dos particiones de los mismos productos (arrays de etiquetas alineados).
+    Conteo por pares: un par "junto" es un par de productos en el mismo cluster.
+    """
+    live = np.asarray(live)
+    new = np.asarray(new)
+    n = len(live)
+
+    def pairs(counts):
+        counts = counts.astype(np.float64)
+        return float((counts * (counts - 1) / 2).sum())
+
+    _, live_idx, live_sizes = np.unique(live, return_inverse=True, return_counts=True)
+    _, new_idx, new_sizes = np.unique(new, return_inverse=True, return_counts=True)
+    cells, cell_idx, cell_sizes = np.unique(
+        np.stack([live_idx, new_idx], axis=1), axis=0, return_inverse=True, return_counts=True
+    )
+    cell_idx = cell_idx.reshape(-1)
+
+    # Un cluster nuevo está "intacto" si es exactamente un cluster vivo
+    intact_cells = (cell_sizes == live_sizes[cells[:, 0]]) & (cell_sizes == new_sizes[cells[:, 1]])
+    moved = int((~intact_cells[cell_idx]).sum())
+
+    pairs_live, pairs_new, pairs_shared = pairs(live_sizes), pairs(new_sizes), pairs(cell_sizes)
+    pairs_total = n * (n - 1) / 2
+    expected = pairs_live * pairs_new / pairs_total if pairs_total else 0.0
+    max_index = (pairs_live + pairs_new) / 2
+    ari = (pairs_shared - expected) / (max_index - expected) if max_index != expected else 1.0
+
+    return {
+        "products": n,
+        "live_clusters": len(live_sizes),
+        "new_clusters": len(new_sizes),
+        "intact_clusters": int(intact_cells.sum()),
+        "products_changed": moved,
+        "pairs_live": int(pairs_live),
+        "pairs_new": int(pairs_new),
+        "pairs_kept": int(pairs_shared),
+        "ari": float(ari),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Re-clustering completo por concepto en pool de procesos, con generación sombra y swap atómico'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Procesos del pool')
+        parser.add_argument('--concept', type=str, default=None, help='Re-clusterizar solo este concepto')
+        parser.add_argument('--k', type=int, default=DEFAULT_K, help=f'Vecinos del grafo KNN (default: {DEFAULT_K})')
+        parser.add_argument('--dry-run', action='store_true', help='Construye la sombra y reporta, sin swap')
+
+    def handle(self, *args, **options):
+        t_start = time.perf_counter()
+
+        with connection.cursor() as cur:
+            configs = load_all_configs(cur)
+            if options['concept']:
+                concepts = [options['concept']]
+            else:
+                # Conceptos más grandes primero: mejor balance del pool
+                cur.execute("""
+                    SELECT p.taxonomy_concept FROM products p
+                    JOIN product_embeddings pe ON pe.product_id = p.product_id
+                    WHERE p.taxonomy_concept IS NOT NULL AND pe.embedding_visual IS NOT NULL
+                    GROUP BY p.taxonomy_concept
+                    ORDER BY COUNT(*) DESC
+                """)
+                concepts = [r[0] for r in cur.fetchall()]
+
+            cur.execute(f"""
+                CREATE UNLOGGED TABLE IF NOT EXISTS {SHADOW_TABLE} (
+                    product_id bigint PRIMARY KEY,
+                    concept varchar(255),
+                    component bigint NOT NULL,
+                    is_representative boolean NOT NULL,
+                    match_method varchar(50),
+                    match_confidence numeric(3,2)
+                )
+            """)
+            cur.execute(f"TRUNCATE {SHADOW_TABLE}")
+
+        if not concepts:
+            self.stdout.write("✨ No hay productos clasificados y vectorizados para re-clusterizar.")
+            return
+
+        self.stdout.write(f"🔁 Re-clustering de {len(concepts)} conceptos con {options['workers']} procesos (k={options['k']})...")
+
+        # 1-3. Pool por concepto -> generación sombra
+        connections.close_all() # cada proceso hijo abre su propia conexión
+        next_component = 0
+        totals = {"products": 0, "clusters": 0, "matches": 0}
+        tasks = [(concept, config_for(configs, concept), options['k']) for concept in concepts]
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=multiprocessing.get_context("fork")) as pool:
+            futures = [pool.submit(recluster_concept, task) for task in tasks]
+            for future in as_completed(futures):
+                concept, rows, stats = future.result()
+                if not rows:
+                    continue
+                with connection.cursor() as cur:
+                    cur.execute(f"""
+                        INSERT INTO {SHADOW_TABLE} (product_id, concept, component, is_representative, match_method, match_confidence)
+                        SELECT pid, %s, comp + %s, rep, method, conf
+                        FROM unnest(%s::bigint[], %s::bigint[], %s::boolean[], %s::varchar[], %s::numeric[])
+                            AS t(pid, comp, rep, method, conf)
+                    """, (
+                        concept, next_component,
+                        [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows],
+                        [r[3] for r in rows], [r[4] for r in rows],
+                    ))
+                next_component += stats["clusters"]
+                for key in totals:
+                    totals[key] += stats[key]
+                self.stdout.write(
+                    f"   ✅ {concept}: {stats['products']} productos -> {stats['clusters']} clusters "
+                    f"({stats['matches']} matches, {stats['seconds']:.1f}s)"
+                )
+
+        # 4. Reporte sombra vs vivo
+        with connection.cursor() as cur:
+            cur.execute(f"""
+                SELECT s.component, m.cluster_id
+                FROM {SHADOW_TABLE} s
+                LEFT JOIN product_cluster_membership m ON m.product_id = s.product_id
+            """)
+            rows = cur.fetchall()
+        new_labels = np.array([r[0] for r in rows], dtype=np.int64)
+        # Productos sin cluster vivo: cada uno es su propio grupo (etiquetas negativas únicas)
+        live_labels = np.array([r[1] if r[1] is not None else -(i + 1) for i, r in enumerate(rows)], dtype=np.int64)
+        diff = partition_diff(live_labels, new_labels)
+
+        self.stdout.write(f"\n📊 DIFERENCIAS GENERACIÓN NUEVA vs VIVA ({diff['products']} productos)\n")
+        self.stdout.write(f"   Clusters:             {diff['live_clusters']} -> {diff['new_clusters']}")
+        self.stdout.write(f"   Clusters intactos:    {diff['intact_clusters']}")
+        self.stdout.write(f"   Productos afectados:  {diff['products_changed']} ({diff['products_changed'] / max(diff['products'], 1) * 100:.1f}%)")
+        self.stdout.write(f"   Pares juntos:         {diff['pairs_live']} -> {diff['pairs_new']} ({diff['pairs_kept']} conservados)")
+        self.stdout.write(f"   Adjusted Rand Index:  {diff['ari']:.3f}")
+
+        if options['dry_run']:
+            self.stdout.write(f"\n🧪 Dry-run: generación sombra disponible en {SHADOW_TABLE}, sin swap.")
+            return
+
+        # 5. Swap atómico
+        t0 = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cur:
+            touched = self.swap_generation(cur)
+            # Reescritura forzada de los clusters tocados (incluye el centroide, que reconcile
+            # normal no marca como drift)
+            drift = reconcile(cur, fix=True, cluster_ids=touched)
+        self.stdout.write(
+            f"\n✅ Swap completado en {time.perf_counter() - t0:.1f}s "
+            f"({drift['clusters_with_drift']} clusters con agregados recalculados). "
+            f"Total: {time.perf_counter() - t_start:.1f}s"
+        )
+
+    def swap_generation(self, cur):
+        # Congela membresías (clusterizer / Cluster Lab esperan) hasta el commit
+        cur.execute("LOCK TABLE product_cluster_membership IN SHARE ROW EXCLUSIVE MODE")
+
+        cur.execute(f"""
+            CREATE TEMP TABLE recluster_old ON COMMIT DROP AS
+            SELECT DISTINCT m.cluster_id FROM {SHADOW_TABLE} s
+            JOIN product_cluster_membership m ON m.product_id = s.product_id
+        """)
+
+        # Componente -> cluster vivo con mayor solapamiento (asignación greedy 1 a 1)
+        cur.execute(f"""
+            SELECT s.component, m.cluster_id, COUNT(*) AS overlap
+            FROM {SHADOW_TABLE} s
+            JOIN product_cluster_membership m ON m.product_id = s.product_id
+            GROUP BY s.component, m.cluster_id
+            ORDER BY overlap DESC, m.cluster_id
+        """)
+        mapping = {}
+        used = set()
+        for component, cluster_id, _ in cur.fetchall():
+            if component not in mapping and cluster_id not in used:
+                mapping[component] = cluster_id
+                used.add(cluster_id)
+
+        cur.execute("CREATE TEMP TABLE recluster_map (component bigint PRIMARY KEY, cluster_id bigint) ON COMMIT DROP")
+        cur.execute(
+            "INSERT INTO recluster_map SELECT * FROM unnest(%s::bigint[], %s::bigint[])",
+            (list(mapping.keys()), list(mapping.values()))
+        )
+
+        # Componentes sin cluster vivo: clusters nuevos
+        cur.execute(f"""
+            WITH created AS (
+                INSERT INTO unique_product_clusters
+                    (representative_product_id, concept_id, total_competitors, price_sum, price_count, saturation_score,
+                     created_at, updated_at)
+                SELECT s.product_id, p.concept_id, 0, 0, 0, 'LOW_DATA', NOW(), NOW()
+                FROM {SHADOW_TABLE} s
+                JOIN products p ON p.product_id = s.product_id
+                WHERE s.is_representative
+                AND NOT EXISTS (SELECT 1 FROM recluster_map mp WHERE mp.component = s.component)
+                RETURNING cluster_id, representative_product_id
+            )
+            INSERT INTO recluster_map (component, cluster_id)
+            SELECT s.component, c.cluster_id
+            FROM created c
+            JOIN {SHADOW_TABLE} s ON s.product_id = c.representative_product_id
+        """)
+
+        cur.execute(f"""
+            INSERT INTO product_cluster_membership (product_id, cluster_id, match_confidence, match_method, clustered_at)
+            SELECT s.product_id, mp.cluster_id, s.match_confidence, s.match_method, NOW()
+            FROM {SHADOW_TABLE} s
+            JOIN recluster_map mp ON mp.component = s.component
+            ON CONFLICT (product_id) DO UPDATE SET
+                cluster_id = EXCLUDED.cluster_id,
+                match_confidence = EXCLUDED.match_confidence,
+                match_method = EXCLUDED.match_method
+        """)
+
+        cur.execute(f"""
+            UPDATE unique_product_clusters c
+            SET representative_product_id = s.product_id, updated_at = NOW()
+            FROM recluster_map mp
+            JOIN {SHADOW_TABLE} s ON s.component = mp.component AND s.is_representative
+            WHERE c.cluster_id = mp.cluster_id
+        """)
+
+        # Clusters vivos que se quedaron sin miembros
+        cur.execute("""
+            DELETE FROM unique_product_clusters c
+            USING recluster_old o
+            WHERE c.cluster_id = o.cluster_id
+            AND NOT EXISTS (SELECT 1 FROM product_cluster_membership m WHERE m.cluster_id = c.cluster_id)
+        """)
+        self.stdout.write(f"   🗑️ {cur.rowcount} clusters vacíos eliminados, {len(mapping)} clusters vivos reutilizados.")
+
+        # Clusters tocados: destinos + orígenes que siguen vivos
+        cur.execute("""
+            SELECT cluster_id FROM recluster_map
+            UNION
+            SELECT o.cluster_id FROM recluster_old o
+            JOIN unique_product_clusters c ON c.cluster_id = o.cluster_id
+        """)
+        return [row[0] for row in cur.fetchall()]
@@ -0,0 +1,39 @@
+"""
+Reconciliación de Agregados de Cluster (Django Command).
+Recalcula set-based miembros y suma/conteo/min/max/promedio de precio de cada cluster
+desde product_cluster_membership, y reporta cuánto se habían desviado los deltas.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.cluster_metrics import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los agregados de unique_product_clusters y reporta el drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta el drift, sin corregir')
+
+    def handle(self, *args, **options):
+        fix = not options['dry_run']
+        t0 = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cur:
+            drift = reconcile(cur, fix=fix)
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(f"\n🧮 RECONCILIACIÓN DE CLUSTERS ({elapsed:.2f}s)\n")
+        self.stdout.write(f"   Clusters con drift:        {drift['clusters_with_drift']}")
+        self.stdout.write(f"   Conteo de miembros errado: {drift['member_count_mismatch']} (Σ|Δ| = {drift['total_member_drift']})")
+        self.stdout.write(f"   Precio promedio errado:    {drift['average_price_mismatch']}")
+        self.stdout.write(f"   Clusters vacíos:           {drift['empty_clusters']}")
+
+        if not drift['clusters_with_drift']:
+            self.stdout.write("✅ Sin drift: los deltas están al día.")
+        elif fix:
+            self.stdout.write("✅ Agregados corregidos.")
+        else:
+            self.stdout.write("🧪 Dry-run: no se corrigió nada.")
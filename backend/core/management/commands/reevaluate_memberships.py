@@ -0,0 +1,62 @@
+"""
+Re-evaluación de Membresías Dudosas (Django Command).
+Para cada concepto cuyos pesos cambió el ai_trainer (concept_weights.last_updated más nuevo
+que reevaluated_at) re-puntúa con los pesos actuales solo sus membresías NEEDS_AUDIT o
+con confianza límite, y las confirma, mueve o separa. El clusterizer lo ejecuta solo cada
+CLUSTER_REEVAL_INTERVAL segundos; este comando permite lanzarlo a mano, forzar un concepto
+o ver el efecto en dry-run.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.clustering import (
+    REEVAL_BORDERLINE, config_for, load_all_configs, lock_concept, mark_reevaluated, reevaluate_concept,
+    stale_concepts
+)
+from core.vector_index import ConceptVectorIndex
+
+
+class Command(BaseCommand):
+    help = 'Re-puntúa las membresías dudosas de los conceptos con pesos nuevos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concept', type=str, help='Re-evaluar este concepto aunque sus pesos no hayan cambiado')
+        parser.add_argument('--borderline', type=float, default=REEVAL_BORDERLINE,
+                            help='Confianza bajo la cual una membresía se re-evalúa (default CLUSTER_REEVAL_BORDERLINE)')
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta qué cambiaría')
+
+    def handle(self, *args, **options):
+        index = ConceptVectorIndex()
+        t0 = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cur:
+            if options['concept']:
+                concepts = [(options['concept'], None)]
+            else:
+                concepts = stale_concepts(cur)
+            if not concepts:
+                self.stdout.write("✨ Ningún concepto cambió de pesos desde la última re-evaluación.")
+                return
+
+            configs = load_all_configs(cur)
+            self.stdout.write(f"\n♻️ RE-EVALUACIÓN DE MEMBRESÍAS (confianza < {options['borderline']:.2f} o NEEDS_AUDIT)\n")
+            self.stdout.write(f"   {'Concepto':<30} {'Evaluadas':>9} {'Confirm.':>9} {'Reetiq.':>8} {'Movidas':>8} {'Separadas':>9}")
+            for concept, watermark in concepts:
+                lock_concept(cur, concept)
+                stats = reevaluate_concept(
+                    cur, index, concept, config_for(configs, concept), options['borderline'], options['dry_run']
+                )
+                if watermark is not None and not options['dry_run']:
+                    mark_reevaluated(cur, concept, watermark)
+                self.stdout.write(
+                    f"   {concept[:30]:<30} {stats['evaluated']:>9} {stats['confirmed']:>9} {stats['relabelled']:>8} "
+                    f"{stats['moved']:>8} {stats['split']:>9}"
+                )
+
+        self.stdout.write(f"\n   ⏱️ {time.perf_counter() - t0:.2f}s")
+        if options['dry_run']:
+            self.stdout.write("🧪 Dry-run: no se modificó nada.")
+        else:
+            self.stdout.write("✅ Re-evaluación completada.")
@@ -0,0 +1,53 @@
+"""
+Recálculo de Prioridades (Django Command).
+Reescribe set-based products.priority_score y unique_product_clusters.priority_score (core.priority).
+El loader y cluster_metrics los mantienen al día; este comando es para después de cambiar los
+pesos PRIORITY_* o cuando cambian márgenes de representantes sin movimientos de membresía.
+Muestra los pendientes que cada cola tomaría primero.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.priority import (
+    PRIORITY_BACKFILL_SHARE, PRIORITY_HALF_LIFE_HOURS, PRIORITY_SIZE_WEIGHT, PRIORITY_STOCK_WEIGHT,
+    refresh_cluster_priorities, refresh_product_priorities
+)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula priority_score de productos y clusters (orden de las colas de los daemons)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Productos sin clasificar a mostrar (default: 10)')
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cur:
+            products = refresh_product_priorities(cur)
+            clusters = refresh_cluster_priorities(cur)
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(f"\n🚦 PRIORIDADES ({elapsed:.2f}s)\n")
+        self.stdout.write(
+            f"   Pesos: stock x{PRIORITY_STOCK_WEIGHT}, tamaño x{PRIORITY_SIZE_WEIGHT}, "
+            f"vida media {PRIORITY_HALF_LIFE_HOURS:.0f}h, backfill {PRIORITY_BACKFILL_SHARE:.0%} del lote"
+        )
+        self.stdout.write(f"   Productos: {products} | Clusters: {clusters}")
+
+        with connection.cursor() as cur:
+            cur.execute("""
+                SELECT product_id, LEFT(title, 40), profit_margin, created_at::date, priority_score
+                FROM products
+                WHERE taxonomy_concept IS NULL AND is_active
+                ORDER BY priority_score DESC NULLS LAST, created_at DESC
+                LIMIT %s
+            """, (options['top'],))
+            rows = cur.fetchall()
+        if rows:
+            self.stdout.write(f"\n   {'Producto':>10} {'Título':<40} {'Margen':>10} {'Creado':>10} {'Score':>9}")
+            for pid, title, margin, created, score in rows:
+                self.stdout.write(f"   {pid:>10} {title:<40} {margin or 0:>10.0f} {str(created):>10} {score or 0:>9.2f}")
+        self.stdout.write("✅ Prioridades actualizadas.")
@@ -0,0 +1,227 @@
+"""
+Replay Offline de Pesos de Matching (Django Command).
+
+Evalúa una grilla de configuraciones (weight_visual, threshold_hybrid, rescate visual, rescate
+por texto) contra el feedback humano del Cluster Lab, sin desplegar nada (core.replay):
+1. Carga ai_feedback y cluster_decision_logs (últimos --days) en arrays NumPy, por concepto.
+2. Pool de procesos: cada concepto evalúa la grilla completa vectorizada ([G, N]).
+3. Reporta F1 actual vs mejor, precisión / recall, variación del volumen de matches sobre el log
+   de decisiones (re-ponderado por sample_rate) y la config sugerida por concepto.
+   --curves: curva P/R/F1 por threshold_hybrid de la config sugerida. --output: grilla completa en CSV.
+4. --apply: escribe en concept_weights la mejor config DESPLEGABLE (concept_weights solo guarda
+   pesos y threshold_hybrid: los rescates quedan en los valores vivos) si gana >= --min-gain de F1.
+"""
+
+import csv
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.clustering import load_all_configs, config_for
+from core.replay import (
+    GRID_KEYS, THRESHOLD_HYBRID_GRID, best_row, build_grid, config_row, pair_truth, predict, score_grid
+)
+
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MIN_GAIN = 0.02
+
+
+# ─────── WORKER (un proceso por concepto, solo NumPy) ───────
+
+def replay_concept(args):
+    """
+    Grilla completa para UN concepto.
+    Retorna: dict con métricas de la config actual, la mejor, la mejor desplegable, curva y volumen.
+    """
+    concept, config, feedback, logs, keep_grid = args
+    t0 = time.perf_counter()
+    visual, text, truth = feedback
+    current = config_row(config)
+    # La config viva siempre compite (y es la referencia de distancia en los empates)
+    grid = np.vstack([build_grid(), current])
+    scores = score_grid(grid, visual, text, truth)
+
+    best = best_row(grid, scores, current)
+    deployable = best_row(grid, scores, current, mask=np.isclose(grid[:, 3:], current[3:]).all(axis=1))
+
+    def metrics(i):
+        return {key: float(scores[key][i]) for key in ("precision", "recall", "f1")}
+
+    # Curva P/R/F1 de la sugerida: mismo peso y rescates, barriendo threshold_hybrid
+    sweep = np.repeat(grid[best:best + 1], len(THRESHOLD_HYBRID_GRID), axis=0)
+    sweep[:, 2] = THRESHOLD_HYBRID_GRID
+    curve = score_grid(sweep, visual, text, truth)
+
+    # Volumen de matches sobre el log de decisiones (sin verdad): cuánto cambiaría el clustering
+    log_visual, log_text, log_match, log_rate = logs
+    volume = {}
+    if len(log_visual):
+        weight = 1.0 / log_rate
+        decided = predict(grid[[best, deployable]], log_visual, log_text)
+        logged = float(log_match @ weight)
+        for name, row in zip(("best", "deployable"), decided):
+            volume[name] = float(row @ weight) / logged - 1.0 if logged else 0.0
+
+    return {
+        "concept": concept,
+        "n": len(truth),
+        "positives": int(truth.sum()),
+        "current": metrics(len(grid) - 1),
+        "best": metrics(best), "best_row": grid[best],
+        "deployable": metrics(deployable), "deployable_row": grid[deployable],
+        "curve": list(zip(THRESHOLD_HYBRID_GRID, curve["precision"], curve["recall"], curve["f1"])),
+        "volume": volume,
+        "n_logs": len(log_visual),
+        "grid": (grid, scores) if keep_grid else None,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def group_by_concept(rows):
+    """rows: [(concepto, *columnas)] -> {concepto: [arrays por columna]} (un solo np.unique)."""
+    if not rows:
+        return {}
+    names = np.array([r[0] for r in rows], dtype=object)
+    columns = list(zip(*rows))[1:]
+    concepts, group = np.unique(names, return_inverse=True)
+    order = np.argsort(group, kind='stable')
+    bounds = np.searchsorted(group[order], np.arange(len(concepts) + 1))
+    arrays = [np.asarray(col, dtype=object)[order] for col in columns]
+    return {
+        concept: [col[bounds[k]:bounds[k + 1]] for col in arrays]
+        for k, concept in enumerate(concepts)
+    }
+
+
+class Command(BaseCommand):
+    help = 'Replay offline: grilla de pesos/umbrales por concepto contra el feedback del Cluster Lab'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Procesos del pool')
+        parser.add_argument('--concept', type=str, default=None, help='Evaluar solo este concepto')
+        parser.add_argument('--min-samples', type=int, default=DEFAULT_MIN_SAMPLES,
+                            help=f'Feedbacks mínimos por concepto (default: {DEFAULT_MIN_SAMPLES})')
+        parser.add_argument('--min-gain', type=float, default=DEFAULT_MIN_GAIN,
+                            help=f'Ganancia de F1 mínima para sugerir / aplicar (default: {DEFAULT_MIN_GAIN})')
+        parser.add_argument('--days', type=int, default=30, help='Ventana del log de decisiones (default: 30)')
+        parser.add_argument('--curves', action='store_true', help='Mostrar la curva P/R/F1 de cada concepto')
+        parser.add_argument('--output', type=str, default=None, help='CSV con la grilla completa por concepto')
+        parser.add_argument('--apply', action='store_true',
+                            help='Escribir en concept_weights las configs desplegables que ganan en replay')
+
+    def handle(self, *args, **options):
+        t_start = time.perf_counter()
+        scope, params = ("AND c.name = %s", [options['concept']]) if options['concept'] else ("", [])
+
+        with connection.cursor() as cur:
+            configs = load_all_configs(cur)
+            cur.execute(f"""
+                SELECT c.name, f.visual_score, f.text_score, f.decision, f.feedback
+                FROM ai_feedback f
+                JOIN products p ON p.product_id = f.product_id
+                JOIN concepts c ON c.id = p.concept_id
+                WHERE f.visual_score IS NOT NULL AND f.text_score IS NOT NULL {scope}
+            """, params)
+            feedback = group_by_concept(cur.fetchall())
+            # El fast path exacto (SKU / imagen) no tiene scores: no depende de los pesos
+            cur.execute(f"""
+                SELECT c.name, l.visual_score, l.text_score, l.decision, l.sample_rate
+                FROM cluster_decision_logs l
+                JOIN products p ON p.product_id = l.product_id
+                JOIN concepts c ON c.id = p.concept_id
+                WHERE l."timestamp" >= NOW() - make_interval(days => %s)
+                AND l.visual_score IS NOT NULL AND l.text_score IS NOT NULL {scope}
+            """, [options['days']] + params)
+            logs = group_by_concept(cur.fetchall())
+        t_load = time.perf_counter() - t_start
+
+        tasks, skipped = [], 0
+        empty_logs = [np.zeros(0, dtype=object)] * 4
+        for concept, (visual, text, decisions, labels) in feedback.items():
+            truth = pair_truth(decisions, labels).astype(bool)
+            if len(truth) < options['min_samples'] or truth.all() or not truth.any():
+                skipped += 1
+                continue
+            log_visual, log_text, log_decision, log_rate = logs.get(concept, empty_logs)
+            tasks.append((
+                concept, config_for(configs, concept),
+                (visual.astype(np.float64), text.astype(np.float64), truth),
+                (log_visual.astype(np.float64), log_text.astype(np.float64),
+                 np.asarray(log_decision == 'MATCH', dtype=np.float64), log_rate.astype(np.float64)),
+                bool(options['output']),
+            ))
+
+        if not tasks:
+            self.stdout.write(f"✨ Sin conceptos con >= {options['min_samples']} feedbacks de ambas clases "
+                              f"({skipped} omitidos).")
+            return
+
+        self.stdout.write(f"🔁 Replay de {len(tasks)} conceptos ({len(build_grid()) + 1} configs c/u) "
+                          f"con {options['workers']} procesos... (carga {t_load:.2f}s, {skipped} omitidos)")
+        # fork: los hijos solo hacen NumPy y terminan con os._exit, la conexión heredada no se toca
+        results = []
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=multiprocessing.get_context("fork")) as pool:
+            futures = [pool.submit(replay_concept, task) for task in tasks]
+            for future in as_completed(futures):
+                results.append(future.result())
+        results.sort(key=lambda r: -r['n'])
+
+        self.report(results, options)
+        if options['output']:
+            self.write_csv(results, options['output'])
+        if options['apply']:
+            self.apply(results, options['min_gain'])
+        self.stdout.write(f"\n⏱️ {time.perf_counter() - t_start:.2f}s")
+
+    def report(self, results, options):
+        self.stdout.write("\n📊 REPLAY DE MATCHING (F1 sobre feedback del Cluster Lab)\n")
+        self.stdout.write(f"   {'Concepto':<28} {'N':>5} {'F1 act.':>8} {'F1 mejor':>9} {'Δ':>6} "
+                          f"{'P':>5} {'R':>5}  {'Sugerida (w_vis / th / rescate vis / rescate txt)':<48} {'Δ vol.':>7}")
+        for r in results:
+            gain = r['best']['f1'] - r['current']['f1']
+            w, _, th, vr, tr = r['best_row']
+            suggestion = f"{w:.2f} / {th:.2f} / {vr:.2f} / {tr:.2f}" if gain >= options['min_gain'] else "= actual"
+            volume = f"{r['volume']['best']:+.0%}" if r['volume'] else "-"
+            self.stdout.write(
+                f"   {r['concept'][:28]:<28} {r['n']:>5} {r['current']['f1']:>8.3f} {r['best']['f1']:>9.3f} "
+                f"{gain:>+6.3f} {r['best']['precision']:>5.2f} {r['best']['recall']:>5.2f}  {suggestion:<48} {volume:>7}"
+            )
+            if options['curves']:
+                for th, p, rc, f1 in r['curve'][::5]:
+                    self.stdout.write(f"      th={th:.2f}  P={p:.2f}  R={rc:.2f}  F1={f1:.3f}")
+
+    def write_csv(self, results, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["concept", *GRID_KEYS, "precision", "recall", "f1"])
+            for r in results:
+                grid, scores = r['grid']
+                for row, p, rc, f1 in zip(grid, scores['precision'], scores['recall'], scores['f1']):
+                    writer.writerow([r['concept'], *np.round(row, 2), round(p, 4), round(rc, 4), round(f1, 4)])
+        self.stdout.write(f"\n💾 Grilla completa en {path}")
+
+    def apply(self, results, min_gain):
+        adopted = [r for r in results if r['deployable']['f1'] - r['current']['f1'] >= min_gain]
+        with transaction.atomic(), connection.cursor() as cur:
+            for r in adopted:
+                w_vis, w_txt, threshold = (float(x) for x in r['deployable_row'][:3])
+                # last_updated > reevaluated_at: el clusterizer re-evalúa las membresías dudosas del concepto
+                cur.execute("""
+                    INSERT INTO concept_weights (concept, weight_visual, weight_text, threshold_hybrid, sample_size, last_updated)
+                    VALUES (%s, %s, %s, %s, %s, NOW())
+                    ON CONFLICT (concept)
+                    DO UPDATE SET
+                        weight_visual = EXCLUDED.weight_visual,
+                        weight_text = EXCLUDED.weight_text,
+                        threshold_hybrid = EXCLUDED.threshold_hybrid,
+                        sample_size = EXCLUDED.sample_size,
+                        last_updated = NOW();
+                """, (r['concept'], w_vis, w_txt, threshold, r['n']))
+                self.stdout.write(f"   ✅ {r['concept']}: Vis={w_vis:.2f}, Txt={w_txt:.2f}, Th={threshold:.2f} "
+                                  f"(F1 {r['current']['f1']:.3f} -> {r['deployable']['f1']:.3f})")
+        self.stdout.write(f"\n✅ {len(adopted)} conceptos actualizados en concept_weights.")
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from core.models import UniqueProductCluster, MarketIntelligenceLog
-from core.ai_classifier import classify_term
+from core.ai_classifier import classify_terms
 import requests
 import logging
 import time
@@ -27,34 +27,44 @@ class Command(BaseCommand):
             logger.info("✅ No pending clusters to validate.")
             return
 
-        logger.info(f"⚡ Processing {candidates.count()} candidate clusters...")
+        candidates = list(candidates.select_related('representative_product'))
+        logger.info(f"⚡ Processing {len(candidates)} candidate clusters...")
+
+        # Taxonomía de todo el lote por adelantado (llamadas concurrentes a Ollama);
+        # el bucle queda limitado solo por el rate limit de los sensores
+        terms = {cluster.cluster_id: self.search_term(cluster) for cluster in candidates}
+        unique_terms = list(dict.fromkeys(t for t in terms.values() if t))
+        logger.info(f"   🧠 Classifying {len(unique_terms)} terms...")
+        taxonomies = dict(zip(unique_terms, classify_terms(unique_terms)))
 
         for cluster in candidates:
             try:
-                self.process_cluster(cluster)
+                term = terms[cluster.cluster_id]
+                self.process_cluster(cluster, term, taxonomies.get(term))
             except Exception as e:
                 logger.error(f"❌ Error processing cluster {cluster.cluster_id}: {e}")
                 
             # Rate limiting for sensors
             time.sleep(1.5) 
 
-    def process_cluster(self, cluster):
-        # A. Define Search Term (Concept Name preferred, or Product Title)
+    def search_term(self, cluster):
+        """A. Define Search Term (Concept Name preferred, or Product Title). None si no hay datos."""
         term = cluster.concept_name
         if not term or len(term) < 3:
             if cluster.representative_product:
-                term = cluster.representative_product.title[:100] # Truncate for safety
-            else:
-                cluster.taxonomy_type = 'NO_DATA'
-                cluster.save()
-                return
+                return cluster.representative_product.title[:100] # Truncate for safety
+            return None
+        return term
+
+    def process_cluster(self, cluster, term, taxonomy_result):
+        if term is None:
+            cluster.taxonomy_type = 'NO_DATA'
+            cluster.save()
+            return
 
         logger.info(f"\n🔍 Analyzing Cluster #{cluster.cluster_id}: '{term}'")
 
-        # B. Taxonomy Classification (AI)
-        logger.info("   🧠 Classifying Taxonomy...")
-        taxonomy_result = classify_term(term)
-        
+        # B. Taxonomy Classification (AI, precalculada para todo el lote)
         if not taxonomy_result:
             logger.warning("   ⚠️ AI Classification failed.")
             return
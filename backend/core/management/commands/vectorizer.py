@@ -2,6 +2,7 @@
 Módulo de Vectorización (Django Command).
 """
 
+import hashlib
 import os
 import time
 import requests
@@ -9,14 +10,19 @@ import logging
 import pathlib
 import sys
 from io import BytesIO
-import torch
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from transformers import AutoProcessor, SiglipModel
 import psycopg2
+from psycopg2.extras import execute_values
 from psycopg2.extensions import register_adapter, AsIs
 import numpy as np
 from django.core.management.base import BaseCommand
 from dotenv import load_dotenv
+from core.image_preprocessing import ImagePreprocessor
+from core.ai_utils import encode_batch, build_product_text, TEXT_MODEL_NAME
+from core.embedding_service import get_client, EmbeddingServiceError, MODEL_NAME, MODEL_VERSION
+from core.pipeline_events import PipelineListener, PRODUCTS_LOADED, PRODUCTS_VECTORIZED, notify
+from core.priority import two_lane_fetch
 
 load_dotenv()
 
@@ -55,36 +61,29 @@ if not pwd:
     pass 
 
 
-MODEL_NAME = "google/siglip-so400m-patch14-384" # 384px - Estado del Arte (1152 dims)
+BATCH_SIZE = 50 # Lote de imágenes por ciclo (= MAX_IMAGE_BATCH del embedding service)
+TEXT_BATCH_SIZE = 256 # MiniLM es barato: lotes grandes de Título + Descripción
 
 class Vectorizer:
     def __init__(self):
+        # El modelo SigLIP vive en el embedding service (proceso compartido).
+        # Aquí solo hay un cliente IPC: arranque instantáneo y sin copia extra del modelo en RAM/VRAM.
+        self.client = get_client()
+        # Versión que reporta el servicio conectado (la que se persiste con cada vector),
+        # no la EMBEDDING_MODEL_VERSION del entorno del cliente
+        self.model_version = None
         try:
-            logger.info(f"🧠 Cargando modelo SigLIP ({MODEL_NAME})...")
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            logger.info(f"   Hardware detectado: {self.device.upper()}")
-            
-            # Verificar variables de entorno importantes
-            hf_cache = os.getenv('HF_HOME', 'No configurado')
-            logger.info(f"   Cache HuggingFace: {hf_cache}")
-            
-            # Usamos AutoProcessor para manejar automáticamente el resize a 384x384
-            self.model = SiglipModel.from_pretrained(MODEL_NAME).to(self.device)
-            self.processor = AutoProcessor.from_pretrained(MODEL_NAME)
-            logger.info("✅ Modelo SigLIP cargado y listo para alta resolución.")
-            
-        except ImportError as e:
-            logger.error(f"❌ FALLO CRÍTICO: Dependencia faltante")
-            logger.error(f"   Error: {str(e)}")
-            logger.error(f"   Solución: Instalar dependencias faltantes en requirements.txt")
-            raise
-        except Exception as e:
-            logger.error(f"❌ FALLO CRÍTICO al cargar modelo SigLIP")
-            logger.error(f"   Tipo de error: {type(e).__name__}")
-            logger.error(f"   Detalles: {str(e)}")
-            logger.error(f"   Modelo: {MODEL_NAME}")
-            logger.error(f"   Device: {self.device if hasattr(self, 'device') else 'No definido'}")
-            raise
+            self.service_version()
+        except EmbeddingServiceError as e:
+            logger.warning(f"⚠️ Embedding service aún no disponible ({e}). Se reintentará en cada lote.")
+
+    def service_version(self):
+        """model_version del embedding service conectado (se consulta hasta obtenerla)."""
+        if self.model_version is None:
+            info = self.client.info()
+            self.model_version = info['model_version']
+            logger.info(f"🧠 Embedding service conectado: {info['model_version']} ({info['device'].upper()})")
+        return self.model_version
 
     def get_db_connection(self):
         return psycopg2.connect(
@@ -96,40 +95,56 @@ class Vectorizer:
             client_encoding='UTF8'
         )
 
-    def fetch_image(self, url):
+    def fetch_bytes(self, url):
         try:
             response = requests.get(url, timeout=5)
             response.raise_for_status()
-            image = Image.open(BytesIO(response.content)).convert("RGB")
-            return image
+            return response.content
         except Exception:
             return None
 
-    def generate_embedding(self, image):
-        # Wrapper legacy para compatibilidad si fuera necesario, o para procesar 1 sola
-        return self.generate_embedding_batch([image])[0]
+    def generate_embedding_batch(self, blobs):
+        """
+        Envía un lote de imágenes (bytes crudos) al embedding service.
+        La decodificación draft-mode, el preprocesamiento y la inferencia ocurren allí.
+        Retorna: (lista de vectores [1152] o None si la imagen es inválida, model_version)
+        """
+        return self.client.embed_images(blobs)
 
-    def generate_embedding_batch(self, images):
+    def embed_pending_texts(self, cur):
         """
-        Procesa una lista de imágenes de golpe (Batch) con SigLIP
-        Retorna: numpy array de shape [N, 1152]
+        Etapa de texto: rellena product_embeddings.embedding_text (MiniLM 384d, normalizado)
+        para filas ya creadas por la etapa visual. Un solo encode en lote + un UPDATE masivo.
+        Retorna: número de productos vectorizados.
         """
-        # SigLIP AutoProcessor maneja el resize y normalización
-        inputs = self.processor(images=images, return_tensors="pt", padding=True).to(self.device)
-        
-        with torch.no_grad():
-            # SigLIP: get_image_features retorna los embeddings ya proyectados
-            image_features = self.model.get_image_features(**inputs)
-        
-        # Normalización L2 (Importante para búsqueda por coseno)
-        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
-        return image_features.cpu().numpy()
+        rows = two_lane_fetch(cur, """
+            SELECT pe.product_id, p.title, p.description
+            FROM product_embeddings pe
+            JOIN products p ON p.product_id = pe.product_id
+            WHERE pe.embedding_text IS NULL
+        """, (), TEXT_BATCH_SIZE)
+        if not rows:
+            return 0
+
+        texts = [build_product_text(title, desc) for _, title, desc in rows]
+        vectors = encode_batch(texts, normalize=True)
+
+        execute_values(cur, """
+            UPDATE product_embeddings AS pe
+            SET embedding_text = v.emb::vector, embedding_text_model = v.model
+            FROM (VALUES %s) AS v(product_id, emb, model)
+            WHERE pe.product_id = v.product_id
+        """, [(row[0], vec, TEXT_MODEL_NAME) for row, vec in zip(rows, vectors)], page_size=TEXT_BATCH_SIZE)
+
+        logger.info(f"📝 Vectorizados {len(rows)} textos (Título + Descripción).")
+        return len(rows)
 
     def run(self):
         logger.info("🚀 Vectorizer daemon iniciado")
-        logger.info(f"   Device: {self.device}")
-        logger.info(f"   Modelo: {MODEL_NAME}")
-        logger.info(f"   Cache HF: {os.getenv('HF_HOME', 'No configurado')}")
+        logger.info(f"   Modelo visual: {self.model_version or MODEL_VERSION} (embedding service)")
+        logger.info(f"   Modelo texto: {TEXT_MODEL_NAME}")
+        # Despierta cuando el loader confirma productos (el timeout es solo red de seguridad)
+        listener = PipelineListener(PRODUCTS_LOADED, connect=self.get_db_connection)
         
         while True:
             conn = None
@@ -137,8 +152,9 @@ class Vectorizer:
                 conn = self.get_db_connection()
                 cur = conn.cursor()
 
+                # Carril prioritario (priority_score: margen + stock + recencia) + carril de backfill
                 sql_queue = """
-                    SELECT p.product_id, p.url_image_s3 
+                    SELECT p.product_id, p.url_image_s3
                     FROM products p
                     LEFT JOIN product_embeddings pe ON p.product_id = pe.product_id
                     WHERE p.url_image_s3 IS NOT NULL 
@@ -152,73 +168,89 @@ class Vectorizer:
                             -- don't retry immediately even if product updated. Wait 15 mins.
                             AND pe.processed_at < (NOW() - INTERVAL '15 minutes')
                         )
+                        -- Vectores de una versión de modelo anterior: re-vectorizar al nuevo espacio
+                        OR (
+                            pe.embedding_visual IS NOT NULL
+                            AND pe.embedding_visual_model IS DISTINCT FROM %s
+                        )
                     )
-                    LIMIT 50;
                 """
-                cur.execute(sql_queue)
-                rows = cur.fetchall()
+                try:
+                    model_version = self.service_version()
+                except EmbeddingServiceError as e:
+                    # Sin versión del servicio no se sabe qué vectores están obsoletos
+                    logger.error(f"❌ Embedding service no disponible: {e}")
+                    conn.close()
+                    time.sleep(10)
+                    continue
+                rows = two_lane_fetch(cur, sql_queue, (model_version,), BATCH_SIZE)
 
                 if not rows:
-                    logger.info("💤 Todo al día. Durmiendo 30s...")
-                    time.sleep(30)
-                    if conn: conn.close()
+                    # Sin imágenes pendientes: aprovechar el ciclo para la etapa de texto
+                    texts_done = self.embed_pending_texts(cur)
+                    conn.commit()
+                    conn.close()
+                    if not texts_done:
+                        logger.info("💤 Todo al día. Esperando productos nuevos (LISTEN)...")
+                        listener.wait()
                     continue
 
                 logger.info(f"🔨 Procesando lote de {len(rows)} imágenes (Modo Batch)...")
                 
                 # --- OPTIMIZACIÓN PARALELA ---
-                from concurrent.futures import ThreadPoolExecutor
-                
                 # 1. Descarga Paralela de Imágenes (I/O Bound)
-                images_map = {} # { product_id: PIL.Image }
+                images_map = {} # { product_id: bytes }
                 failed_ids = []
                 
-                def download_task(row):
-                    pid, url = row
-                    img = self.fetch_image(url)
-                    return pid, img
-
                 with ThreadPoolExecutor(max_workers=20) as executor:
-                    futures = [executor.submit(download_task, r) for r in rows]
-                    for f in futures:
-                        pid, img = f.result()
-                        if img:
-                            images_map[pid] = img
+                    for (pid, _), data in zip(rows, executor.map(self.fetch_bytes, [r[1] for r in rows])):
+                        if data:
+                            images_map[pid] = data
                         else:
                             failed_ids.append(pid)
                 
-                # 2. Procesamiento Batch IA (GPU/CPU Bound)
+                # 2. Procesamiento Batch IA (Embedding service: decode + preprocess + GPU)
                 if images_map:
-                    # Crear listas ordenadas para el batch
                     valid_pids = list(images_map.keys())
-                    valid_images = list(images_map.values())
                     
                     try:
-                        # Inferencia en Batch (Mucho más rápido que 1 a 1)
-                        # Nota: Se asume que 100 imágenes caben en VRAM. Si falla, reduce el LIMIT del SQL.
-                        vectors = self.generate_embedding_batch(valid_images) # Nueva función batch
+                        vectors, model_version = self.generate_embedding_batch(list(images_map.values()))
+                        # El servicio pudo reiniciarse con otro modelo: la cola usa la versión nueva
+                        self.model_version = model_version
                         
-                        # 3. Guardado en DB
+                        # 3. Guardado en DB (con tag de versión del modelo en cada vector)
+                        # image_digest: sha256 de los bytes (fast path EXACT_IMAGE del clusterizer)
                         sql_upsert = """
-                            INSERT INTO product_embeddings (product_id, embedding_visual, processed_at)
-                            VALUES (%s, %s, NOW())
+                            INSERT INTO product_embeddings (product_id, embedding_visual, embedding_visual_model, image_digest, processed_at)
+                            VALUES (%s, %s, %s, %s, NOW())
                             ON CONFLICT (product_id) 
-                            DO UPDATE SET embedding_visual = EXCLUDED.embedding_visual, processed_at = NOW();
+                            DO UPDATE SET embedding_visual = EXCLUDED.embedding_visual,
+                                          embedding_visual_model = EXCLUDED.embedding_visual_model,
+                                          image_digest = EXCLUDED.image_digest,
+                                          processed_at = NOW();
                         """
                         
-                        # Preparar datos para executemany (o loop rápido)
-                        upsert_data = []
-                        for i, pid in enumerate(valid_pids):
-                            vec_list = vectors[i].tolist()
-                            upsert_data.append((pid, vec_list))
-                            
-                        # Usamos loop con execute por seguridad con el adaptador pgvector manual,
-                        # executemany a veces da problemas con listas complejas si no está bien configurado el adapter.
-                        for pid, vec in upsert_data:
-                            cur.execute(sql_upsert, (pid, vec))
+                        done = 0
+                        for pid, vec in zip(valid_pids, vectors):
+                            if vec is None:
+                                # Bytes descargados pero no decodificables
+                                failed_ids.append(pid)
+                                continue
+                            cur.execute(sql_upsert, (pid, vec.tolist(), model_version, hashlib.sha256(images_map[pid]).hexdigest()))
+                            done += 1
                             
-                        logger.info(f"✅ Vectorizados {len(valid_pids)} productos en paralelo.")
+                        logger.info(f"✅ Vectorizados {done} productos en paralelo.")
+                        if done:
+                            # Despertar al classifier (se entrega con el commit del lote)
+                            notify(cur, PRODUCTS_VECTORIZED, done)
                         
+                    except EmbeddingServiceError as e:
+                        # Servicio caído: no marcar como fallidos, reintentar el lote completo luego
+                        logger.error(f"❌ Embedding service no disponible: {e}")
+                        conn.rollback()
+                        conn.close()
+                        time.sleep(10)
+                        continue
                     except Exception as e:
                         logger.error(f"Error en batch IA: {e}")
                         # Fallback a dummy para no bloquear
@@ -236,6 +268,9 @@ class Vectorizer:
                          cur.execute(sql_upsert_dummy, (pid,))
                      logger.info(f"⚠️ Marcados {len(failed_ids)} fallidos o sin imagen.")
 
+                # 5. Etapa de texto (mismo lote + pendientes históricos)
+                self.embed_pending_texts(cur)
+
                 conn.commit()
                 cur.close()
                 conn.close()
@@ -245,10 +280,79 @@ class Vectorizer:
                 time.sleep(10)
                 if conn: conn.close()
 
+    def benchmark(self, n_images):
+        """
+        Compara el tiempo de CPU por imagen del preprocesamiento legacy
+        (decode completo + AutoProcessor en el hilo principal) vs draft mode + pool.
+        No incluye descarga ni inferencia (idénticas en ambos caminos).
+        """
+        conn = self.get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT url_image_s3 FROM products
+            WHERE url_image_s3 IS NOT NULL AND url_image_s3 != ''
+            ORDER BY product_id DESC
+            LIMIT %s
+        """, (n_images,))
+        urls = [r[0] for r in cur.fetchall()]
+        cur.close()
+        conn.close()
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            blobs = [b for b in executor.map(self.fetch_bytes, urls) if b]
+
+        # Solo CPU: basta el AutoProcessor (no se carga el modelo)
+        from transformers import AutoProcessor
+        processor = AutoProcessor.from_pretrained(MODEL_NAME)
+        preprocessor = ImagePreprocessor.from_processor(processor, max_batch=BATCH_SIZE)
+
+        if not blobs:
+            logger.warning("⚠️ Benchmark: no se pudo descargar ninguna imagen.")
+            return
+
+        logger.info(f"⏱️ Benchmark de preprocesamiento sobre {len(blobs)} imágenes (lotes de {BATCH_SIZE})...")
+
+        def measure(fn):
+            cpu0, wall0 = time.process_time(), time.perf_counter()
+            for i in range(0, len(blobs), BATCH_SIZE):
+                fn(blobs[i:i + BATCH_SIZE])
+            return time.process_time() - cpu0, time.perf_counter() - wall0
+
+        def legacy(chunk):
+            images = [Image.open(BytesIO(b)).convert("RGB") for b in chunk]
+            return processor(images=images, return_tensors="pt", padding=True)["pixel_values"]
+
+        def optimized(chunk):
+            images = [img for img in preprocessor.load_batch(chunk) if img is not None]
+            return preprocessor.preprocess_batch(images)
+
+        legacy_cpu, legacy_wall = measure(legacy)
+        new_cpu, new_wall = measure(optimized)
+
+        # Fidelidad: diferencia media de píxeles normalizados en el primer lote
+        chunk = blobs[:BATCH_SIZE]
+        ref = legacy(chunk)
+        new = optimized(chunk)
+        mean_abs_diff = (ref - new).abs().mean().item() if ref.shape == new.shape else float("nan")
+
+        n = len(blobs)
+        logger.info(f"   Legacy   : {legacy_cpu / n * 1000:.1f} ms CPU/img | {legacy_wall / n * 1000:.1f} ms wall/img")
+        logger.info(f"   Draft+Pool: {new_cpu / n * 1000:.1f} ms CPU/img | {new_wall / n * 1000:.1f} ms wall/img")
+        logger.info(f"   Ahorro CPU: {(1 - new_cpu / legacy_cpu) * 100:.1f}% | Diferencia media píxel: {mean_abs_diff:.4f}")
+
 class Command(BaseCommand):
     help = 'AI Vectorizer Daemon'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--benchmark', type=int, default=0,
+            help='Mide CPU/imagen del preprocesamiento (legacy vs draft mode) sobre N imágenes y termina.'
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write("🚀 VECTORIZER DAEMON INICIADO")
         v = Vectorizer()
+        if options['benchmark']:
+            v.benchmark(options['benchmark'])
+            return
+        self.stdout.write("🚀 VECTORIZER DAEMON INICIADO")
         v.run()
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-19 10:12
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_futureevent_category_description_category_embedding_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productembedding',
+            name='embedding_text',
+            field=core.models.VectorField(blank=True, dimensions=384, null=True),
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS idx_emb_text ON product_embeddings USING hnsw (embedding_text vector_cosine_ops) WITH (m='16', ef_construction='64');",
+            reverse_sql="DROP INDEX IF EXISTS idx_emb_text;",
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_productembedding_embedding_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productembedding',
+            name='embedding_visual_model',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='productembedding',
+            name='embedding_text_model',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        # Los vectores existentes fueron generados por SigLIP so400m (vectorizer) y MiniLM (ai_utils)
+        migrations.RunSQL(
+            sql="""
+                UPDATE product_embeddings SET embedding_visual_model = 'google/siglip-so400m-patch14-384'
+                WHERE embedding_visual IS NOT NULL;
+                UPDATE product_embeddings SET embedding_text_model = 'paraphrase-multilingual-MiniLM-L12-v2'
+                WHERE embedding_text IS NOT NULL;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
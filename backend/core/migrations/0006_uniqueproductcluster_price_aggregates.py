@@ -0,0 +1,61 @@
+# Generated by Django 5.2.9 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_productembedding_model_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uniqueproductcluster',
+            name='price_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='uniqueproductcluster',
+            name='price_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniqueproductcluster',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='uniqueproductcluster',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        # Backfill set-based desde las membresías (mismo cálculo que reconcile_cluster_metrics)
+        migrations.RunSQL(
+            sql="""
+                WITH truth AS (
+                    SELECT c.cluster_id,
+                           COUNT(m.product_id) AS members,
+                           COALESCE(SUM(p.sale_price), 0) AS price_sum,
+                           COUNT(p.sale_price) AS price_count,
+                           MIN(p.sale_price) AS min_price,
+                           MAX(p.sale_price) AS max_price
+                    FROM unique_product_clusters c
+                    LEFT JOIN product_cluster_membership m ON m.cluster_id = c.cluster_id
+                    LEFT JOIN products p ON p.product_id = m.product_id
+                    GROUP BY c.cluster_id
+                )
+                UPDATE unique_product_clusters c SET
+                    total_competitors = t.members,
+                    price_sum = t.price_sum,
+                    price_count = t.price_count,
+                    min_price = t.min_price,
+                    max_price = t.max_price,
+                    average_price = ROUND(t.price_sum / NULLIF(t.price_count, 0), 2)
+                FROM truth t
+                WHERE c.cluster_id = t.cluster_id;
+                CREATE INDEX IF NOT EXISTS idx_clusters_competitors_price ON unique_product_clusters USING btree (total_competitors, average_price);
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-19 16:40
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_uniqueproductcluster_price_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uniqueproductcluster',
+            name='centroid_visual',
+            field=core.models.VectorField(blank=True, dimensions=1152, null=True),
+        ),
+        # Backfill: suma de los vectores visuales de los miembros (mismo cálculo que reconcile_cluster_metrics)
+        migrations.RunSQL(
+            sql="""
+                UPDATE unique_product_clusters c SET centroid_visual = t.centroid
+                FROM (
+                    SELECT m.cluster_id, SUM(pe.embedding_visual) AS centroid
+                    FROM product_cluster_membership m
+                    JOIN product_embeddings pe ON pe.product_id = m.product_id
+                    WHERE pe.embedding_visual IS NOT NULL
+                    GROUP BY m.cluster_id
+                ) t
+                WHERE c.cluster_id = t.cluster_id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS idx_cluster_centroid ON unique_product_clusters USING hnsw (centroid_visual vector_cosine_ops) WITH (m='16', ef_construction='64');",
+            reverse_sql="DROP INDEX IF EXISTS idx_cluster_centroid;",
+        ),
+    ]
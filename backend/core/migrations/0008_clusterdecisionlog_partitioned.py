@@ -0,0 +1,81 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+# Tabla nueva particionada por mes; la PK debe incluir la clave de partición.
+# Se copia TODO el historial (sin títulos/imágenes), con una partición por mes desde la fila más
+# antigua: la retención (DECISION_LOG_RETENTION_DAYS) la aplica después maintain_partitions.
+PARTITION_SQL = """
+    CREATE TABLE cluster_decision_logs_partitioned (
+        id bigint NOT NULL,
+        "timestamp" timestamp with time zone NOT NULL,
+        product_id bigint NOT NULL,
+        candidate_id bigint NOT NULL,
+        visual_score double precision,
+        text_score double precision,
+        final_score double precision,
+        decision varchar(50),
+        match_method varchar(50),
+        active_weights jsonb,
+        sample_rate double precision DEFAULT 1 NOT NULL,
+        CONSTRAINT cluster_decision_logs_pkey_p PRIMARY KEY (id, "timestamp")
+    ) PARTITION BY RANGE ("timestamp");
+
+    DO $$
+    DECLARE month date;
+    BEGIN
+        FOR month IN
+            SELECT generate_series(date_trunc('month', LEAST(COALESCE((SELECT MIN("timestamp") FROM cluster_decision_logs), now()), now())),
+                                   date_trunc('month', now() + interval '1 month'),
+                                   interval '1 month')::date
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE cluster_decision_logs_p%s PARTITION OF cluster_decision_logs_partitioned FOR VALUES FROM (%L) TO (%L)',
+                to_char(month, 'YYYYMM'), month, month + interval '1 month'
+            );
+        END LOOP;
+    END $$;
+    CREATE TABLE cluster_decision_logs_default PARTITION OF cluster_decision_logs_partitioned DEFAULT;
+
+    INSERT INTO cluster_decision_logs_partitioned
+        (id, "timestamp", product_id, candidate_id, visual_score, text_score, final_score, decision, match_method, active_weights)
+    SELECT id, "timestamp", product_id, candidate_id, visual_score, text_score, final_score, decision, match_method, active_weights
+    FROM cluster_decision_logs;
+
+    DROP TABLE cluster_decision_logs;
+    ALTER TABLE cluster_decision_logs_partitioned RENAME TO cluster_decision_logs;
+    ALTER TABLE cluster_decision_logs RENAME CONSTRAINT cluster_decision_logs_pkey_p TO cluster_decision_logs_pkey;
+
+    CREATE SEQUENCE cluster_decision_logs_id_seq OWNED BY cluster_decision_logs.id;
+    SELECT setval('cluster_decision_logs_id_seq', COALESCE((SELECT MAX(id) FROM cluster_decision_logs), 0) + 1, false);
+    ALTER TABLE cluster_decision_logs ALTER COLUMN id SET DEFAULT nextval('cluster_decision_logs_id_seq');
+
+    CREATE INDEX idx_decision_logs_timestamp ON cluster_decision_logs USING btree ("timestamp" DESC);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_uniqueproductcluster_centroid_visual'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(sql=PARTITION_SQL, reverse_sql=migrations.RunSQL.noop),
+            ],
+            state_operations=[
+                migrations.RemoveField(model_name='clusterdecisionlog', name='title_a'),
+                migrations.RemoveField(model_name='clusterdecisionlog', name='title_b'),
+                migrations.RemoveField(model_name='clusterdecisionlog', name='image_a'),
+                migrations.RemoveField(model_name='clusterdecisionlog', name='image_b'),
+                migrations.AddField(
+                    model_name='clusterdecisionlog',
+                    name='sample_rate',
+                    field=models.FloatField(default=1.0),
+                ),
+            ],
+        ),
+    ]
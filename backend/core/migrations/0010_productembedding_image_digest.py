@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-19 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_productclustermembership_clustered_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productembedding',
+            name='image_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        # Índices hash para el fast path exacto (solo igualdad). La expresión del SKU debe ser
+        # idéntica a core.clustering.SKU_KEY_SQL para que el planner use el índice.
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS idx_products_sku_key ON products USING hash ((upper(regexp_replace(sku, '[^a-zA-Z0-9]', '', 'g'))));",
+            reverse_sql="DROP INDEX IF EXISTS idx_products_sku_key;",
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS idx_emb_image_digest ON product_embeddings USING hash (image_digest);",
+            reverse_sql="DROP INDEX IF EXISTS idx_emb_image_digest;",
+        ),
+    ]
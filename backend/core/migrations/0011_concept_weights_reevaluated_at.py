@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-19 20:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_productembedding_image_digest'),
+    ]
+
+    # concept_weights no tiene modelo (tabla SQL del ai_trainer): se altera solo si existe.
+    # reevaluated_at = último last_updated cuyas membresías dudosas ya se re-evaluaron.
+    operations = [
+        migrations.RunSQL(
+            sql="ALTER TABLE IF EXISTS concept_weights ADD COLUMN IF NOT EXISTS reevaluated_at timestamp with time zone;",
+            reverse_sql="ALTER TABLE IF EXISTS concept_weights DROP COLUMN IF EXISTS reevaluated_at;",
+        ),
+    ]
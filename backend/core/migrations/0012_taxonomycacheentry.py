@@ -0,0 +1,37 @@
+# Generated by Django 5.2.9 on 2026-10-19 21:20
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_concept_weights_reevaluated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxonomyCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('title_key', models.TextField()),
+                ('title_embedding', core.models.VectorField(blank=True, dimensions=384, null=True)),
+                ('model_name', models.CharField(max_length=100)),
+                ('prompt_version', models.CharField(max_length=20)),
+                ('result', models.JSONField(default=dict)),
+                ('llm_seconds', models.FloatField(default=0.0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'taxonomy_cache',
+                'unique_together': {('title_key', 'model_name', 'prompt_version')},
+            },
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS idx_taxonomy_cache_embedding ON taxonomy_cache USING hnsw (title_embedding vector_cosine_ops) WITH (m='16', ef_construction='64');",
+            reverse_sql="DROP INDEX IF EXISTS idx_taxonomy_cache_embedding;",
+        ),
+    ]
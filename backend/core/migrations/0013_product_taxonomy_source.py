@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 21:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_taxonomycacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='taxonomy_source',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
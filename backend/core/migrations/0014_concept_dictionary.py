@@ -0,0 +1,44 @@
+# Generated by Django 5.2.9 on 2026-10-19 22:40
+
+import core.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_product_taxonomy_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Concept',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('name_key', models.CharField(max_length=255, unique=True)),
+                ('industry', models.CharField(blank=True, max_length=255, null=True)),
+                ('embedding', core.models.VectorField(blank=True, dimensions=384, null=True)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'concepts',
+            },
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS idx_concepts_embedding ON concepts USING hnsw (embedding vector_cosine_ops) WITH (m='16', ef_construction='64');",
+            reverse_sql="DROP INDEX IF EXISTS idx_concepts_embedding;",
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='concept',
+            field=models.ForeignKey(blank=True, db_column='concept_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='core.concept'),
+        ),
+        migrations.AddField(
+            model_name='uniqueproductcluster',
+            name='concept',
+            field=models.ForeignKey(blank=True, db_column='concept_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clusters', to='core.concept'),
+        ),
+    ]
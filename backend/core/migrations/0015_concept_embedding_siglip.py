@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-19 23:10
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_concept_dictionary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='concept',
+            name='embedding_siglip',
+            field=core.models.VectorField(blank=True, dimensions=1152, null=True),
+        ),
+        migrations.AddField(
+            model_name='concept',
+            name='embedding_siglip_model',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-19 23:40
+
+from django.db import migrations, models
+
+
+def backfill_priorities(apps, schema_editor):
+    from core.priority import refresh_cluster_priorities, refresh_product_priorities
+
+    with schema_editor.connection.cursor() as cur:
+        refresh_product_priorities(cur)
+        refresh_cluster_priorities(cur)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_concept_embedding_siglip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='priority_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uniqueproductcluster',
+            name='priority_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.OrderBy(models.F('priority_score'), descending=True, nulls_last=True), name='idx_products_priority'),
+        ),
+        migrations.AddIndex(
+            model_name='uniqueproductcluster',
+            index=models.Index(models.OrderBy(models.F('priority_score'), descending=True, nulls_last=True), name='idx_clusters_priority'),
+        ),
+        migrations.RunPython(backfill_priorities, migrations.RunPython.noop),
+    ]
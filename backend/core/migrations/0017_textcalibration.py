@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-20 10:15
+
+import json
+import pathlib
+
+from django.db import migrations, models
+
+# Ubicación anterior (dentro del paquete): se importa si existe
+LEGACY_CALIBRATION_FILE = pathlib.Path(__file__).resolve().parent.parent / "text_similarity_calibration.json"
+
+
+def import_calibration_file(apps, schema_editor):
+    TextCalibration = apps.get_model('core', 'TextCalibration')
+    try:
+        data = json.loads(LEGACY_CALIBRATION_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+    # Formato plano (solo kernel difuso) o {tipo: calibración}
+    calibrations = {"fuzzy": data} if "x" in data else data
+    for kind, calibration in calibrations.items():
+        TextCalibration.objects.update_or_create(kind=kind, defaults={
+            "knots": {"x": calibration["x"], "y": calibration["y"]},
+            "pairs": calibration.get("pairs", 0),
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_priority_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextCalibration',
+            fields=[
+                ('kind', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('knots', models.JSONField(default=dict)),
+                ('pairs', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'text_calibrations',
+            },
+        ),
+        migrations.RunPython(import_calibration_file, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-20 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_textcalibration'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at'], name='idx_products_created'),
+        ),
+    ]
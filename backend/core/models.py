@@ -101,6 +101,28 @@ class FutureEvent(models.Model):
         return f"{self.name} ({self.date_start})"
 
 
+class Concept(models.Model):
+    """Diccionario canónico de conceptos: las variantes del LLM se resuelven aquí (ver core.concept_dictionary)."""
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=255, unique=True) # Nombre canónico: "Silla Gamer"
+    name_key = models.CharField(max_length=255, unique=True) # Normalizado: "silla gamer"
+    industry = models.CharField(max_length=255, null=True, blank=True)
+    # MiniLM del nombre normalizado (HNSW idx_concepts_embedding): resolución por similitud
+    embedding = VectorField(dimensions=384, null=True, blank=True)
+    # Torre de texto SigLIP del nombre (mismo espacio que embedding_visual): asignación zero-shot (core.zero_shot)
+    embedding_siglip = VectorField(dimensions=1152, null=True, blank=True)
+    embedding_siglip_model = models.CharField(max_length=100, null=True, blank=True)
+    # Variantes del LLM (normalizadas) que se resolvieron a este concepto: "silla gamer ergonomica"
+    aliases = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'concepts'
+
+    def __str__(self):
+        return self.name
+
+
 class Product(models.Model):
     product_id = models.BigIntegerField(primary_key=True)
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, db_column='supplier_id', null=True, blank=True)
@@ -117,6 +139,10 @@ class Product(models.Model):
     taxonomy_concept = models.CharField(max_length=255, null=True, blank=True) # "Silla Gamer"
     taxonomy_industry = models.CharField(max_length=255, null=True, blank=True) # "Muebles"
     taxonomy_level = models.CharField(max_length=50, null=True, blank=True) # "CONCEPT", "PRODUCT"
+    # Origen de la etiqueta: "LLM", "VISUAL_CONSENSUS" o "LLM_CONSENSUS_AGREE/DISAGREE" (modo sombra)
+    taxonomy_source = models.CharField(max_length=50, null=True, blank=True)
+    # Concepto canónico (taxonomy_concept guarda su nombre); clave entera para agrupar
+    concept = models.ForeignKey(Concept, on_delete=models.SET_NULL, db_column='concept_id', null=True, blank=True, related_name='products')
     
     # Metadata de Rastreo (V2)
     source_platform = models.CharField(max_length=50, default='dropi', null=True, blank=True)
@@ -126,11 +152,15 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Orden de las colas de los daemons: margen + stock + recencia (core.priority)
+    priority_score = models.FloatField(null=True, blank=True)
 
     class Meta:
         db_table = 'products'
         indexes = [
             models.Index(fields=['-profit_margin', '-created_at']),
+            models.Index(models.F('priority_score').desc(nulls_last=True), name='idx_products_priority'),
+            models.Index(fields=['created_at'], name='idx_products_created'), # Carril de backfill
         ]
 
     def __str__(self):
@@ -170,10 +200,19 @@ class UniqueProductCluster(models.Model):
     # Metricas de Oferta (Internas)
     total_competitors = models.IntegerField(default=1)
     average_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    # Agregados de precio mantenidos por deltas (core.cluster_metrics)
+    price_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    price_count = models.IntegerField(default=0)
+    min_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    # Suma de los embedding_visual de los miembros (centroide sin normalizar, HNSW coseno)
+    centroid_visual = VectorField(dimensions=1152, null=True, blank=True)
     saturation_score = models.CharField(max_length=20, null=True, blank=True)
     
     # Identidad Humana (V2)
     concept_name = models.CharField(max_length=255, null=True, blank=True)
+    # Concepto canónico del representante (core.concept_dictionary)
+    concept = models.ForeignKey(Concept, on_delete=models.SET_NULL, db_column='concept_id', null=True, blank=True, related_name='clusters')
 
     # Maquina de Estados (V2 - Critical)
     analysis_level = models.IntegerField(default=0) # 0=Nuevo, 1=Trends Checked, 2=Shopify Checked, 3=Full Audit
@@ -199,12 +238,17 @@ class UniqueProductCluster(models.Model):
     dropi_competition_tier = models.CharField(max_length=20, default='LOW', null=True, blank=True) # LOW, MID, HIGH, SATURATED
     
     validation_log = models.TextField(null=True, blank=True)
+    # Orden de la cola del market agent: margen del representante + tamaño + recencia (core.priority)
+    priority_score = models.FloatField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'unique_product_clusters'
+        indexes = [
+            models.Index(models.F('priority_score').desc(nulls_last=True), name='idx_clusters_priority'),
+        ]
 
     def __str__(self):
         return f"Cluster {self.cluster_id} - {self.concept_name or 'Unknown'} ({self.total_competitors} sellers)"
@@ -226,6 +270,7 @@ class ProductClusterMembership(models.Model):
     )
     match_confidence = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
     match_method = models.CharField(max_length=50, null=True, blank=True)
+    clustered_at = models.DateTimeField(null=True, blank=True) # Primera asignación (latencia del pipeline)
 
     class Meta:
         db_table = 'product_cluster_membership'
@@ -243,6 +288,13 @@ class ProductEmbedding(models.Model):
     )
     # Vector Visual (1152 dim for SigLIP)
     embedding_visual = VectorField(dimensions=1152, null=True, blank=True)
+    # Vector Textual (384 dim, MiniLM multilingüe: Título + Descripción, normalizado L2)
+    embedding_text = VectorField(dimensions=384, null=True, blank=True)
+    # Versión del modelo que generó cada vector (nunca comparar vectores de espacios distintos)
+    embedding_visual_model = models.CharField(max_length=100, null=True, blank=True)
+    embedding_text_model = models.CharField(max_length=100, null=True, blank=True)
+    # SHA-256 de los bytes de la imagen descargada (fast path EXACT_IMAGE del clusterizer)
+    image_digest = models.CharField(max_length=64, null=True, blank=True)
     
     processed_at = models.DateTimeField(null=True, blank=True)
 
@@ -287,19 +339,17 @@ class ClusterDecisionLog(models.Model):
     id = models.BigAutoField(primary_key=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     product_id = models.BigIntegerField()
-    candidate_id = models.BigIntegerField()
-    title_a = models.TextField(null=True, blank=True)
-    title_b = models.TextField(null=True, blank=True)
-    image_a = models.TextField(null=True, blank=True)
-    image_b = models.TextField(null=True, blank=True)
+    candidate_id = models.BigIntegerField() # Títulos/imágenes se leen de products por id
     visual_score = models.FloatField(null=True, blank=True)
     text_score = models.FloatField(null=True, blank=True)
     final_score = models.FloatField(null=True, blank=True)
     decision = models.CharField(max_length=50, null=True, blank=True)  # MATCH / REJECT
     match_method = models.CharField(max_length=50, null=True, blank=True)
     active_weights = models.JSONField(default=dict, null=True, blank=True)
+    sample_rate = models.FloatField(default=1.0) # Fracción muestreada (REJECT < 1): re-ponderar conteos
 
     class Meta:
+        # Particionada por mes sobre "timestamp" (ver core.decision_log)
         db_table = 'cluster_decision_logs'
         ordering = ['-timestamp']
 
@@ -317,3 +367,34 @@ class MarketIntelligenceLog(models.Model):
 
     class Meta:
         db_table = 'market_intelligence_logs'
+
+
+class TaxonomyCacheEntry(models.Model):
+    """Resultado del Taxonomist (LLM) por título normalizado (ver core.taxonomy_cache)."""
+    id = models.BigAutoField(primary_key=True)
+    title_key = models.TextField() # Título normalizado (minúsculas, sin tildes ni signos)
+    # MiniLM del título normalizado: fallback por vecino cercano
+    title_embedding = VectorField(dimensions=384, null=True, blank=True)
+    # Invalidación: una entrada solo sirve para el mismo modelo y versión de prompt
+    model_name = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=20)
+    result = models.JSONField(default=dict)
+    llm_seconds = models.FloatField(default=0.0) # Lo que tardó la llamada original (ahorro por hit)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'taxonomy_cache'
+        unique_together = ('title_key', 'model_name', 'prompt_version')
+
+
+class TextCalibration(models.Model):
+    """Mapeo por cuantiles score de texto -> escala SequenceMatcher legacy (ver core.text_similarity)."""
+    kind = models.CharField(max_length=20, primary_key=True) # fuzzy / embedding
+    knots = models.JSONField(default=dict) # {"x": [...], "y": [...]}
+    pairs = models.IntegerField(default=0) # Pares con los que se ajustó
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'text_calibrations'
@@ -0,0 +1,91 @@
+"""
+Eventos del Pipeline (Postgres LISTEN/NOTIFY).
+
+Cada etapa avisa al confirmar trabajo y la siguiente despierta al instante, en lugar de
+dormir un intervalo fijo:
+
+    loader ──products_loaded──▶ vectorizer ──products_vectorized──▶ classifier
+    classifier ──products_classified──▶ clusterizer ──clusters_updated──▶ market_agent
+
+- notify(): pg_notify dentro de la transacción de la etapa; Postgres lo entrega solo al
+  hacer COMMIT (un rollback no despierta a nadie).
+- PipelineListener.wait(): bloquea en select() sobre una conexión dedicada en autocommit
+  hasta que llega un aviso o vence el timeout (PIPELINE_SAFETY_POLL), que queda como
+  red de seguridad por si se pierde un aviso (reinicio de la DB, etapa sin NOTIFY).
+- Los avisos que llegan mientras el daemon trabaja quedan en la conexión: el siguiente
+  wait() retorna de inmediato, así no se pierde trabajo entre ciclos.
+"""
+
+import logging
+import os
+import select
+import time
+
+logger = logging.getLogger("pipeline_events")
+
+PRODUCTS_LOADED = "products_loaded"
+PRODUCTS_VECTORIZED = "products_vectorized"
+PRODUCTS_CLASSIFIED = "products_classified"
+CLUSTERS_UPDATED = "clusters_updated"
+
+SAFETY_POLL = float(os.getenv("PIPELINE_SAFETY_POLL", "300"))
+FALLBACK_POLL = 30 # Sondeo mientras la conexión de escucha está caída
+
+
+def notify(cur, channel, payload=""):
+    """Aviso transaccional: se entrega al hacer COMMIT de la transacción de `cur`."""
+    cur.execute("SELECT pg_notify(%s, %s)", (channel, str(payload)))
+
+
+def _django_connection():
+    from django.db import connection
+    return connection.get_new_connection(connection.get_connection_params())
+
+
+class PipelineListener:
+    """Conexión dedicada que escucha uno o más canales. `connect`: callable -> conexión psycopg2."""
+
+    def __init__(self, *channels, connect=None):
+        self.channels = channels
+        self.connect = connect or _django_connection
+        self.conn = None
+
+    def _ensure(self):
+        if self.conn is not None and not self.conn.closed:
+            return self.conn
+        conn = self.connect()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for channel in self.channels:
+                cur.execute(f"LISTEN {channel}")
+        self.conn = conn
+        return conn
+
+    def wait(self, timeout=SAFETY_POLL):
+        """
+        Bloquea hasta recibir un aviso o hasta `timeout` segundos.
+        Retorna: lista de (canal, payload); vacía si despertó por timeout (sondeo de seguridad).
+        """
+        try:
+            conn = self._ensure()
+            conn.poll()
+            if not conn.notifies and select.select([conn], [], [], timeout) != ([], [], []):
+                conn.poll()
+            events = [(n.channel, n.payload) for n in conn.notifies]
+            conn.notifies.clear()
+            return events
+        except Exception as e:
+            # Sin conexión de escucha: degradar a sondeo simple hasta reconectar
+            wait = min(timeout, FALLBACK_POLL)
+            logger.warning(f"⚠️ LISTEN no disponible ({e}). Sondeo cada {wait:.0f}s.")
+            self.close()
+            time.sleep(wait)
+            return []
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
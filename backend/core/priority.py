@@ -0,0 +1,112 @@
+"""
+Prioridad de Trabajo Compartida (productos y clusters).
+
+Cada daemon toma su lote de una cola implícita (filas pendientes de su etapa). Sin prioridad,
+en una ingesta grande de catálogo un producto de alto margen espera detrás de miles de filas
+cualquiera antes de llegar a la Gold Mine. priority_score (products / unique_product_clusters)
+ordena esas colas:
+
+    priority = log2(1 + margen) + PRIORITY_STOCK_WEIGHT * log2(1 + stock)
+               + PRIORITY_SIZE_WEIGHT * log2(miembros) + horas desde PRIORITY_EPOCH / PRIORITY_HALF_LIFE_HOURS
+
+Es el log2 de valor * 2^(-edad / vida media): ordenar por él equivale a ordenar por valor con
+decaimiento exponencial, pero el término de recencia no cambia con el tiempo, así que el score
+se guarda una vez (loader / cluster_metrics) y no hay que refrescarlo por antigüedad.
+- Productos: margen (profit_margin), stock del proveedor (último snapshot por bodega), recencia.
+- Clusters: margen del representante, tamaño (total_competitors), recencia.
+
+Carril de backfill: PRIORITY_BACKFILL_SHARE del lote se reserva para los pendientes MÁS ANTIGUOS,
+así lo de bajo score no queda en inanición mientras siga entrando catálogo nuevo.
+Tras cambiar los pesos: `python manage.py refresh_priorities`.
+"""
+
+import os
+
+from django.db.models import F
+
+PRIORITY_HALF_LIFE_HOURS = float(os.getenv("PRIORITY_HALF_LIFE_HOURS", "72"))
+PRIORITY_STOCK_WEIGHT = float(os.getenv("PRIORITY_STOCK_WEIGHT", "0.5"))
+PRIORITY_SIZE_WEIGHT = float(os.getenv("PRIORITY_SIZE_WEIGHT", "1.0"))
+PRIORITY_BACKFILL_SHARE = float(os.getenv("PRIORITY_BACKFILL_SHARE", "0.2"))
+PRIORITY_EPOCH = "2025-01-01"
+
+
+def priority_expr(margin, created_at, stock="0", members="1"):
+    """Expresión SQL del score sobre las columnas dadas (sin parámetros: vale para psycopg2, Django y SQLAlchemy)."""
+    return f"""(
+        (LN(1 + GREATEST(CAST(COALESCE({margin}, 0) AS float8), 0))
+         + {PRIORITY_STOCK_WEIGHT} * LN(1 + GREATEST(CAST(COALESCE({stock}, 0) AS float8), 0))
+         + {PRIORITY_SIZE_WEIGHT} * LN(GREATEST(CAST(COALESCE({members}, 1) AS float8), 1))) / LN(2)
+        + EXTRACT(EPOCH FROM ({created_at} - TIMESTAMPTZ '{PRIORITY_EPOCH}')) / 3600.0 / {PRIORITY_HALF_LIFE_HOURS}
+    )"""
+
+
+# Stock actual = suma del último snapshot de cada bodega (idx_stock_log_product)
+_PRODUCT_STOCK_SQL = """(
+    SELECT SUM(s.stock_qty) FROM (
+        SELECT DISTINCT ON (sl.warehouse_id) sl.stock_qty
+        FROM product_stock_log sl
+        WHERE sl.product_id = p.product_id
+        ORDER BY sl.warehouse_id, sl.snapshot_at DESC
+    ) s
+)"""
+
+# Alias requeridos: products p / unique_product_clusters c
+PRODUCT_PRIORITY_SQL = priority_expr("p.profit_margin", "p.created_at", stock=_PRODUCT_STOCK_SQL)
+
+
+def cluster_priority_sql(members="c.total_competitors"):
+    return priority_expr(
+        "(SELECT rp.profit_margin FROM products rp WHERE rp.product_id = c.representative_product_id)",
+        "c.created_at", members=members
+    )
+
+
+def refresh_product_priorities(cur, product_ids=None):
+    """Recalcula priority_score de `product_ids` (o de todos). Retorna: filas actualizadas."""
+    scope, params = ("WHERE p.product_id = ANY(%s)", (list(product_ids),)) if product_ids is not None else ("", None)
+    cur.execute(f"UPDATE products p SET priority_score = {PRODUCT_PRIORITY_SQL} {scope}", params)
+    return cur.rowcount
+
+
+def refresh_cluster_priorities(cur, cluster_ids=None):
+    """Recalcula priority_score de `cluster_ids` (o de todos). Retorna: filas actualizadas."""
+    scope, params = ("WHERE c.cluster_id = ANY(%s)", (list(cluster_ids),)) if cluster_ids is not None else ("", None)
+    cur.execute(f"UPDATE unique_product_clusters c SET priority_score = {cluster_priority_sql()} {scope}", params)
+    return cur.rowcount
+
+
+def lane_limits(limit, share=PRIORITY_BACKFILL_SHARE):
+    """Retorna: (cupo del carril prioritario, cupo del carril de backfill)"""
+    backfill = int(limit * share) if limit > 1 else 0
+    return limit - backfill, backfill
+
+
+def two_lane_fetch(cur, pending_sql, params, limit, share=PRIORITY_BACKFILL_SHARE):
+    """
+    Los dos carriles sobre la consulta de pendientes de un daemon (raw SQL).
+    `pending_sql`: SELECT ... FROM ... products p ... WHERE ... sin ORDER BY ni LIMIT, con la clave
+    como primera columna. Cada carril es una consulta independiente ORDER BY ... LIMIT sobre las
+    tablas base (idx_products_priority / idx_products_created): nunca se materializa toda la cola.
+    Retorna: filas prioritarias y luego las más antiguas, sin duplicados (como dequeue()).
+    """
+    hot_limit, backfill_limit = lane_limits(limit, share)
+    cur.execute(f"{pending_sql} ORDER BY p.priority_score DESC NULLS LAST, p.created_at DESC LIMIT %s",
+                (*params, hot_limit))
+    rows = cur.fetchall()
+    if backfill_limit:
+        # Los más antiguos pueden estar también en el carril prioritario: pedir de más y descartar
+        taken = {row[0] for row in rows}
+        cur.execute(f"{pending_sql} ORDER BY p.created_at LIMIT %s", (*params, hot_limit + backfill_limit))
+        rows += [row for row in cur.fetchall() if row[0] not in taken][:backfill_limit]
+    return rows
+
+
+def dequeue(queryset, limit, share=PRIORITY_BACKFILL_SHARE):
+    """Versión ORM de los dos carriles. Retorna: lista de instancias (prioritarias primero)."""
+    hot_limit, backfill_limit = lane_limits(limit, share)
+    hot = list(queryset.order_by(F('priority_score').desc(nulls_last=True), '-created_at')[:hot_limit])
+    if not backfill_limit:
+        return hot
+    old = queryset.exclude(pk__in=[obj.pk for obj in hot]).order_by('created_at')[:backfill_limit]
+    return hot + list(old)
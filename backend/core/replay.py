@@ -0,0 +1,100 @@
+"""
+Replay Offline de las Reglas de Matching.
+
+Evalúa configuraciones de core.clustering.evaluate_pair (pesos, threshold_hybrid, rescates) sin
+desplegarlas: el feedback humano del Cluster Lab (ai_feedback) da la verdad de cada par y los
+scores visual / texto ya guardados permiten recalcular la decisión de CUALQUIER configuración.
+- Verdad del par: la máquina unió y el humano confirma, o separó y el humano lo marca incorrecto
+  -> pair_truth() = machine_good == human_agrees (mismo target que el ai_trainer).
+- Una grilla de G configuraciones x N pares se decide con broadcasting NumPy ([G, N] booleano) y
+  TP / FP salen de un producto matriz-vector (con peso por par, ej. 1 / sample_rate).
+- cluster_decision_logs no tiene verdad, pero dice cuánto cambiaría el volumen de matches.
+Lo usan el comando `replay_matching` (grilla por concepto en pool de procesos) y el ai_trainer
+(solo adopta pesos nuevos si no empeoran el F1 en replay).
+"""
+
+import numpy as np
+
+from core.clustering import DEFAULT_CONFIG, TEXT_RESCUE_MIN_VISUAL
+
+MACHINE_POSITIVE = ['MATCH', 'CANDIDATE']
+# Columnas de una fila de grilla (mismas claves que las configs de concept_weights)
+GRID_KEYS = ("weight_visual", "weight_text", "threshold_hybrid", "threshold_visual_rescue", "threshold_text_rescue")
+
+WEIGHT_VISUAL_GRID = np.round(np.arange(0.10, 0.901, 0.05), 2)
+THRESHOLD_HYBRID_GRID = np.round(np.arange(0.55, 0.851, 0.01), 2)
+VISUAL_RESCUE_GRID = (0.88, 0.90, 0.92, 0.94, 0.96, 1.01) # 1.01 = sin rescate
+TEXT_RESCUE_GRID = (0.90, 0.93, 0.95, 0.97, 1.01)
+
+
+def pair_truth(decisions, feedback):
+    """1 si el par es el mismo producto según el humano, 0 si no (vectorizado)."""
+    machine_good = np.isin(np.asarray(decisions, dtype=object), MACHINE_POSITIVE)
+    human_agrees = np.asarray(feedback, dtype=object) == 'CORRECT'
+    return (machine_good == human_agrees).astype(int)
+
+
+def config_row(config):
+    """Config (dict) -> fila de grilla; las claves que falten toman DEFAULT_CONFIG."""
+    return np.array([float(config.get(key, DEFAULT_CONFIG[key])) for key in GRID_KEYS])
+
+
+def build_grid(weights=WEIGHT_VISUAL_GRID, thresholds=THRESHOLD_HYBRID_GRID,
+               visual_rescues=VISUAL_RESCUE_GRID, text_rescues=TEXT_RESCUE_GRID):
+    """Producto cartesiano -> np.ndarray [G, 5] (weight_text = 1 - weight_visual, como el ai_trainer)."""
+    w, th, vr, tr = np.meshgrid(weights, thresholds, visual_rescues, text_rescues, indexing='ij')
+    w = w.ravel()
+    return np.column_stack([w, 1.0 - w, th.ravel(), vr.ravel(), tr.ravel()])
+
+
+def predict(grid, visual, text):
+    """Decisión de evaluate_pair para cada fila de `grid` [G, 5] y cada par. Retorna: bool [G, N]"""
+    grid = np.atleast_2d(grid)
+    final = grid[:, 0:1] * visual + grid[:, 1:2] * text
+    return ((final >= grid[:, 2:3])
+            | (visual >= grid[:, 3:4])
+            | ((text >= grid[:, 4:5]) & (visual > TEXT_RESCUE_MIN_VISUAL)))
+
+
+def score_grid(grid, visual, text, truth, weight=None, chunk=2048):
+    """
+    Precisión / recall / F1 de cada fila de `grid` sobre los pares etiquetados.
+    Retorna: dict de arrays [G] (tp, fp, fn, precision, recall, f1).
+    """
+    grid = np.atleast_2d(grid)
+    truth = np.asarray(truth, dtype=bool)
+    weight = np.ones(len(truth)) if weight is None else np.asarray(weight, dtype=np.float64)
+    positive, negative = truth * weight, ~truth * weight
+
+    tp, fp = np.empty(len(grid)), np.empty(len(grid))
+    for start in range(0, len(grid), chunk): # acota la memoria de la matriz [G, N]
+        pred = predict(grid[start:start + chunk], visual, text).astype(np.float64)
+        tp[start:start + chunk] = pred @ positive
+        fp[start:start + chunk] = pred @ negative
+    fn = positive.sum() - tp
+
+    precision = np.divide(tp, tp + fp, out=np.zeros_like(tp), where=(tp + fp) > 0)
+    recall = np.divide(tp, tp + fn, out=np.zeros_like(tp), where=(tp + fn) > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(tp), where=(precision + recall) > 0)
+    return {"tp": tp, "fp": fp, "fn": fn, "precision": precision, "recall": recall, "f1": f1}
+
+
+def best_row(grid, scores, current, mask=None):
+    """
+    Índice de la fila de mayor F1 (opcionalmente solo entre `mask`); a igual F1 (4 decimales),
+    la más cercana a la config actual: no mover pesos sin ganancia.
+    """
+    f1 = np.round(scores["f1"], 4)
+    distance = np.abs(grid - current).sum(axis=1)
+    if mask is not None:
+        f1 = np.where(mask, f1, -1.0)
+    return int(np.lexsort((distance, -f1))[0])
+
+
+def wins_in_replay(visual, text, truth, current, proposed):
+    """
+    ¿La config `proposed` no empeora el F1 de `current` sobre los pares etiquetados?
+    Retorna: (bool, F1 [actual, propuesta])
+    """
+    scores = score_grid(np.vstack([config_row(current), config_row(proposed)]), visual, text, truth)
+    return scores["f1"][1] >= scores["f1"][0], scores["f1"]
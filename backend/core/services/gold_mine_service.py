@@ -3,15 +3,34 @@
 Gold Mine Service
 Lógica de negocio para la vista Gold Mine
 """
+import hashlib
+
 from django.db.models import Q
 from ..models import UniqueProductCluster
 
+# Búsqueda visual: tamaño del ranking cacheado (paginable) y vida de la caché
+VISUAL_SEARCH_POOL = 200
+VISUAL_CACHE_TTL = 60 * 60
+# Tamaño máximo de página (limit) aceptado por la API
+MAX_PAGE_LIMIT = 200
+
 
 class GoldMineService:
     """
     Servicio para manejar la lógica de búsqueda y filtrado de Gold Mine
     """
     
+    @staticmethod
+    def clamp_page(limit, offset):
+        """
+        Acota la paginación recibida por query string: 1 <= limit <= MAX_PAGE_LIMIT y offset >= 0
+        (un offset negativo cortaría la lista desde el final).
+
+        Returns:
+            tuple: (limit, offset)
+        """
+        return min(max(limit, 1), MAX_PAGE_LIMIT), max(offset, 0)
+
     @staticmethod
     def get_filtered_products(
         min_comp=0, 
@@ -62,6 +81,7 @@ class GoldMineService:
             .order_by('-average_price')
         
         # Aplicar paginación
+        limit, offset = GoldMineService.clamp_page(limit, offset)
         return queryset[offset:offset+limit]
     
     @staticmethod
@@ -87,65 +107,105 @@ class GoldMineService:
         return stats
     
     @staticmethod
-    def search_by_visual_similarity(embedding_vector, limit=50):
+    def _visual_ranking(image_bytes):
+        """
+        Ranking visual (product_id, similaridad) para una imagen, cacheado por hash de contenido.
+
+        Returns:
+            tuple: (ranking, cache_hit) | (None, False) si la imagen no se pudo decodificar
+
+        Raises:
+            EmbeddingServiceError: el embedding service no responde (la vista responde 503)
+        """
+        from django.core.cache import cache
+        from django.db import connection, transaction
+        from ..embedding_service import MODEL_VERSION, get_client
+
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cache_key = f"goldmine:visual:{MODEL_VERSION}:{digest}"
+        ranking = cache.get(cache_key)
+        if ranking is not None:
+            return ranking, True
+
+        # El embedding service agrupa subidas concurrentes en un mismo forward pass
+        vectors, _ = get_client().embed_images([image_bytes])
+        if vectors[0] is None:
+            return None, False
+        vector = vectors[0].tolist()
+
+        # HNSW devuelve como máximo ef_search vecinos: lo subimos al tamaño del pool
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL hnsw.ef_search = %s", (VISUAL_SEARCH_POOL,))
+            cursor.execute("""
+                SELECT pe.product_id, 1 - (pe.embedding_visual <=> %s::vector) as similarity
+                FROM product_embeddings pe
+                WHERE pe.embedding_visual IS NOT NULL
+                ORDER BY pe.embedding_visual <=> %s::vector
+                LIMIT %s
+            """, (vector, vector, VISUAL_SEARCH_POOL))
+            ranking = [(pid, float(sim)) for pid, sim in cursor.fetchall()]
+
+        cache.set(cache_key, ranking, VISUAL_CACHE_TTL)
+        return ranking, False
+
+    @staticmethod
+    def search_by_visual_similarity(image_bytes, limit=50, offset=0):
         """
-        Búsqueda por similaridad visual usando embeddings
+        Búsqueda por similaridad visual (Reverse Image Search)
         
         Args:
-            embedding_vector: Vector de embedding de la imagen
-            limit: Número de resultados
+            image_bytes: Contenido crudo de la imagen subida
+            limit: Número de resultados por página (1..MAX_PAGE_LIMIT)
+            offset: Offset para paginación (>= 0)
             
         Returns:
-            list: Lista de productos similares con scores
+            dict: {'results': página ordenada por similaridad, 'total': tamaño del ranking,
+                   'cached': si el ranking vino de caché} | None si la imagen es inválida
+
+        Raises:
+            EmbeddingServiceError: el embedding service no responde
         """
         from django.db import connection
-        from ..models import ProductEmbedding, Product, ProductClusterMembership
-        
-        # Query usando pgvector para búsqueda por similaridad
+
+        ranking, cached = GoldMineService._visual_ranking(image_bytes)
+        if ranking is None:
+            return None
+
+        limit, offset = GoldMineService.clamp_page(limit, offset)
+        page = ranking[offset:offset + limit]
+        if not page:
+            return {'results': [], 'total': len(ranking), 'cached': cached}
+
+        # Enriquecimiento (producto + proveedor + cluster) en una sola query, preservando el orden
         sql = """
             SELECT 
-                pe.product_id, 
-                (pe.embedding_visual <=> %s::vector) as distance
-            FROM product_embeddings pe
-            WHERE pe.embedding_visual IS NOT NULL
-            ORDER BY distance ASC
-            LIMIT %s
+                p.product_id, p.title, p.sale_price, p.suggested_price, p.url_image_s3,
+                s.store_name, c.cluster_id, c.total_competitors, r.similarity
+            FROM unnest(%s::bigint[], %s::float8[]) WITH ORDINALITY AS r(product_id, similarity, rank)
+            JOIN products p ON p.product_id = r.product_id
+            LEFT JOIN suppliers s ON s.supplier_id = p.supplier_id
+            LEFT JOIN product_cluster_membership pcm ON pcm.product_id = p.product_id
+            LEFT JOIN unique_product_clusters c ON c.cluster_id = pcm.cluster_id
+            ORDER BY r.rank
         """
-        
-        similar_products = []
         with connection.cursor() as cursor:
-            cursor.execute(sql, (embedding_vector, limit))
+            cursor.execute(sql, ([pid for pid, _ in page], [sim for _, sim in page]))
             rows = cursor.fetchall()
-            similar_pids = [r[0] for r in rows]
-        
-        if not similar_pids:
-            return []
-        
-        # Obtener detalles de productos
-        products = Product.objects.filter(product_id__in=similar_pids)\
-            .select_related('supplier')
-        
-        # Mapear clusters
-        memberships = ProductClusterMembership.objects.filter(
-            product_id__in=similar_pids
-        ).select_related('cluster')
-        
-        cluster_map = {m.product_id: m.cluster for m in memberships}
-        dist_map = {r[0]: r[1] for r in rows}
-        
-        # Construir resultados
-        for product in products:
-            cluster_info = cluster_map.get(product.product_id)
-            
+
+        similar_products = []
+        for pid, title, price, suggested, image, store, cluster_id, competitors, similarity in rows:
+            margin = ((suggested - price) / price) * 100 if suggested and price else 0
             similar_products.append({
-                'id': product.product_id,
-                'title': product.title,
-                'price': product.sale_price,
-                'image': product.url_image_s3,
-                'similarity': f"{int((1 - dist_map.get(product.product_id, 1))*100)}%",
-                'competitors': cluster_info.total_competitors if cluster_info else 1,
-                'supplier': product.supplier.store_name if product.supplier else 'Desconocido',
-                'cluster_id': cluster_info.cluster_id if cluster_info else None
+                'id': pid,
+                'title': title,
+                'price': price,
+                'image': image,
+                'similarity': f"{int(similarity * 100)}%",
+                'similarity_score': round(similarity, 4),
+                'competitors': competitors if competitors else 1,
+                'profit_margin': f"{int(margin)}%",
+                'supplier': store if store else 'Desconocido',
+                'cluster_id': cluster_id
             })
         
-        return similar_products
+        return {'results': similar_products, 'total': len(ranking), 'cached': cached}
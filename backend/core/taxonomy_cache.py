@@ -0,0 +1,133 @@
+"""
+Caché Semántica del Taxonomist (LLM).
+
+Cada clasificación con llama3.1 tarda segundos y Dropi repite el mismo producto en decenas de
+publicaciones ("Silla Gamer Ergonómica X" de 40 vendedores). Antes de llamar al LLM:
+1. Exacto: título normalizado (minúsculas, sin tildes, signos ni espacios extra).
+2. Semántico: vecino más cercano por embedding MiniLM del título normalizado (HNSW
+   idx_taxonomy_cache_embedding); si la similitud coseno >= TAXONOMY_CACHE_SIMILARITY
+   se reutiliza su clasificación.
+Cada entrada guarda modelo y versión de prompt: al cambiar cualquiera de los dos, las
+entradas viejas dejan de servir (invalidate_stale() las borra).
+stats(): tasa de aciertos y segundos de LLM ahorrados (llm_seconds de la llamada original).
+"""
+
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import TaxonomyCacheEntry
+
+logger = logging.getLogger(__name__)
+
+TAXONOMY_CACHE_SIMILARITY = float(os.getenv("TAXONOMY_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_title(title):
+    """'Silla Gamer  Ergonómica-X!' -> 'silla gamer ergonomica x'"""
+    text = unicodedata.normalize("NFKD", str(title or "")).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _encode(text):
+    from core.ai_utils import encode_batch
+    return encode_batch([text], normalize=True)[0]
+
+
+class TaxonomyCache:
+    """Caché del Taxonomist para un (modelo, versión de prompt). `encoder`: callable texto -> vector normalizado."""
+
+    def __init__(self, model_name, prompt_version, similarity=TAXONOMY_CACHE_SIMILARITY, encoder=None):
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.similarity = similarity
+        self.encoder = encoder or _encode
+        self.counts = Counter()
+
+    def _scope(self):
+        return TaxonomyCacheEntry.objects.filter(model_name=self.model_name, prompt_version=self.prompt_version)
+
+    def _embed(self, key):
+        try:
+            return self.encoder(key)
+        except Exception as e:
+            # Sin MiniLM: la caché sigue funcionando solo por coincidencia exacta
+            logger.warning(f"⚠️ Embedding de título no disponible ({e}). Caché solo exacta.")
+            return None
+
+    def get(self, title):
+        """
+        Retorna: (resultado | None, embedding del título | None). El embedding se reutiliza en put()
+        para no calcularlo dos veces en un miss.
+        """
+        key = normalize_title(title)
+        if not key:
+            return None, None
+
+        entry = self._scope().filter(title_key=key).first()
+        if entry is not None:
+            return self._hit(entry, "exact"), None
+
+        vector = self._embed(key)
+        if vector is not None and self.similarity < 1.0:
+            with connection.cursor() as cur:
+                cur.execute("""
+                    SELECT id, 1 - (title_embedding <=> %s::vector) AS similarity
+                    FROM taxonomy_cache
+                    WHERE model_name = %s AND prompt_version = %s
+                    AND title_embedding IS NOT NULL
+                    ORDER BY title_embedding <=> %s::vector
+                    LIMIT 1
+                """, (list(vector), self.model_name, self.prompt_version, list(vector)))
+                row = cur.fetchone()
+            if row and row[1] >= self.similarity:
+                return self._hit(TaxonomyCacheEntry.objects.get(id=row[0]), "semantic"), vector
+
+        self.counts["misses"] += 1
+        return None, vector
+
+    def _hit(self, entry, kind):
+        self.counts[f"{kind}_hits"] += 1
+        self.counts["seconds_saved"] += entry.llm_seconds
+        TaxonomyCacheEntry.objects.filter(id=entry.id).update(hits=F("hits") + 1, last_hit_at=timezone.now())
+        return entry.result
+
+    def put(self, title, result, llm_seconds, vector=None):
+        """Guarda una clasificación nueva del LLM (la primera gana si otro proceso ya la guardó)."""
+        key = normalize_title(title)
+        if not key:
+            return
+        self.counts["llm_seconds"] += llm_seconds
+        if vector is None:
+            vector = self._embed(key)
+        TaxonomyCacheEntry.objects.get_or_create(
+            title_key=key, model_name=self.model_name, prompt_version=self.prompt_version,
+            defaults={"result": result, "llm_seconds": llm_seconds,
+                      "title_embedding": list(vector) if vector is not None else None},
+        )
+
+    def invalidate_stale(self):
+        """Borra las entradas de otros modelos / versiones de prompt. Retorna: filas borradas."""
+        deleted, _ = TaxonomyCacheEntry.objects.exclude(
+            model_name=self.model_name, prompt_version=self.prompt_version
+        ).delete()
+        return deleted
+
+    def stats(self):
+        hits = self.counts["exact_hits"] + self.counts["semantic_hits"]
+        lookups = hits + self.counts["misses"]
+        return {
+            "lookups": lookups,
+            "exact_hits": self.counts["exact_hits"],
+            "semantic_hits": self.counts["semantic_hits"],
+            "misses": self.counts["misses"],
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "seconds_saved": self.counts["seconds_saved"],
+            "llm_seconds": self.counts["llm_seconds"],
+        }
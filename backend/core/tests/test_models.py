@@ -39,3 +39,227 @@ class ProductModelTest(TestCase):
         """Test de creación de producto"""
         self.assertEqual(self.product.title, "Test Product")
         self.assertTrue(self.product.is_active)
+
+
+class ClusterMetricsTest(TestCase):
+    """Tests para los agregados de cluster mantenidos por deltas"""
+    
+    def setUp(self):
+        from django.db import connection
+        from core import cluster_metrics
+        
+        for pid, price in ((1, 10000), (2, 30000), (3, 20000)):
+            Product.objects.create(product_id=pid, title=f"P{pid}", sale_price=price)
+        self.cluster_a = UniqueProductCluster.objects.create(representative_product_id=1, total_competitors=0).cluster_id
+        self.cluster_b = UniqueProductCluster.objects.create(representative_product_id=3, total_competitors=0).cluster_id
+        with connection.cursor() as cur:
+            cluster_metrics.assign_membership(cur, 1, self.cluster_a, 1.0, 'REPRESENTATIVE')
+            cluster_metrics.assign_membership(cur, 2, self.cluster_a, 0.9, 'HYBRID_MATCH')
+            cluster_metrics.assign_membership(cur, 3, self.cluster_b, 1.0, 'REPRESENTATIVE')
+            # Mover el producto más caro de A a B: A debe recalcular su máximo
+            cluster_metrics.assign_membership(cur, 2, self.cluster_b, 1.0, 'HUMAN_MERGE')
+    
+    def test_move_updates_both_clusters(self):
+        """Un movimiento descuenta en origen y suma en destino"""
+        a = UniqueProductCluster.objects.get(cluster_id=self.cluster_a)
+        b = UniqueProductCluster.objects.get(cluster_id=self.cluster_b)
+        
+        self.assertEqual((a.total_competitors, a.average_price, a.max_price), (1, 10000, 10000))
+        self.assertEqual((b.total_competitors, b.average_price, b.min_price, b.max_price), (2, 25000, 20000, 30000))
+    
+    def test_reconcile_finds_no_drift(self):
+        """Los deltas coinciden con el recálculo set-based"""
+        from django.db import connection
+        from core.cluster_metrics import reconcile
+        
+        with connection.cursor() as cur:
+            self.assertEqual(reconcile(cur, fix=False)['clusters_with_drift'], 0)
+
+    def test_representative_is_repicked_when_it_leaves(self):
+        """Si el representante sale del cluster, se elige otro miembro"""
+        from django.db import connection
+        from core import cluster_metrics
+
+        with connection.cursor() as cur:
+            cluster_metrics.assign_membership(cur, 3, self.cluster_a, 0.8, 'HUMAN_MERGE')
+        self.assertEqual(UniqueProductCluster.objects.get(cluster_id=self.cluster_b).representative_product_id, 2)
+
+    def test_merge_selected_deletes_emptied_source_cluster(self):
+        """Un MERGE que vacía el cluster origen lo elimina y su historial pasa al destino"""
+        from rest_framework.test import APIRequestFactory
+        from core.models import MarketIntelligenceLog
+        from core.views import ClusterOrphanActionView
+
+        log = MarketIntelligenceLog.objects.create(cluster_id=self.cluster_a, source="google_trends", data_point="trend_score")
+        request = APIRequestFactory().post('/api/cluster-lab/orphan-action/',
+                                           {'product_id': 3, 'action': 'MERGE_SELECTED', 'candidates': [1]}, format='json')
+        self.assertEqual(ClusterOrphanActionView.as_view()(request).status_code, 200)
+
+        self.assertFalse(UniqueProductCluster.objects.filter(cluster_id=self.cluster_a).exists())
+        log.refresh_from_db()
+        self.assertEqual(log.cluster_id, self.cluster_b)
+        b = UniqueProductCluster.objects.get(cluster_id=self.cluster_b)
+        self.assertEqual((b.total_competitors, b.representative_product_id), (3, 3))
+
+    def test_merge_keeps_market_history(self):
+        """Los logs de mercado de los absorbidos pasan al sobreviviente"""
+        from django.db import connection
+        from core.cluster_metrics import merge_clusters
+        from core.models import MarketIntelligenceLog
+
+        log = MarketIntelligenceLog.objects.create(cluster_id=self.cluster_b, source="google_trends", data_point="trend_score")
+        with connection.cursor() as cur:
+            merge_clusters(cur, self.cluster_a, [self.cluster_b])
+
+        log.refresh_from_db()
+        self.assertEqual(log.cluster_id, self.cluster_a)
+        self.assertFalse(UniqueProductCluster.objects.filter(cluster_id=self.cluster_b).exists())
+
+
+class DecisionLogTest(TestCase):
+    """Tests para el muestreo y las particiones de cluster_decision_logs"""
+    
+    def test_sampling_keeps_matches_and_is_deterministic(self):
+        """Todo MATCH se guarda; un REJECT cae siempre del mismo lado sin importar el orden del par"""
+        from core.decision_log import is_sampled, sample_rate
+        
+        self.assertEqual(sample_rate("MATCH", 0.1), 1.0)
+        kept = [is_sampled(a, a + 1, 0.1) for a in range(2000)]
+        self.assertTrue(0.05 < sum(kept) / len(kept) < 0.15)
+        self.assertEqual(kept[:50], [is_sampled(a + 1, a, 0.1) for a in range(50)])
+    
+    def test_maintain_partitions_creates_and_drops(self):
+        """Crea meses futuros y elimina los que superan la retención"""
+        from django.db import connection
+        from core.decision_log import maintain_partitions
+        from core.models import ClusterDecisionLog
+        
+        with connection.cursor() as cur:
+            cur.execute("CREATE TABLE cluster_decision_logs_p200001 PARTITION OF cluster_decision_logs FOR VALUES FROM ('2000-01-01') TO ('2000-02-01')")
+            result = maintain_partitions(cur, retention_days=90, months_ahead=3)
+        
+        self.assertEqual(len(result["created"]), 2) # la migración ya creó el mes actual y el siguiente
+        self.assertIn("cluster_decision_logs_p200001", result["dropped"])
+        log = ClusterDecisionLog.objects.create(product_id=1, candidate_id=2, decision="MATCH")
+        self.assertEqual(ClusterDecisionLog.objects.get(id=log.id).sample_rate, 1.0)
+
+
+class ExactFastPathTest(TestCase):
+    """Tests para el fast path exacto (SKU normalizado) del clusterizer"""
+    
+    def setUp(self):
+        from django.db import connection
+        from core import cluster_metrics
+        
+        for pid, sku, concept in ((1, "AB-1234", "Silla"), (2, "ab 1234", "Silla"), (3, "ab1234", "Mesa"), (4, "A-1", "Silla"), (5, "a1", "Silla")):
+            Product.objects.create(product_id=pid, title=f"P{pid}", sku=sku, taxonomy_concept=concept)
+        self.cluster = UniqueProductCluster.objects.create(representative_product_id=1, total_competitors=0).cluster_id
+        short_sku = UniqueProductCluster.objects.create(representative_product_id=4, total_competitors=0).cluster_id
+        with connection.cursor() as cur:
+            cluster_metrics.assign_membership(cur, 1, self.cluster, 1.0, 'REPRESENTATIVE')
+            cluster_metrics.assign_membership(cur, 4, short_sku, 1.0, 'REPRESENTATIVE')
+    
+    def test_matches_normalized_sku_within_concept(self):
+        """Mismo SKU normalizado y concepto -> EXACT_SKU; otro concepto o SKU corto no"""
+        from django.db import connection
+        from core.clustering import exact_matches
+        
+        with connection.cursor() as cur:
+            silla = exact_matches(cur, "Silla", [(2, "ab 1234", None), (5, "a1", None)])
+            mesa = exact_matches(cur, "Mesa", [(3, "ab1234", None)])
+        
+        self.assertEqual(silla, {2: (self.cluster, "EXACT_SKU", 1)})
+        self.assertEqual(mesa, {})
+
+
+class ReevaluateConceptTest(TestCase):
+    """Tests para la re-evaluación de membresías dudosas de un concepto"""
+    
+    def test_unchanged_membership_is_not_rewritten(self):
+        """Mismo método y confianza a 2 decimales (numeric(3,2)): confirmado, no reetiquetado"""
+        from django.db import connection
+        from core import cluster_metrics
+        from core.clustering import reevaluate_concept
+        from core.models import ProductClusterMembership, ProductEmbedding
+        
+        visual = [1.0] + [0.0] * 1151
+        for pid in (1, 2):
+            prod = Product.objects.create(product_id=pid, title="Perfume floral", taxonomy_concept="Perfume")
+            ProductEmbedding.objects.create(product=prod, embedding_visual=visual)
+        cluster = UniqueProductCluster.objects.create(representative_product_id=1, total_competitors=0).cluster_id
+        config = {"weight_visual": 0.7834, "weight_text": 0.0, "threshold_hybrid": 0.5,
+                  "threshold_visual_rescue": 1.01, "threshold_text_rescue": 1.01}
+        with connection.cursor() as cur:
+            cluster_metrics.assign_membership(cur, 1, cluster, 1.0, 'REPRESENTATIVE')
+            cluster_metrics.assign_membership(cur, 2, cluster, 0.7834, 'NEEDS_AUDIT')
+            stats = reevaluate_concept(cur, None, "Perfume", config)
+        
+        self.assertEqual((stats["confirmed"], stats["relabelled"]), (1, 0))
+        self.assertEqual(str(ProductClusterMembership.objects.get(product_id=2).match_confidence), "0.78")
+
+
+class CentroidMergeShardTest(TestCase):
+    """Tests para el merge de centroides por shard con locks por concepto"""
+    
+    def test_merges_only_owned_concepts_locking_in_order(self):
+        from unittest.mock import patch
+        from django.db import connection
+        from core import clustering
+        
+        with connection.cursor() as cur:
+            names = ["Silla", "Mesa", "Lampara", "Reloj", "Perfume", "Cojin", "Tapete", "Espejo"]
+            cur.execute("SELECT name, (hashtext(name) & 2147483647) %% 2 FROM unnest(%s::text[]) AS name", (names,))
+            shard_of = dict(cur.fetchall())
+            owned = [n for n in names if shard_of[n] == 0][:2]
+            other = next(n for n in names if shard_of[n] == 1)
+            
+            pid = 0
+            for axis, concept in enumerate(owned + [other]):
+                vector = [0.0] * 1152
+                vector[axis] = 1.0
+                for _ in range(2):
+                    pid += 1
+                    Product.objects.create(product_id=pid, title=f"{concept} {pid}", taxonomy_concept=concept)
+                    cluster = UniqueProductCluster.objects.create(representative_product_id=pid, total_competitors=1)
+                    cur.execute("UPDATE unique_product_clusters SET centroid_visual = %s::vector WHERE cluster_id = %s",
+                                (str(vector), cluster.cluster_id))
+            
+            events = []
+            with patch.object(clustering, 'lock_concept', side_effect=lambda c, concept: events.append(concept) or True), \
+                 patch.object(clustering, 'merge_clusters', side_effect=lambda c, survivor, absorbed: events.append("merge") or 1):
+                stats = clustering.merge_converged_clusters(cur, shard=0, n_shards=2)
+        
+        # Solo los conceptos del shard, bloqueados en orden estable y antes de mover cualquier miembro
+        self.assertEqual(events, sorted(owned) + ["merge", "merge"])
+        self.assertEqual(stats["concepts"], sorted(owned))
+        self.assertEqual((stats["groups"], stats["absorbed"]), (2, 2))
+
+
+class PriorityQueueTest(TestCase):
+    """Tests para el orden de las colas por priority_score + carril de backfill"""
+    
+    def test_high_margin_first_and_oldest_in_backfill_lane(self):
+        from datetime import timedelta
+        from django.db import connection
+        from django.utils import timezone
+        from core.priority import dequeue, refresh_product_priorities, two_lane_fetch
+        
+        now = timezone.now()
+        for pid in range(1, 11):
+            Product.objects.create(product_id=pid, title=f"P{pid}", profit_margin=1000 * pid)
+        # El 1 (menor margen) es además el más antiguo; el 2 es igual de nuevo que el 10 pero peor
+        Product.objects.filter(product_id=1).update(created_at=now - timedelta(days=30))
+        Product.objects.exclude(product_id=1).update(created_at=now)
+        with connection.cursor() as cur:
+            self.assertEqual(refresh_product_priorities(cur), 10)
+        
+        batch = [p.product_id for p in dequeue(Product.objects.all(), 5, share=0.2)]
+        self.assertEqual(batch, [10, 9, 8, 7, 1])
+        
+        # Versión raw SQL de los daemons: mismos carriles, sin duplicados aunque el más antiguo sea prioritario
+        with connection.cursor() as cur:
+            rows = two_lane_fetch(cur, "SELECT p.product_id FROM products p WHERE p.product_id <> %s", (3,), 5, share=0.2)
+            self.assertEqual([r[0] for r in rows], [10, 9, 8, 7, 1])
+            Product.objects.filter(product_id=10).update(created_at=now - timedelta(days=60))
+            rows = two_lane_fetch(cur, "SELECT p.product_id FROM products p WHERE p.product_id <> %s", (3,), 5, share=0.2)
+            self.assertEqual([r[0] for r in rows], [10, 9, 8, 7, 1])
@@ -34,6 +34,60 @@ class GoldMineServiceTest(TestCase):
         self.assertIn('high', stats)
         self.assertIsInstance(stats['low'], int)
 
+    def test_visual_search_uses_cached_ranking(self):
+        """Imagen ya buscada: no se re-vectoriza y el orden es numérico, no por string"""
+        import hashlib
+        from unittest import mock
+        from django.core.cache import cache
+        from core.embedding_service import MODEL_VERSION
+
+        Product.objects.create(product_id=55556, title="Second Product")
+        image_bytes = b"fake-image-bytes"
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cache.set(f"goldmine:visual:{MODEL_VERSION}:{digest}", [(55556, 0.95), (55555, 0.9)])
+
+        with mock.patch('core.embedding_service.get_client') as client:
+            page = GoldMineService.search_by_visual_similarity(image_bytes, limit=1, offset=1)
+            client.assert_not_called()
+
+        self.assertTrue(page['cached'])
+        self.assertEqual(page['total'], 2)
+        self.assertEqual([r['id'] for r in page['results']], [55555])
+        self.assertEqual(page['results'][0]['cluster_id'], None)
+
+        # Offset negativo no corta desde el final; limit acotado a [1, MAX_PAGE_LIMIT]
+        page = GoldMineService.search_by_visual_similarity(image_bytes, limit=0, offset=-1)
+        self.assertEqual([r['id'] for r in page['results']], [55556])
+        self.assertEqual(GoldMineService.clamp_page(10 ** 6, -5), (200, 0))
+
+    def test_visual_search_returns_503_when_service_is_down(self):
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from rest_framework.test import APIRequestFactory
+        from core.embedding_service import EmbeddingServiceError
+        from core.views import GoldMineView
+
+        request = APIRequestFactory().post('/api/gold-mine/', {'image': SimpleUploadedFile('a.jpg', b'new-bytes')},
+                                           format='multipart')
+        with mock.patch('core.embedding_service.get_client') as client:
+            client.return_value.embed_images.side_effect = EmbeddingServiceError("inaccesible")
+            response = GoldMineView.as_view()(request)
+        self.assertEqual(response.status_code, 503)
+
+
+class EmbeddingServiceKeyTest(TestCase):
+    """Tests para la clave obligatoria del IPC del embedding service"""
+    
+    def test_client_refuses_to_connect_without_key(self):
+        from unittest import mock
+        from core import embedding_service
+        
+        with mock.patch.object(embedding_service, 'SERVICE_AUTHKEY', None), \
+                mock.patch.object(embedding_service, 'Client') as client:
+            with self.assertRaises(embedding_service.EmbeddingServiceError):
+                embedding_service.EmbeddingClient().info()
+            client.assert_not_called()
+
 
 class DashboardServiceTest(TestCase):
     """Tests para DashboardService"""
@@ -45,3 +99,300 @@ class DashboardServiceTest(TestCase):
         self.assertIn('total_unique_products', stats)
         self.assertIn('competition_distribution', stats)
         self.assertIsInstance(stats['total_unique_products'], int)
+
+
+class TaxonomyCacheTest(TestCase):
+    """Tests para la caché semántica del Taxonomist"""
+    
+    def setUp(self):
+        import numpy as np
+        from core.taxonomy_cache import TaxonomyCache
+        
+        def encoder(text):
+            # Vector determinista: "silla gamer ergonomica x" y "... y" quedan casi paralelos
+            vec = np.zeros(384, dtype=np.float32)
+            for word in text.split():
+                vec[sum(map(ord, word)) % 384] += 1.0 if len(word) > 1 else 0.1
+            return (vec / np.linalg.norm(vec)).tolist()
+        
+        self.cache = TaxonomyCache("llama3.1", "v1", similarity=0.95, encoder=encoder)
+        self.result = {"concept_name": "Silla Gamer", "parent_industry": "Hogar", "classification": "CONCEPT"}
+    
+    def test_exact_then_semantic_hit(self):
+        """Título normalizado igual -> hit exacto; casi igual -> hit semántico; otro -> miss"""
+        self.assertEqual(self.cache.get("Silla Gamer Ergonómica X")[0], None)
+        self.cache.put("Silla Gamer Ergonómica X", self.result, 4.0)
+        
+        self.assertEqual(self.cache.get("  silla gamer ERGONOMICA-x! ")[0], self.result)
+        self.assertEqual(self.cache.get("Silla Gamer Ergonómica Y")[0], self.result)
+        self.assertIsNone(self.cache.get("Audífonos Inalámbricos")[0])
+        
+        stats = self.cache.stats()
+        self.assertEqual((stats["exact_hits"], stats["semantic_hits"], stats["misses"]), (1, 1, 2))
+        self.assertEqual(stats["seconds_saved"], 8.0)
+    
+    def test_other_prompt_version_is_invalidated(self):
+        """Una entrada de otra versión de prompt no sirve y invalidate_stale() la borra"""
+        from core.taxonomy_cache import TaxonomyCache
+        
+        self.cache.put("Silla Gamer Ergonómica X", self.result, 4.0)
+        newer = TaxonomyCache("llama3.1", "v2", encoder=self.cache.encoder)
+        
+        self.assertIsNone(newer.get("Silla Gamer Ergonómica X")[0])
+        self.assertEqual(newer.invalidate_stale(), 1)
+
+
+class VisualConsensusTest(TestCase):
+    """Tests para la regla de consenso visual del classifier"""
+    
+    def test_consensus_requires_k_close_neighbours_without_tie(self):
+        from core.visual_consensus import visual_consensus
+        
+        def n(concept, similarity, industry="Hogar"):
+            return {"concept": concept, "industry": industry, "level": "CONCEPT", "similarity": similarity}
+        
+        agree = [n("Silla Gamer", 0.97), n("Silla Gamer", 0.95), n("Silla Gamer", 0.93), n("Escritorio", 0.91)]
+        result = visual_consensus(agree, k=3, threshold=0.90)
+        self.assertEqual((result["concept_name"], result["parent_industry"], result["reason"]), ("Silla Gamer", "Hogar", "VISUAL_CONSENSUS"))
+        
+        # Un vecino bajo el umbral no vota; un empate no es consenso
+        self.assertIsNone(visual_consensus(agree[:2] + [n("Silla Gamer", 0.80)], k=3, threshold=0.90))
+        tie = [n("Silla Gamer", 0.97), n("Escritorio", 0.96)]
+        self.assertIsNone(visual_consensus(tie, k=1, threshold=0.90))
+
+
+class MultiItemParseTest(TestCase):
+    """Tests para el parseo de respuestas multi-item del Taxonomist"""
+    
+    def test_array_is_mapped_by_index_and_invalid_items_are_left_for_fallback(self):
+        from core.ai_classifier import TaxonomistAI
+        
+        content = ('{"items": [{"index": 2, "concept_name": "Escritorio"}, {"index": 1, "concept_name": "Silla Gamer"},'
+                   ' {"index": 3, "reason": "sin concepto"}, {"index": 9, "concept_name": "Fuera de rango"}]}')
+        parsed = TaxonomistAI._parse_array(content, 3)
+        self.assertEqual({k: v["concept_name"] for k, v in parsed.items()}, {0: "Silla Gamer", 1: "Escritorio"})
+        
+        # Arreglo suelto con texto alrededor; JSON truncado -> nada (todo va al fallback uno a uno)
+        self.assertEqual(len(TaxonomistAI._parse_array('Aquí va: [{"concept_name": "Silla Gamer"}]', 1)), 1)
+        self.assertEqual(TaxonomistAI._parse_array('[{"index": 1, "concept_name": "Sil', 1), {})
+
+
+class ConceptDictionaryTest(TestCase):
+    """Tests para la resolución de concept_name libre al diccionario canónico"""
+    
+    def test_variants_resolve_to_the_same_concept(self):
+        import numpy as np
+        from core.concept_dictionary import ConceptDictionary
+        
+        def encoder(text):
+            vec = np.zeros(384, dtype=np.float32)
+            for word in text.split():
+                vec[sum(map(ord, word)) % 384] += 1.0
+            return (vec / np.linalg.norm(vec)).tolist()
+        
+        dictionary = ConceptDictionary(similarity=0.80, encoder=encoder)
+        silla, method = dictionary.resolve("Silla Gamer", "Hogar")
+        self.assertEqual((silla.name, method), ("Silla Gamer", "new"))
+        
+        # Mayúsculas/tildes -> exacto; variante cercana -> mismo concepto (y alias); otra cosa -> nuevo
+        self.assertEqual(dictionary.resolve("silla GAMER")[0].id, silla.id)
+        variant, method = dictionary.resolve("Silla Gamer Ergonómica")
+        self.assertEqual((variant.id, method), (silla.id, "semantic"))
+        self.assertNotEqual(dictionary.resolve("Audífonos Inalámbricos")[0].id, silla.id)
+        self.assertEqual((None, None), dictionary.resolve("UNKNOWN"))
+        
+        # El alias sirve para otro proceso (sin memo) como coincidencia exacta
+        other = ConceptDictionary(similarity=0.99, encoder=encoder)
+        self.assertEqual(other.resolve("Silla gamer ergonomica"), (silla, "exact"))
+    
+    def test_consensus_shadow_compares_canonical_concepts(self):
+        from collections import Counter
+        from core.concept_dictionary import ConceptDictionary
+        from core.management.commands.classify_products import Command
+        
+        def encoder(text):
+            vec = [0.0] * 384
+            vec[0 if "silla" in text else 1] = 1.0
+            return vec
+        
+        classifier = Command()
+        classifier.concepts = ConceptDictionary(similarity=0.80, encoder=encoder)
+        classifier.consensus_counts, classifier.zero_shot_counts = Counter(), Counter()
+        classifier.zero_shot_predictions = {}
+        silla, _ = classifier.concepts.resolve("Silla Gamer")
+        
+        # Vecinos dicen "Silla Gamer", el LLM dice "Sillas Gamer": mismo concepto canónico -> acuerdo
+        prod = Product.objects.create(product_id=1, title="Silla gamer RGB")
+        classifier.consensus_predictions = {1: "Silla Gamer"}
+        classifier.save_result(prod, prod.title, {"concept_name": "Sillas Gamer", "parent_industry": "Hogar"}, "LLM")
+        
+        prod.refresh_from_db()
+        self.assertEqual((prod.concept_id, prod.taxonomy_source), (silla.id, "LLM_CONSENSUS_AGREE"))
+        self.assertEqual(classifier.consensus_counts, Counter(shadow_agree=1))
+
+
+class ZeroShotAssignTest(TestCase):
+    """Tests para la asignación zero-shot (imagen x textos de conceptos en un solo pase)"""
+    
+    def test_assigns_only_confident_rows(self):
+        import numpy as np
+        from core.zero_shot import zero_shot_assign
+        
+        concepts = np.eye(3, dtype=np.float32)
+        images = np.array([
+            [0.30, 0.05, 0.00], # claro: concepto 0
+            [0.12, 0.11, 0.00], # margen insuficiente
+            [0.00, 0.00, 0.05], # score insuficiente
+            [0.00, 0.02, 0.40], # claro: concepto 2
+        ], dtype=np.float32)
+        best, score, gap = zero_shot_assign(images, concepts, min_score=0.10, margin=0.02)
+        self.assertEqual(best.tolist(), [0, -1, -1, 2])
+        self.assertAlmostEqual(float(score[3]), 0.40, places=5)
+        self.assertAlmostEqual(float(gap[0]), 0.25, places=5)
+
+    def test_pending_vectors_pages_by_watermark(self):
+        from core.models import ProductEmbedding
+        from core.zero_shot import pending_vectors
+
+        for pid in (5, 1, 4, 2):
+            prod = Product.objects.create(product_id=pid, title=f"P{pid}", is_active=True)
+            ProductEmbedding.objects.create(product=prod, embedding_visual=[1.0] + [0.0] * 1151,
+                                            embedding_visual_model="siglip-test")
+
+        ids, vectors = pending_vectors("siglip-test", 0, 2)
+        self.assertEqual((ids, vectors.shape), ([1, 2], (2, 1152)))
+        self.assertEqual(pending_vectors("siglip-test", ids[-1], 2)[0], [4, 5])
+        self.assertEqual(pending_vectors("siglip-test", 5, 2)[0], [])
+
+
+class IncrementalTrainerTest(TestCase):
+    """Tests para el entrenamiento incremental (marca de agua) del ai_trainer"""
+    
+    def test_only_concepts_with_new_feedback_are_refit(self):
+        from unittest.mock import patch
+        from core.models import AIFeedback, Concept
+        from core.management.commands.ai_trainer import AITrainer
+        from core.replay import pair_truth
+        
+        self.assertEqual(pair_truth(['MATCH', 'MATCH', 'REJECT', 'REJECT'],
+                                    ['CORRECT', 'INCORRECT', 'CORRECT', 'INCORRECT']).tolist(), [1, 0, 0, 1])
+        
+        for pid, name in ((1, "Reloj"), (2, "Perfume")):
+            concept = Concept.objects.create(name=name, name_key=name.lower())
+            Product.objects.create(product_id=pid, title=name, concept=concept)
+        
+        def feedback(pid, n):
+            for i in range(n):
+                AIFeedback.objects.create(product_id=pid, candidate_id=100 + i, decision='MATCH',
+                                          feedback='CORRECT' if i % 2 else 'INCORRECT',
+                                          visual_score=0.5 + i / 20, text_score=0.4)
+        
+        trainer = AITrainer()
+        feedback(1, 6)
+        feedback(2, 6)
+        with patch.object(trainer, 'get_current_config', return_value={'weight_visual': 0.6}), \
+             patch.object(trainer, 'update_db_config') as update:
+            trainer.train_and_optimize()
+            reloj_id = Concept.objects.get(name="Reloj").id
+            perfume_id = Concept.objects.get(name="Perfume").id
+            reloj_coef = trainer.models[reloj_id].coef_.copy()
+            self.assertEqual(update.call_count, 2)
+            
+            feedback(2, 2)
+            trainer.train_and_optimize()
+        
+        self.assertEqual(trainer.watermark, AIFeedback.objects.latest('id').id)
+        self.assertEqual((trainer.samples[reloj_id].sum(), trainer.samples[perfume_id].sum()), (6, 8))
+        self.assertTrue((trainer.models[reloj_id].coef_ == reloj_coef).all())
+
+    
+    def test_feedback_without_concept_is_retried(self):
+        from unittest.mock import patch
+        from core.models import AIFeedback, Concept
+        from core.management.commands.ai_trainer import AITrainer
+        
+        Product.objects.create(product_id=1, title="Reloj sin clasificar")
+        for i in range(3):
+            AIFeedback.objects.create(product_id=1, candidate_id=100 + i, decision='MATCH', feedback='CORRECT',
+                                      visual_score=0.9, text_score=0.8)
+        
+        trainer = AITrainer()
+        with patch.object(trainer, 'get_current_config', return_value={'weight_visual': 0.6}), \
+             patch.object(trainer, 'update_db_config'):
+            trainer.train_and_optimize()
+            self.assertEqual((len(trainer.unassigned), trainer.models), (3, {}))
+            
+            concept = Concept.objects.create(name="Reloj", name_key="reloj")
+            Product.objects.filter(product_id=1).update(concept=concept)
+            trainer.train_and_optimize()
+        
+        self.assertEqual(trainer.unassigned, set())
+        self.assertEqual(trainer.samples[concept.id].sum(), 3)
+
+
+class ReplayGridTest(TestCase):
+    """Tests para el replay offline de configuraciones de matching"""
+    
+    def test_grid_matches_evaluate_pair(self):
+        import numpy as np
+        from core.clustering import DEFAULT_CONFIG, evaluate_pair
+        from core.replay import GRID_KEYS, build_grid, config_row, predict, score_grid, wins_in_replay
+        
+        rng = np.random.default_rng(0)
+        visual, text = rng.uniform(0.4, 1.0, 200), rng.uniform(0.4, 1.0, 200)
+        grid = build_grid()[::37]
+        decided = predict(grid, visual, text)
+        for row, pred in zip(grid, decided):
+            config = dict(DEFAULT_CONFIG, **dict(zip(GRID_KEYS, row)))
+            expected = [evaluate_pair(config, v, t)[0] for v, t in zip(visual, text)]
+            self.assertEqual(pred.tolist(), expected)
+        
+        truth = visual > 0.8
+        no_rescue = {'threshold_visual_rescue': 1.01, 'threshold_text_rescue': 1.01, 'threshold_hybrid': 0.8}
+        by_visual = dict(no_rescue, weight_visual=1.0, weight_text=0.0)
+        by_text = dict(no_rescue, weight_visual=0.0, weight_text=1.0)
+        scores = score_grid(np.vstack([config_row(by_visual), config_row(by_text)]), visual, text, truth)
+        self.assertEqual(scores['f1'][0], 1.0)
+        self.assertLess(scores['f1'][1], 1.0)
+        
+        wins, f1 = wins_in_replay(visual, text, truth, by_visual, by_text)
+        self.assertFalse(wins)
+        self.assertTrue(wins_in_replay(visual, text, truth, by_text, by_visual)[0])
+
+
+class TextScoreScaleTest(TestCase):
+    """Tests para la escala única de text_scores por lote de candidatos"""
+    
+    def test_one_scale_per_candidate_set(self):
+        from unittest.mock import patch
+        import numpy as np
+        from core.ai_utils import text_scores
+        from core.text_similarity import title_similarity
+        
+        target = np.array([1.0, 0.0])
+        near, far = [0.8, 0.6], [0.0, 1.0]
+        titles = ["Reloj Casio negro", "Perfume 100 ml"]
+        identity = (np.array([0.0, 1.0]), np.array([0.0, 1.0]))
+        halves = (np.array([0.0, 1.0]), np.array([0.0, 0.5]))
+        
+        with patch('core.text_similarity.load_calibration', side_effect=lambda kind: {"embedding": halves}.get(kind)):
+            # Todos con vector: coseno llevado a la escala legacy
+            self.assertTrue(np.allclose(text_scores("Reloj Casio", target, titles, [near, far]), [0.4, 0.0]))
+            # Un candidato sin vector: todo el lote con el kernel difuso (sin mezclar escalas)
+            self.assertTrue(np.allclose(text_scores("Reloj Casio", target, titles, [near, None]),
+                                        title_similarity("Reloj Casio", titles)))
+        
+        # Sin calibración "embedding" el coseno crudo nunca llega a evaluate_pair
+        with patch('core.text_similarity.load_calibration', side_effect=lambda kind: identity if kind == "fuzzy" else None):
+            self.assertTrue(np.allclose(text_scores("Reloj Casio", target, titles, [near, far]),
+                                        title_similarity("Reloj Casio", titles)))
+    
+    def test_calibration_is_stored_in_db(self):
+        import numpy as np
+        from core.text_similarity import calibrate, fit_quantile_map, save_calibration
+        
+        self.assertIsNone(calibrate(np.array([0.5]), "embedding"))
+        cosine = np.linspace(0.2, 0.9, 200)
+        save_calibration({"embedding": fit_quantile_map(cosine, cosine ** 2)})
+        # Mismo percentil -> mismo score legacy: un umbral legacy conserva su tasa de aceptación
+        self.assertAlmostEqual(float(calibrate(np.array([0.8]), "embedding")[0]), 0.64, places=2)
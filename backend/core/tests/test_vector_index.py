@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Vector Index Tests
+Tests del índice vectorial en memoria del clusterizer (sin DB)
+"""
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase
+from core.vector_index import ConceptBucket
+
+
+class ConceptBucketTest(SimpleTestCase):
+    """Tests para ConceptBucket"""
+
+    def setUp(self):
+        self.bucket = ConceptBucket(capacity=2)
+        self.bucket.add(1, 10, "Perfume A", None, [1.0, 0.0, 0.0])
+        self.bucket.add(2, 20, "Perfume B", None, [0.8, 0.6, 0.0])
+        self.bucket.add(3, 30, "Reloj", None, [0.0, 0.0, 5.0]) # fuerza crecimiento y se normaliza
+
+    def test_search_orders_by_distance_and_excludes_self(self):
+        """Top-k exacto, distancia = 1 - coseno, sin el propio producto"""
+        results = self.bucket.search(np.array([1.0, 0.0, 0.0]), k=2, exclude_id=1)
+
+        self.assertEqual([r[0] for r in results], [2, 3])
+        self.assertAlmostEqual(results[0][4], 0.2, places=5)
+        self.assertAlmostEqual(results[1][4], 1.0, places=5)
+
+    def test_add_existing_updates_cluster(self):
+        """Re-agregar un producto actualiza su fila en lugar de duplicarla"""
+        self.bucket.add(2, 99, "Perfume B", None, [0.8, 0.6, 0.0])
+
+        self.assertEqual(self.bucket.size, 3)
+        self.assertEqual(self.bucket.search(np.array([0.8, 0.6, 0.0]), k=1)[0][3], 99)
+
+    def test_centroid_first_search_only_scans_top_clusters(self):
+        """En buckets grandes solo se revisan los miembros de los clusters más cercanos"""
+        with patch("core.vector_index.EXACT_SEARCH_MAX", 2):
+            results = self.bucket.search(np.array([0.0, 0.1, 1.0]), k=3, top_clusters=1)
+
+        self.assertEqual([r[0] for r in results], [3])
+
+    def test_move_updates_centroids(self):
+        """Mover un producto de cluster lo descuenta del centroide anterior"""
+        self.bucket.add(2, 10, "Perfume B", None, [0.8, 0.6, 0.0])
+
+        self.assertEqual(self.bucket.members[10], {0, 1})
+        self.assertEqual(self.bucket.members[20], set())
+        np.testing.assert_allclose(self.bucket.centroids[self.bucket.centroid_rows[20]], 0.0, atol=1e-6)
@@ -0,0 +1,152 @@
+"""
+Similitud de Títulos (Kernel Compartido).
+
+Usado por el clusterizer y el Orphan Investigator (vía ai_utils.text_scores) cuando
+el lote de candidatos no se puede puntuar con embedding_text, y por las herramientas de calidad.
+
+- normalize_title(): acentos, mayúsculas, unidades ("100 Mililitros" -> "100ml") y signos.
+  Cacheado: cada título se normaliza una sola vez por proceso.
+- title_similarity(): 1 título vs N candidatos en una sola llamada (rapidfuzz, en C).
+- Calibración: ni el ratio de rapidfuzz sobre títulos normalizados ("fuzzy") ni el coseno de
+  embedding_text ("embedding") tienen la escala del SequenceMatcher(a.lower(), b.lower()) con el
+  que se fijaron los umbrales (ej: threshold_text_rescue=0.95). `calibrate_text_similarity`
+  ajusta un mapeo monótono por cuantiles (score nuevo -> score legacy) para cada tipo de score
+  y los guarda en la tabla text_calibrations (compartida por todos los contenedores);
+  calibrate() los aplica. Cada proceso los relee cada CALIBRATION_TTL segundos.
+"""
+
+import os
+import re
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    process = None
+
+CALIBRATION_KNOTS = 101
+CALIBRATION_TTL = float(os.getenv("TEXT_CALIBRATION_TTL", "300"))
+CALIBRATION_KINDS = ("fuzzy", "embedding")
+
+# Unidades: variantes -> forma canónica pegada al número
+UNIT_ALIASES = {
+    "ml": ("ml", "mls", "mililitro", "mililitros"),
+    "l": ("l", "lt", "lts", "litro", "litros"),
+    "g": ("g", "gr", "grs", "gramo", "gramos"),
+    "kg": ("kg", "kgs", "kilo", "kilos", "kilogramo", "kilogramos"),
+    "mm": ("mm", "milimetro", "milimetros"),
+    "cm": ("cm", "cms", "centimetro", "centimetros"),
+    "m": ("m", "metro", "metros"),
+    "in": ("in", "pulg", "pulgada", "pulgadas"),
+    "mah": ("mah",),
+    "w": ("w", "watt", "watts", "vatios"),
+    "oz": ("oz", "onza", "onzas"),
+}
+_UNIT_LOOKUP = {alias: unit for unit, aliases in UNIT_ALIASES.items() for alias in aliases}
+_UNIT_RE = re.compile(
+    r"(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(_UNIT_LOOKUP, key=len, reverse=True)) + r")\b"
+)
+_PACK_RE = re.compile(r"\b(?:x|pack de|kit de)\s*(\d+)\b") # "x 2", "pack de 3" -> "x2", "x3"
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9. ]+|(?<!\d)\.|\.(?!\d)") # conserva decimales (1.5l)
+
+
+@lru_cache(maxsize=100_000)
+def normalize_title(title):
+    """Forma canónica de un título para comparación difusa."""
+    text = unicodedata.normalize("NFKD", str(title or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = _UNIT_RE.sub(lambda m: m.group(1).replace(",", ".") + _UNIT_LOOKUP[m.group(2)], text)
+    text = _PACK_RE.sub(r"x\1", text)
+    text = _NON_ALNUM_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def raw_similarity(title, candidates):
+    """Ratio difuso [0, 1] sin calibrar de 1 título vs N candidatos (normalizados)."""
+    query = normalize_title(title)
+    choices = [normalize_title(c) for c in candidates]
+    if not choices:
+        return np.zeros(0, dtype=np.float32)
+    if process is not None:
+        return process.cdist([query], choices, scorer=fuzz.ratio, dtype=np.float32)[0] / 100.0
+    return np.array([SequenceMatcher(None, query, c).ratio() for c in choices], dtype=np.float32)
+
+
+def legacy_similarity(title_a, title_b):
+    """Score de referencia con el que se calibraron los umbrales históricos."""
+    return SequenceMatcher(None, str(title_a).lower(), str(title_b).lower()).ratio()
+
+
+_calibrations = {} # kind -> (leída en, knots | None)
+
+
+def load_calibration(kind="fuzzy"):
+    """Knots (x: score nuevo, y: score legacy) del tipo de score `kind`. None = sin calibrar."""
+    cached = _calibrations.get(kind)
+    if cached is not None and time.monotonic() - cached[0] < CALIBRATION_TTL:
+        return cached[1]
+    from django.db import DatabaseError
+    from core.models import TextCalibration
+    try:
+        knots = TextCalibration.objects.filter(kind=kind).values_list("knots", flat=True).first()
+    except DatabaseError: # Tabla aún sin migrar: sin calibración
+        knots = None
+    calibration = None
+    if knots:
+        calibration = np.asarray(knots["x"], dtype=np.float32), np.asarray(knots["y"], dtype=np.float32)
+    _calibrations[kind] = (time.monotonic(), calibration)
+    return calibration
+
+
+def calibrate(scores, kind):
+    """Lleva `scores` del tipo `kind` a la escala legacy. Retorna None si no hay calibración."""
+    calibration = load_calibration(kind)
+    if calibration is None:
+        return None
+    return np.interp(scores, *calibration).astype(np.float32)
+
+
+def title_similarity(title, candidates, calibrated=True):
+    """
+    Similitud de texto 1 vs N en la escala de los umbrales existentes.
+    Retorna: np.ndarray [N] en [0, 1].
+    """
+    scores = raw_similarity(title, candidates)
+    mapped = calibrate(scores, "fuzzy") if calibrated and len(scores) else None
+    return scores if mapped is None else mapped
+
+
+def fit_quantile_map(new, legacy, knots=CALIBRATION_KNOTS):
+    """
+    Mapeo por cuantiles: el percentil p del score nuevo se lleva al percentil p del legacy,
+    así un umbral legacy (0.95) conserva la misma tasa de aceptación.
+    new / legacy: scores de los mismos pares. Retorna dict {"x": [...], "y": [...], "pairs": n}.
+    """
+    new = np.asarray(new, dtype=np.float64)
+    legacy = np.asarray(legacy, dtype=np.float64)
+    levels = np.linspace(0, 1, knots)
+    x = np.quantile(new, levels)
+    y = np.maximum.accumulate(np.quantile(legacy, levels))
+    # Anclas en los extremos y x estrictamente creciente para np.interp
+    x = np.concatenate(([0.0], x, [1.0]))
+    y = np.concatenate(([0.0], y, [1.0]))
+    x, inverse = np.unique(x, return_inverse=True)
+    y_unique = np.zeros_like(x)
+    np.maximum.at(y_unique, inverse, y)
+    return {"x": x.round(4).tolist(), "y": y_unique.round(4).tolist(), "pairs": len(new)}
+
+
+def save_calibration(calibrations):
+    """calibrations: {kind: fit_quantile_map(...)}; reemplaza solo los tipos dados."""
+    from core.models import TextCalibration
+    for kind, calibration in calibrations.items():
+        TextCalibration.objects.update_or_create(kind=kind, defaults={
+            "knots": {"x": calibration["x"], "y": calibration["y"]},
+            "pairs": calibration["pairs"],
+        })
+    _calibrations.clear()
@@ -0,0 +1,199 @@
+"""
+Índice Vectorial en Memoria por Concepto (Clusterizer).
+
+El HNSW global de product_embeddings no respeta el filtro `taxonomy_concept = X`:
+Postgres o escanea el bucket entero o post-filtra los vecinos del HNSW y pierde recall.
+Aquí cada concepto tiene su propia matriz de vectores visuales (normalizados) en RAM:
+- Se construye lazy desde product_embeddings la primera vez que se consulta el concepto.
+- Se actualiza incrementalmente cuando un producto entra a un cluster (sin re-leer la DB).
+- La búsqueda es exacta (producto punto + top-k con argpartition) mientras el bucket es chico.
+  En buckets grandes es centroid-first: primero los `top_clusters` centroides más cercanos
+  (suma de los vectores de cada cluster, mantenida en cada alta/movimiento) y después solo
+  los miembros de esos clusters.
+- Cada bucket se recarga tras `max_age` segundos para absorber cambios externos
+  (merges/trash desde el Cluster Lab, re-vectorizaciones).
+"""
+
+import time
+
+import numpy as np
+
+from core.ai_utils import as_vector
+
+TOP_CLUSTERS = 8 # Clusters cuyos miembros se revisan en la búsqueda centroid-first
+EXACT_SEARCH_MAX = 2000 # Por debajo de este tamaño el escaneo completo es más barato
+
+
+def _normalize(vec):
+    vec = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+class ConceptBucket:
+    """Miembros (con cluster) de un concepto: arrays paralelos que crecen por duplicación."""
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.cluster_ids = np.zeros(capacity, dtype=np.int64)
+        self.visual = None # [capacity, dim] se asigna con el primer vector
+        self.text_vecs = []
+        self.titles = []
+        self.images = []
+        self.positions = {} # product_id -> fila
+        self.centroids = None # [n_clusters, dim] suma de los vectores de cada cluster
+        self.centroid_rows = {} # cluster_id -> fila en centroids
+        self.centroid_ids = []
+        self.members = {} # cluster_id -> set(filas)
+        self.loaded_at = time.monotonic()
+
+    def _grow(self, dim):
+        if self.visual is None:
+            self.visual = np.zeros((self.capacity, dim), dtype=np.float32)
+        if self.size < self.capacity:
+            return
+        self.capacity *= 2
+        self.ids = np.resize(self.ids, self.capacity)
+        self.cluster_ids = np.resize(self.cluster_ids, self.capacity)
+        visual = np.zeros((self.capacity, self.visual.shape[1]), dtype=np.float32)
+        visual[:self.size] = self.visual[:self.size]
+        self.visual = visual
+
+    def _centroid_row(self, cluster_id, dim):
+        crow = self.centroid_rows.get(cluster_id)
+        if crow is None:
+            if self.centroids is None:
+                self.centroids = np.zeros((64, dim), dtype=np.float32)
+            elif len(self.centroid_ids) == len(self.centroids):
+                centroids = np.zeros((len(self.centroids) * 2, dim), dtype=np.float32)
+                centroids[:len(self.centroid_ids)] = self.centroids
+                self.centroids = centroids
+            crow = len(self.centroid_ids)
+            self.centroid_rows[cluster_id] = crow
+            self.centroid_ids.append(cluster_id)
+            self.members[cluster_id] = set()
+        return crow
+
+    def add(self, pid, cluster_id, title, image, visual_vec, text_vec=None):
+        """Agrega (o actualiza si ya existe) un miembro del concepto."""
+        visual_vec = _normalize(visual_vec)
+        row = self.positions.get(pid)
+        if row is not None:
+            # Movimiento: se descuenta del centroide anterior
+            previous = int(self.cluster_ids[row])
+            self.centroids[self.centroid_rows[previous]] -= self.visual[row]
+            self.members[previous].discard(row)
+        else:
+            self._grow(len(visual_vec))
+            row = self.size
+            self.size += 1
+            self.positions[pid] = row
+            self.text_vecs.append(None)
+            self.titles.append(None)
+            self.images.append(None)
+
+        self.ids[row] = pid
+        self.cluster_ids[row] = cluster_id
+        self.visual[row] = visual_vec
+        self.text_vecs[row] = as_vector(text_vec)
+        self.titles[row] = title
+        self.images[row] = image
+
+        crow = self._centroid_row(cluster_id, len(visual_vec))
+        self.centroids[crow] += visual_vec
+        self.members[cluster_id].add(row)
+
+    def candidate_rows(self, query_vec, top_clusters=TOP_CLUSTERS):
+        """Filas de los miembros de los `top_clusters` clusters con centroide más cercano."""
+        n = len(self.centroid_ids)
+        centroids = self.centroids[:n]
+        norms = np.linalg.norm(centroids, axis=1)
+        scores = np.divide(centroids @ query_vec, norms, out=np.full(n, -np.inf, dtype=np.float32), where=norms > 0)
+        top = np.argpartition(-scores, top_clusters - 1)[:top_clusters] if n > top_clusters else np.arange(n)
+        rows = [row for c in top for row in self.members[self.centroid_ids[c]]]
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def search(self, query_vec, k, exclude_id=None, top_clusters=TOP_CLUSTERS):
+        """
+        Top-k por similitud coseno (centroid-first si el bucket supera EXACT_SEARCH_MAX).
+        Retorna: lista de (c_pid, c_title, c_image, c_cluster_id, distance, c_text_vec)
+        con distance = 1 - coseno (misma escala que el operador <=> de pgvector), ascendente.
+        """
+        if self.size == 0:
+            return []
+        query_vec = _normalize(query_vec)
+        if self.size > EXACT_SEARCH_MAX and len(self.centroid_ids) > top_clusters:
+            rows = self.candidate_rows(query_vec, top_clusters)
+        else:
+            rows = np.arange(self.size)
+        if len(rows) == 0:
+            return []
+        scores = self.visual[rows] @ query_vec
+        if exclude_id is not None and exclude_id in self.positions:
+            scores[rows == self.positions[exclude_id]] = -np.inf
+
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(self.ids[rows[i]]), self.titles[rows[i]], self.images[rows[i]], int(self.cluster_ids[rows[i]]),
+             float(1.0 - scores[i]), self.text_vecs[rows[i]])
+            for i in top if np.isfinite(scores[i])
+        ]
+
+
+class ConceptVectorIndex:
+    """Colección de ConceptBucket, uno por taxonomy_concept, cargados bajo demanda."""
+
+    def __init__(self, max_age=600):
+        self.max_age = max_age
+        self.buckets = {}
+
+    def _load(self, cur, concept):
+        cur.execute("""
+            SELECT p.product_id, p.title, p.url_image_s3, pcm.cluster_id,
+                   pe.embedding_visual, pe.embedding_text
+            FROM products p
+            JOIN product_embeddings pe ON pe.product_id = p.product_id
+            JOIN product_cluster_membership pcm ON pcm.product_id = p.product_id
+            WHERE p.taxonomy_concept = %s
+            AND pe.embedding_visual IS NOT NULL
+        """, (concept,))
+        rows = cur.fetchall()
+
+        bucket = ConceptBucket(capacity=max(256, len(rows) * 2))
+        for pid, title, image, cluster_id, visual, text in rows:
+            bucket.add(pid, cluster_id, title, image, as_vector(visual), text)
+        self.buckets[concept] = bucket
+        return bucket
+
+    def bucket(self, cur, concept):
+        bucket = self.buckets.get(concept)
+        if bucket is None or time.monotonic() - bucket.loaded_at > self.max_age:
+            bucket = self._load(cur, concept)
+        return bucket
+
+    def search(self, cur, concept, query_vec, k=5, exclude_id=None):
+        return self.bucket(cur, concept).search(as_vector(query_vec), k, exclude_id)
+
+    def add(self, concept, pid, cluster_id, title, image, visual_vec, text_vec=None):
+        """Registra un nuevo miembro. Si el concepto aún no está en memoria, se cargará completo al consultarlo."""
+        bucket = self.buckets.get(concept)
+        if bucket is not None:
+            bucket.add(pid, cluster_id, title, image, as_vector(visual_vec), text_vec)
+
+    def invalidate(self, concept):
+        """Descarta el bucket del concepto: se recarga desde la DB en la próxima consulta."""
+        self.buckets.pop(concept, None)
+
+    def clear(self):
+        self.buckets.clear()
+
+    def stats(self):
+        return {
+            "concepts": len(self.buckets),
+            "vectors": sum(b.size for b in self.buckets.values()),
+            "clusters": sum(len(b.centroid_ids) for b in self.buckets.values()),
+        }
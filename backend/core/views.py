@@ -107,78 +107,37 @@ class DashboardStatsView(APIView):
         })
 
 from django.db import connection
-from .ai_utils import get_image_embedding
+from .services import GoldMineService
+from .embedding_service import EmbeddingServiceError
+from . import cluster_metrics
 
 class GoldMineView(APIView):
     def post(self, request):
-        """BÃºsqueda Visual (Reverse Image Search)"""
+        """Búsqueda Visual (Reverse Image Search) - paginada con ?limit=&offset="""
         if 'image' not in request.FILES:
             return Response({"error": "No image provided"}, status=400)
-            
-        uploaded_file = request.FILES['image']
-        
-        # 1. Vectorizar imagen llegada
-        vector = get_image_embedding(uploaded_file)
-        if not vector:
-             return Response({"error": "Failed to process image"}, status=500)
-             
-        # 2. Buscar por similaridad (pgvector cosine distance <=>)
-        # Buscamos embeddings visuales cercanos y unimos con clusters
-        # Traemos los top 50 matches visuales
-        sql = """
-            SELECT 
-                pe.product_id, 
-                (pe.embedding_visual <=> %s::vector) as distance
-            FROM product_embeddings pe
-            WHERE pe.embedding_visual IS NOT NULL
-            ORDER BY distance ASC
-            LIMIT 50
-        """
-        
-        similar_products = []
-        with connection.cursor() as cur:
-            cur.execute(sql, (vector,))
-            rows = cur.fetchall()
-            similar_pids = [r[0] for r in rows]
-
-        # 3. Recuperar detalles de clusters para esos productos
-        # Queremos saber a quÃ© cluster pertenecen esos productos similares
-        # y devolver el cluster entero o el representante
-        results = []
-        if similar_pids:
-            # Traer info de clusters donde esos productos son miembros o representantes
-            # SimplificaciÃ³n: Devolvemos los productos directos encontrados, enriquecidos con su cluster info
-            products = Product.objects.filter(product_id__in=similar_pids).select_related('supplier')
-            
-            # --- OPTIMIZACION N+1 ---
-            # Cargar info de clusters en batch
-            product_ids = [p.product_id for p in products]
-            memberships = ProductClusterMembership.objects.filter(product_id__in=product_ids).select_related('cluster')
-            cluster_map = {m.product_id: m.cluster for m in memberships}
-
-            # Map distance
-            dist_map = {r[0]: r[1] for r in rows}
-            
-            for p in products:
-                # BÃºsqueda en memoria O(1)
-                cluster_info = cluster_map.get(p.product_id)
-                
-                results.append({
-                    "id": p.product_id,
-                    "title": p.title,
-                    "price": p.sale_price,
-                    "image": p.url_image_s3,
-                    "similarity": f"{int((1 - dist_map.get(p.product_id, 1))*100)}%",
-                    "competitors": cluster_info.total_competitors if cluster_info else 1,
-                    "profit_margin": "N/A", # Calc real
-                    "supplier": p.supplier.store_name if p.supplier else "Desconocido",
-                    "cluster_id": cluster_info.cluster_id if cluster_info else None
-                })
-                
-            # Ordenar por similaridad descendente
-            results.sort(key=lambda x: x['similarity'], reverse=True)
 
-        return Response(results)
+        try:
+            limit = int(request.query_params.get('limit', 50))
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            limit, offset = 50, 0
+
+        # Ranking cacheado por hash de la imagen; enriquecimiento en una sola query
+        # (la paginación se acota en el servicio: 1 <= limit <= 200, offset >= 0)
+        try:
+            page = GoldMineService.search_by_visual_similarity(
+                request.FILES['image'].read(), limit=limit, offset=offset
+            )
+        except EmbeddingServiceError:
+            return Response({"error": "Embedding service unavailable"}, status=503)
+        if page is None:
+            return Response({"error": "Failed to process image"}, status=500)
+
+        response = Response(page['results'])
+        response['X-Total-Count'] = page['total']
+        response['X-Cache'] = 'HIT' if page['cached'] else 'MISS'
+        return response
 
     def get(self, request):
         """BÃºsqueda Textual y Filtros"""
@@ -189,6 +148,7 @@ class GoldMineView(APIView):
             offset = int(request.query_params.get('offset', 0))
         except ValueError:
             min_comp, max_comp, limit, offset = 0, 50, 50, 0
+        limit, offset = GoldMineService.clamp_page(limit, offset)
 
         search_query = request.query_params.get('q', '')
         category_filter = request.query_params.get('category', None)
@@ -329,22 +289,23 @@ class ClusterAuditView(APIView):
             # Ordering is defined in Meta class as ['-timestamp']
             logs = ClusterDecisionLog.objects.all()[:limit]
             
-            # --- ACTION: Bulk Fetch Concepts ---
-            p_ids = [log.product_id for log in logs]
-            products = Product.objects.filter(product_id__in=p_ids).only('product_id', 'taxonomy_concept', 'taxonomy_level')
-            concept_map = {p.product_id: {'concept': p.taxonomy_concept, 'level': p.taxonomy_level} for p in products}
+            # --- ACTION: Bulk Fetch Concepts + Títulos/Imágenes (los logs solo guardan ids) ---
+            p_ids = {log.product_id for log in logs} | {log.candidate_id for log in logs}
+            products = Product.objects.filter(product_id__in=p_ids).only('product_id', 'title', 'url_image_s3', 'taxonomy_concept', 'taxonomy_level')
+            product_map = {p.product_id: p for p in products}
 
             data = []
             for log in logs:
-                c_info = concept_map.get(log.product_id, {})
+                product_a = product_map.get(log.product_id)
+                product_b = product_map.get(log.candidate_id)
                 data.append({
                     "timestamp": log.timestamp.timestamp(),
                     "product_id": log.product_id,
                     "candidate_id": log.candidate_id,
-                    "title_a": log.title_a,
-                    "title_b": log.title_b,
-                    "image_a": log.image_a,
-                    "image_b": log.image_b,
+                    "title_a": product_a.title if product_a else None,
+                    "title_b": product_b.title if product_b else None,
+                    "image_a": product_a.url_image_s3 if product_a else None,
+                    "image_b": product_b.url_image_s3 if product_b else None,
                     "visual_score": log.visual_score,
                     "text_score": log.text_score,
                     "final_score": log.final_score,
@@ -352,8 +313,8 @@ class ClusterAuditView(APIView):
                     "method": log.match_method,
                     "active_weights": log.active_weights,
                     # NEW FIELDS
-                    "concept": c_info.get('concept', 'UNKNOWN'),
-                    "level": c_info.get('level', 'UNKNOWN')
+                    "concept": product_a.taxonomy_concept if product_a else 'UNKNOWN',
+                    "level": product_a.taxonomy_level if product_a else 'UNKNOWN'
                 })
 
             return Response(data)
@@ -401,37 +362,45 @@ class ClusterOrphansView(APIView):
             with connection.cursor() as cur:
                 # Get Target Info
                 cur.execute("""
-                    SELECT p.title, p.url_image_s3, pe.embedding_visual 
-                    FROM products p 
-                    JOIN product_embeddings pe ON p.product_id = pe.product_id 
+                    SELECT p.title, p.url_image_s3, pe.embedding_visual, pe.embedding_text
+                    FROM products p
+                    JOIN product_embeddings pe ON p.product_id = pe.product_id
                     WHERE p.product_id = %s
                 """, (target_pid,))
                 res = cur.fetchone()
                 if not res: return Response({"error": "Product not found or not vectorized"}, status=404)
-                
-                target_title, target_image, target_vector = res
+
+                target_title, target_image, target_vector, target_text_vector = res
                 
                 # 2. Buscar Top 15 Candidatos Visuales (Expandido para Grid)
                 cur.execute("""
                     SELECT 
                         p.product_id, p.title, p.sale_price, p.url_image_s3,
-                        (pe.embedding_visual <=> %s) as dist 
+                        (pe.embedding_visual <=> %s) as dist,
+                        pe.embedding_text
                     FROM product_embeddings pe
                     JOIN products p ON pe.product_id = p.product_id
                     WHERE pe.product_id != %s AND pe.embedding_visual IS NOT NULL
                     ORDER BY dist ASC
                     LIMIT 50
                 """, (target_vector, target_pid))
-                
+                rows = cur.fetchall()
+
                 candidates = []
-                from difflib import SequenceMatcher
+                from .ai_utils import text_scores
+
+                # Texto: producto punto de embeddings para los 50 candidatos en una sola llamada
+                all_text_scores = text_scores(
+                    target_title, target_text_vector,
+                    [r[1] for r in rows], [r[5] for r in rows]
+                )
+
+                for row, text_score in zip(rows, all_text_scores):
+                    c_pid, c_title, c_price, c_img, dist, _ = row
 
-                for row in cur.fetchall():
-                    c_pid, c_title, c_price, c_img, dist = row
-                    
                     # Calcular Scores (Misma lÃ³gica que Clusterizer V3)
                     visual_score = max(0, 1.0 - float(dist))
-                    text_score = SequenceMatcher(None, str(target_title).lower(), str(c_title).lower()).ratio()
+                    text_score = float(text_score)
                     final_score = (0.6 * visual_score) + (0.4 * text_score)
                     
                     # LÃ³gica de Rescate (Simulada)
@@ -481,6 +450,7 @@ class SystemLogsView(APIView):
             "clusterizer": "clusterizer.log",
             "loader": "loader.log",
             "vectorizer": "vectorizer.log",
+            "embedding_service": "embedding_service.log",
             "classifier": "classifier.log",
             "market_agent": "market_agent.log", # Assuming default log file logic
             "amazon_explorer": "amazon_explorer.log", # Logic check needed here
@@ -576,6 +546,7 @@ class ContainerStatsView(APIView):
             "scraper": "dahell_scraper",
             "loader": "dahell_loader",
             "vectorizer": "dahell_vectorizer",
+            "embedding_service": "dahell_embedding_service",
             "classifier": "dahell_classifier",
             "clusterizer": "dahell_clusterizer",
             "market_agent": "dahell_market_agent",
@@ -600,6 +571,7 @@ class ContainerControlView(APIView):
             "scraper": "dahell_scraper",
             "loader": "dahell_loader",
             "vectorizer": "dahell_vectorizer",
+            "embedding_service": "dahell_embedding_service",
             "classifier": "dahell_classifier",
             "clusterizer": "dahell_clusterizer",
             "market_agent": "dahell_market_agent",
@@ -644,8 +616,10 @@ class ClusterOrphanActionView(APIView):
                 if action == 'TRASH':
                     # Incinerar producto: Borrar Embeddings y ClusterMembership
                     # Esto lo saca del radar del sistema de IA y Clustering
+                    # Primero la membresía: el delta descuenta su embedding del centroide
+                    with connection.cursor() as cur:
+                        cluster_metrics.remove_membership(cur, target_id)
                     ProductEmbedding.objects.filter(product_id=target_id).delete()
-                    ProductClusterMembership.objects.filter(product_id=target_id).delete()
                     # Opcional: Marcar producto como inactivo si tuvieramos campo status
                     # product.status = 'TRASH'
                     # product.save()
@@ -662,27 +636,17 @@ class ClusterOrphanActionView(APIView):
                     if not candidates:
                         return Response({"error": "No candidates selected for merge"}, status=400)
                     
-                    # 1. Obtener cluster del Target (o crearle uno si por milagro no tiene)
-                    membership, _ = ProductClusterMembership.objects.get_or_create(
-                        product_id=target_id,
-                        defaults={'cluster_id': UniqueProductCluster.objects.create().cluster_id}
-                    )
-                    target_cluster = membership.cluster
-
-                    # 2. Mover candidatos a este cluster
-                    for cand_id in candidates:
-                        # Borrar membresÃ­a anterior
-                        ProductClusterMembership.objects.filter(product_id=cand_id).delete()
-                        # Crear nueva en el cluster del target
-                        ProductClusterMembership.objects.create(
-                            product_id=cand_id,
-                            cluster=target_cluster
-                            # removed is_representative since it doesn't exist in the model
-                        )
-                    
-                    # 3. Recalcular metricas del cluster (Simulado update de timestamp para refrescar)
-                    target_cluster.save() # Dispara trigger de updated_at
-                    msg = f"Merged {len(candidates)} candidates into Cluster {target_cluster.cluster_id}"
+                    with connection.cursor() as cur:
+                        # 1. Obtener cluster del Target (o crearle uno si por milagro no tiene)
+                        cur.execute("SELECT cluster_id FROM product_cluster_membership WHERE product_id = %s", (target_id,))
+                        row = cur.fetchone()
+                        target_cluster_id = row[0] if row else cluster_metrics.create_cluster(cur, target_id)
+
+                        # 2. Mover candidatos a este cluster (deltas en cluster origen y destino;
+                        #    un origen que se queda sin miembros se elimina y su historial pasa aquí)
+                        for cand_id in candidates:
+                            cluster_metrics.assign_membership(cur, cand_id, target_cluster_id, 1.0, 'HUMAN_MERGE')
+                    msg = f"Merged {len(candidates)} candidates into Cluster {target_cluster_id}"
 
             return Response({"status": "success", "message": msg})
             
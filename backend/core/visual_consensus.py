@@ -0,0 +1,54 @@
+"""
+Consenso Visual para el Taxonomist.
+
+Si al menos TAXONOMY_CONSENSUS_K vecinos visuales con similitud >= TAXONOMY_CONSENSUS_SIMILARITY
+ya tienen el mismo concepto e industria (y ningún otro par empata), el producto hereda esa
+etiqueta sin llamar al LLM (taxonomy_source = 'VISUAL_CONSENSUS'). Los ambiguos van a Ollama.
+
+TAXONOMY_CONSENSUS_MODE:
+- "off": siempre LLM.
+- "shadow" (default): siempre LLM, pero se compara con lo que habría dicho el consenso
+  (taxonomy_source = 'LLM_CONSENSUS_AGREE' / 'LLM_CONSENSUS_DISAGREE') para medir la
+  tasa de acuerdo antes de activarlo.
+- "on": el consenso reemplaza al LLM cuando existe.
+"""
+
+import os
+from collections import Counter
+
+TAXONOMY_CONSENSUS_MODE = os.getenv("TAXONOMY_CONSENSUS_MODE", "shadow").lower()
+TAXONOMY_CONSENSUS_K = int(os.getenv("TAXONOMY_CONSENSUS_K", "3"))
+TAXONOMY_CONSENSUS_SIMILARITY = float(os.getenv("TAXONOMY_CONSENSUS_SIMILARITY", "0.90"))
+
+VISUAL_CONSENSUS = "VISUAL_CONSENSUS"
+
+
+def visual_consensus(neighbours, k=TAXONOMY_CONSENSUS_K, threshold=TAXONOMY_CONSENSUS_SIMILARITY):
+    """
+    neighbours: lista de dicts del classifier (similarity, concept, industry, level).
+    Retorna: resultado con el mismo formato que el LLM (concept_name, parent_industry,
+    classification, reason) o None si no hay consenso.
+    """
+    votes = Counter(
+        (n["concept"], n.get("industry"))
+        for n in neighbours
+        if n.get("similarity", 0.0) >= threshold and n.get("concept") and n["concept"] != "UNKNOWN"
+    )
+    if not votes:
+        return None
+    ranked = votes.most_common(2)
+    (concept, industry), count = ranked[0]
+    if count < k or (len(ranked) > 1 and ranked[1][1] == count):
+        return None
+
+    levels = Counter(
+        n.get("level") for n in neighbours
+        if n.get("concept") == concept and n.get("industry") == industry and n.get("level")
+    )
+    return {
+        "concept_name": concept,
+        "parent_industry": industry,
+        "classification": levels.most_common(1)[0][0] if levels else "CONCEPT",
+        "reason": VISUAL_CONSENSUS,
+        "votes": count,
+    }
@@ -0,0 +1,118 @@
+"""
+Asignación Zero-Shot de Conceptos (SigLIP imagen <-> texto).
+
+SigLIP es un modelo conjunto imagen-texto: su torre de texto proyecta "una foto de Silla Gamer"
+al mismo espacio que los embedding_visual que ya guarda el vectorizer. Con los nombres del
+diccionario de conceptos (core.concept_dictionary) embebidos una vez, puntuar una página de
+productos pendientes es un solo producto de matrices [N, 1152] x [1152, C].
+- Los pendientes se recorren por páginas de TAXONOMY_ZERO_SHOT_PAGE ordenadas por product_id
+  (marca de agua): cada pase carga a lo sumo una página, no todo el backlog.
+- Compiten solo conceptos conocidos (>= TAXONOMY_ZERO_SHOT_MIN_PRODUCTS productos etiquetados).
+- Se asigna si el mejor score >= TAXONOMY_ZERO_SHOT_MIN_SCORE y le saca al segundo al menos
+  TAXONOMY_ZERO_SHOT_MARGIN; lo nuevo o ambiguo sigue al consenso visual / LLM.
+- TAXONOMY_ZERO_SHOT_MODE: off | shadow (default: solo mide el acuerdo con el LLM) | on.
+  Los scores coseno imagen-texto de SigLIP son bajos (~0.05-0.20): calibrar umbrales en shadow.
+Los vectores de texto guardan la versión del modelo; si cambia SigLIP se re-embeben.
+"""
+
+import logging
+import os
+
+import numpy as np
+from django.db import connection
+
+from core.ai_utils import as_vector
+from core.embedding_service import EMBEDDING_DIM
+from core.models import Concept
+
+logger = logging.getLogger(__name__)
+
+ZERO_SHOT = "ZERO_SHOT"
+TAXONOMY_ZERO_SHOT_MODE = os.getenv("TAXONOMY_ZERO_SHOT_MODE", "shadow").lower()
+TAXONOMY_ZERO_SHOT_MIN_SCORE = float(os.getenv("TAXONOMY_ZERO_SHOT_MIN_SCORE", "0.10"))
+TAXONOMY_ZERO_SHOT_MARGIN = float(os.getenv("TAXONOMY_ZERO_SHOT_MARGIN", "0.02"))
+TAXONOMY_ZERO_SHOT_MIN_PRODUCTS = int(os.getenv("TAXONOMY_ZERO_SHOT_MIN_PRODUCTS", "3"))
+TAXONOMY_ZERO_SHOT_TEMPLATE = os.getenv("TAXONOMY_ZERO_SHOT_TEMPLATE", "una foto de {}")
+TAXONOMY_ZERO_SHOT_PAGE = int(os.getenv("TAXONOMY_ZERO_SHOT_PAGE", "5000"))
+
+
+def refresh_concept_text_embeddings(client, model_version):
+    """
+    Embebe con la torre de texto SigLIP los conceptos sin vector o de otra versión de modelo.
+    Retorna: conceptos actualizados.
+    """
+    pending = list(Concept.objects.exclude(embedding_siglip_model=model_version).values_list('id', 'name'))
+    if not pending:
+        return 0
+    vectors, version = client.embed_texts([TAXONOMY_ZERO_SHOT_TEMPLATE.format(name) for _, name in pending])
+    with connection.cursor() as cur:
+        cur.executemany(
+            "UPDATE concepts SET embedding_siglip = %s::vector, embedding_siglip_model = %s WHERE id = %s",
+            [(vec.tolist(), version, concept_id) for (concept_id, _), vec in zip(pending, vectors)]
+        )
+    return len(pending)
+
+
+def load_concept_matrix(model_version, min_products=TAXONOMY_ZERO_SHOT_MIN_PRODUCTS):
+    """Retorna: (lista de (id, nombre, industria), np.ndarray [C, 1152]) de los conceptos candidatos."""
+    with connection.cursor() as cur:
+        cur.execute("""
+            SELECT c.id, c.name, c.industry, c.embedding_siglip
+            FROM concepts c
+            JOIN products p ON p.concept_id = c.id
+            WHERE c.embedding_siglip IS NOT NULL AND c.embedding_siglip_model = %s
+            GROUP BY c.id
+            HAVING COUNT(*) >= %s
+            ORDER BY c.id
+        """, (model_version, min_products))
+        rows = cur.fetchall()
+    if not rows:
+        return [], np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return [row[:3] for row in rows], np.stack([as_vector(row[3]) for row in rows])
+
+
+def zero_shot_assign(vectors, matrix, min_score=TAXONOMY_ZERO_SHOT_MIN_SCORE, margin=TAXONOMY_ZERO_SHOT_MARGIN):
+    """
+    vectors: [N, 1152] imágenes; matrix: [C, 1152] textos de conceptos (C >= 2), ambos normalizados.
+    Retorna: (índice del concepto o -1 si no es seguro [N], mejor score [N], margen sobre el segundo [N]).
+    """
+    scores = vectors @ matrix.T
+    top2 = np.partition(scores, -2, axis=1)[:, -2:]
+    best, gap = scores.argmax(axis=1), top2[:, 1] - top2[:, 0]
+    confident = (top2[:, 1] >= min_score) & (gap >= margin)
+    return np.where(confident, best, -1), top2[:, 1], gap
+
+
+def pending_vectors(model_version, after_id=0, limit=TAXONOMY_ZERO_SHOT_PAGE):
+    """
+    Página de productos sin clasificar con vector visual de `model_version` y product_id > `after_id`
+    (recorre la PK en orden). Retorna: (ids ascendentes, np.ndarray [N, 1152]); N < limit = fin del barrido.
+    """
+    with connection.cursor() as cur:
+        cur.execute("""
+            SELECT p.product_id, pe.embedding_visual
+            FROM products p
+            JOIN product_embeddings pe ON pe.product_id = p.product_id
+            WHERE p.taxonomy_concept IS NULL AND p.is_active
+            AND pe.embedding_visual IS NOT NULL AND pe.embedding_visual_model = %s
+            AND p.product_id > %s
+            ORDER BY p.product_id
+            LIMIT %s
+        """, (model_version, after_id, limit))
+        rows = cur.fetchall()
+    if not rows:
+        return [], np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return [row[0] for row in rows], np.stack([as_vector(row[1]) for row in rows])
+
+
+def apply_assignments(cur, product_ids, concept_ids):
+    """Etiqueta en bloque (modo on) con el concepto y su industria. Retorna: productos actualizados."""
+    cur.execute("""
+        UPDATE products p SET
+            concept_id = c.id, taxonomy_concept = c.name, taxonomy_industry = c.industry,
+            taxonomy_level = 'CONCEPT', taxonomy_source = %s
+        FROM unnest(%s::bigint[], %s::int[]) AS v(product_id, concept_id)
+        JOIN concepts c ON c.id = v.concept_id
+        WHERE p.product_id = v.product_id AND p.taxonomy_concept IS NULL
+    """, (ZERO_SHOT, list(product_ids), list(concept_ids)))
+    return cur.rowcount
@@ -343,31 +343,48 @@ CREATE TABLE public.cluster_decision_logs (
     "timestamp" timestamp with time zone NOT NULL,
     product_id bigint NOT NULL,
     candidate_id bigint NOT NULL,
-    title_a text,
-    title_b text,
-    image_a text,
-    image_b text,
     visual_score double precision,
     text_score double precision,
     final_score double precision,
     decision character varying(50),
     match_method character varying(50),
-    active_weights jsonb
-);
+    active_weights jsonb,
+    sample_rate double precision DEFAULT 1 NOT NULL
+)
+PARTITION BY RANGE ("timestamp");
+
+
+--
+-- Name: cluster_decision_logs_default; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.cluster_decision_logs_default PARTITION OF public.cluster_decision_logs DEFAULT;
 
 
 --
 -- Name: cluster_decision_logs_id_seq; Type: SEQUENCE; Schema: public; Owner: -
 --
 
-ALTER TABLE public.cluster_decision_logs ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.cluster_decision_logs_id_seq
+CREATE SEQUENCE public.cluster_decision_logs_id_seq
     START WITH 1
     INCREMENT BY 1
     NO MINVALUE
     NO MAXVALUE
-    CACHE 1
-);
+    CACHE 1;
+
+
+--
+-- Name: cluster_decision_logs_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: -
+--
+
+ALTER SEQUENCE public.cluster_decision_logs_id_seq OWNED BY public.cluster_decision_logs.id;
+
+
+--
+-- Name: cluster_decision_logs id; Type: DEFAULT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.cluster_decision_logs ALTER COLUMN id SET DEFAULT nextval('public.cluster_decision_logs_id_seq'::regclass);
 
 
 --
@@ -380,10 +397,48 @@ CREATE TABLE public.concept_weights (
     weight_text numeric(5,2) DEFAULT 0.4,
     threshold_hybrid numeric(5,2) DEFAULT 0.68,
     last_updated timestamp with time zone DEFAULT now(),
-    sample_size integer DEFAULT 0
+    sample_size integer DEFAULT 0,
+    reevaluated_at timestamp with time zone
 );
 
 
+--
+-- Name: concepts; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.concepts (
+    id integer NOT NULL,
+    name character varying(255) NOT NULL,
+    name_key character varying(255) NOT NULL,
+    industry character varying(255),
+    embedding public.vector(384),
+    aliases jsonb NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    embedding_siglip public.vector(1152),
+    embedding_siglip_model character varying(100)
+);
+
+
+--
+-- Name: concepts_id_seq; Type: SEQUENCE; Schema: public; Owner: -
+--
+
+CREATE SEQUENCE public.concepts_id_seq
+    AS integer
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+
+--
+-- Name: concepts_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: -
+--
+
+ALTER SEQUENCE public.concepts_id_seq OWNED BY public.concepts.id;
+
+
 --
 -- Name: django_admin_log; Type: TABLE; Schema: public; Owner: -
 --
@@ -602,7 +657,8 @@ CREATE TABLE public.product_cluster_membership (
     product_id bigint NOT NULL,
     cluster_id bigint,
     match_confidence numeric(3,2),
-    match_method character varying(50)
+    match_method character varying(50),
+    clustered_at timestamp with time zone
 );
 
 
@@ -613,7 +669,11 @@ CREATE TABLE public.product_cluster_membership (
 CREATE TABLE public.product_embeddings (
     product_id bigint NOT NULL,
     embedding_visual public.vector(1152),
-    processed_at timestamp without time zone DEFAULT now()
+    processed_at timestamp without time zone DEFAULT now(),
+    embedding_text public.vector(384),
+    embedding_visual_model character varying(100),
+    embedding_text_model character varying(100),
+    image_digest character varying(64)
 );
 
 
@@ -673,7 +733,10 @@ CREATE TABLE public.products (
     raw_data jsonb DEFAULT '{}'::jsonb,
     taxonomy_concept character varying(255),
     taxonomy_industry character varying(255),
-    taxonomy_level character varying(50)
+    taxonomy_level character varying(50),
+    taxonomy_source character varying(50),
+    concept_id integer,
+    priority_score double precision
 );
 
 
@@ -693,6 +756,55 @@ CREATE TABLE public.suppliers (
 );
 
 
+--
+-- Name: taxonomy_cache; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.taxonomy_cache (
+    id bigint NOT NULL,
+    title_key text NOT NULL,
+    title_embedding public.vector(384),
+    model_name character varying(100) NOT NULL,
+    prompt_version character varying(20) NOT NULL,
+    result jsonb NOT NULL,
+    llm_seconds double precision NOT NULL,
+    hits integer NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    last_hit_at timestamp with time zone
+);
+
+
+--
+-- Name: taxonomy_cache_id_seq; Type: SEQUENCE; Schema: public; Owner: -
+--
+
+CREATE SEQUENCE public.taxonomy_cache_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+
+--
+-- Name: taxonomy_cache_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: -
+--
+
+ALTER SEQUENCE public.taxonomy_cache_id_seq OWNED BY public.taxonomy_cache.id;
+
+
+--
+-- Name: text_calibrations; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.text_calibrations (
+    kind character varying(20) NOT NULL,
+    knots jsonb NOT NULL,
+    pairs integer NOT NULL,
+    updated_at timestamp with time zone NOT NULL
+);
+
+
 --
 -- Name: unique_product_clusters; Type: TABLE; Schema: public; Owner: -
 --
@@ -702,6 +814,11 @@ CREATE TABLE public.unique_product_clusters (
     representative_product_id bigint,
     total_competitors integer DEFAULT 1,
     average_price numeric(12,2),
+    price_sum numeric(14,2) DEFAULT 0 NOT NULL,
+    price_count integer DEFAULT 0 NOT NULL,
+    min_price numeric(12,2),
+    max_price numeric(12,2),
+    centroid_visual public.vector(1152),
     saturation_score character varying(20),
     created_at timestamp without time zone DEFAULT now(),
     updated_at timestamp without time zone DEFAULT now(),
@@ -716,7 +833,9 @@ CREATE TABLE public.unique_product_clusters (
     market_avg_price numeric(10,2),
     potential_margin numeric(10,2),
     market_saturation_level character varying(20),
-    dropi_competition_tier character varying(20) DEFAULT 'LOW'::character varying
+    dropi_competition_tier character varying(20) DEFAULT 'LOW'::character varying,
+    concept_id integer,
+    priority_score double precision
 );
 
 
@@ -774,6 +893,20 @@ CREATE TABLE public.warehouses (
 ALTER TABLE ONLY public.ai_feedback ALTER COLUMN id SET DEFAULT nextval('public.ai_feedback_id_seq'::regclass);
 
 
+--
+-- Name: concepts id; Type: DEFAULT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.concepts ALTER COLUMN id SET DEFAULT nextval('public.concepts_id_seq'::regclass);
+
+
+--
+-- Name: taxonomy_cache id; Type: DEFAULT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.taxonomy_cache ALTER COLUMN id SET DEFAULT nextval('public.taxonomy_cache_id_seq'::regclass);
+
+
 --
 -- Name: categories id; Type: DEFAULT; Schema: public; Owner: -
 --
@@ -956,7 +1089,7 @@ ALTER TABLE ONLY public.cluster_config
 --
 
 ALTER TABLE ONLY public.cluster_decision_logs
-    ADD CONSTRAINT cluster_decision_logs_pkey PRIMARY KEY (id);
+    ADD CONSTRAINT cluster_decision_logs_pkey PRIMARY KEY (id, "timestamp");
 
 
 --
@@ -967,6 +1100,30 @@ ALTER TABLE ONLY public.concept_weights
     ADD CONSTRAINT concept_weights_pkey PRIMARY KEY (concept);
 
 
+--
+-- Name: concepts concepts_name_key; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.concepts
+    ADD CONSTRAINT concepts_name_key UNIQUE (name);
+
+
+--
+-- Name: concepts concepts_name_key_key; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.concepts
+    ADD CONSTRAINT concepts_name_key_key UNIQUE (name_key);
+
+
+--
+-- Name: concepts concepts_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.concepts
+    ADD CONSTRAINT concepts_pkey PRIMARY KEY (id);
+
+
 --
 -- Name: django_admin_log django_admin_log_pkey; Type: CONSTRAINT; Schema: public; Owner: -
 --
@@ -1079,6 +1236,30 @@ ALTER TABLE ONLY public.suppliers
     ADD CONSTRAINT suppliers_pkey PRIMARY KEY (supplier_id);
 
 
+--
+-- Name: taxonomy_cache taxonomy_cache_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.taxonomy_cache
+    ADD CONSTRAINT taxonomy_cache_pkey PRIMARY KEY (id);
+
+
+--
+-- Name: taxonomy_cache taxonomy_cache_title_key_model_name_prompt_version_uniq; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.taxonomy_cache
+    ADD CONSTRAINT taxonomy_cache_title_key_model_name_prompt_version_uniq UNIQUE (title_key, model_name, prompt_version);
+
+
+--
+-- Name: text_calibrations text_calibrations_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.text_calibrations
+    ADD CONSTRAINT text_calibrations_pkey PRIMARY KEY (kind);
+
+
 --
 -- Name: unique_product_clusters unique_product_clusters_pkey; Type: CONSTRAINT; Schema: public; Owner: -
 --
@@ -1207,6 +1388,13 @@ CREATE INDEX idx_categories_taxonomy ON public.categories USING btree (taxonomy_
 CREATE INDEX idx_cluster_analysis ON public.unique_product_clusters USING btree (analysis_level, is_candidate, is_discarded);
 
 
+--
+-- Name: idx_cluster_centroid; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_cluster_centroid ON public.unique_product_clusters USING hnsw (centroid_visual public.vector_cosine_ops) WITH (m='16', ef_construction='64');
+
+
 --
 -- Name: idx_cluster_membership_composite; Type: INDEX; Schema: public; Owner: -
 --
@@ -1221,6 +1409,20 @@ CREATE INDEX idx_cluster_membership_composite ON public.product_cluster_membersh
 CREATE INDEX idx_clusters_competitors_price ON public.unique_product_clusters USING btree (total_competitors, average_price);
 
 
+--
+-- Name: idx_clusters_priority; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_clusters_priority ON public.unique_product_clusters USING btree (priority_score DESC NULLS LAST);
+
+
+--
+-- Name: idx_decision_logs_timestamp; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_decision_logs_timestamp ON public.cluster_decision_logs USING btree ("timestamp" DESC);
+
+
 --
 -- Name: idx_emb_text; Type: INDEX; Schema: public; Owner: -
 --
@@ -1235,6 +1437,13 @@ CREATE INDEX idx_emb_text ON public.product_embeddings USING hnsw (embedding_tex
 CREATE INDEX idx_emb_visual ON public.product_embeddings USING hnsw (embedding_visual public.vector_cosine_ops) WITH (m='16', ef_construction='64');
 
 
+--
+-- Name: idx_emb_image_digest; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_emb_image_digest ON public.product_embeddings USING hash (image_digest);
+
+
 --
 -- Name: idx_event_embedding; Type: INDEX; Schema: public; Owner: -
 --
@@ -1256,6 +1465,13 @@ CREATE INDEX idx_marketplace_feedback_category ON public.marketplace_feedback US
 CREATE INDEX idx_marketplace_feedback_embedding ON public.marketplace_feedback USING hnsw (embedding public.vector_l2_ops);
 
 
+--
+-- Name: idx_products_created; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_products_created ON public.products USING btree (created_at);
+
+
 --
 -- Name: idx_products_image_not_null; Type: INDEX; Schema: public; Owner: -
 --
@@ -1270,6 +1486,13 @@ CREATE INDEX idx_products_image_not_null ON public.products USING btree (product
 CREATE INDEX idx_products_last_seen ON public.products USING btree (last_seen_at);
 
 
+--
+-- Name: idx_products_priority; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_products_priority ON public.products USING btree (priority_score DESC NULLS LAST);
+
+
 --
 -- Name: idx_products_profit_created; Type: INDEX; Schema: public; Owner: -
 --
@@ -1277,6 +1500,13 @@ CREATE INDEX idx_products_last_seen ON public.products USING btree (last_seen_at
 CREATE INDEX idx_products_profit_created ON public.products USING btree (profit_margin DESC, created_at DESC);
 
 
+--
+-- Name: idx_products_sku_key; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_products_sku_key ON public.products USING hash (upper(regexp_replace((sku)::text, '[^a-zA-Z0-9]'::text, ''::text, 'g'::text)));
+
+
 --
 -- Name: idx_products_title_lower; Type: INDEX; Schema: public; Owner: -
 --
@@ -1284,6 +1514,20 @@ CREATE INDEX idx_products_profit_created ON public.products USING btree (profit_
 CREATE INDEX idx_products_title_lower ON public.products USING btree (lower(title));
 
 
+--
+-- Name: idx_concepts_embedding; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_concepts_embedding ON public.concepts USING hnsw (embedding public.vector_cosine_ops) WITH (m='16', ef_construction='64');
+
+
+--
+-- Name: idx_taxonomy_cache_embedding; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX idx_taxonomy_cache_embedding ON public.taxonomy_cache USING hnsw (title_embedding public.vector_cosine_ops) WITH (m='16', ef_construction='64');
+
+
 --
 -- Name: idx_stock_log_product; Type: INDEX; Schema: public; Owner: -
 --
@@ -1435,6 +1679,14 @@ ALTER TABLE ONLY public.product_stock_log
     ADD CONSTRAINT product_stock_log_warehouse_id_fkey FOREIGN KEY (warehouse_id) REFERENCES public.warehouses(warehouse_id);
 
 
+--
+-- Name: products products_concept_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.products
+    ADD CONSTRAINT products_concept_id_fkey FOREIGN KEY (concept_id) REFERENCES public.concepts(id) ON DELETE SET NULL;
+
+
 --
 -- Name: products products_supplier_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: -
 --
@@ -1443,6 +1695,14 @@ ALTER TABLE ONLY public.products
     ADD CONSTRAINT products_supplier_id_fkey FOREIGN KEY (supplier_id) REFERENCES public.suppliers(supplier_id);
 
 
+--
+-- Name: unique_product_clusters unique_product_clusters_concept_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.unique_product_clusters
+    ADD CONSTRAINT unique_product_clusters_concept_id_fkey FOREIGN KEY (concept_id) REFERENCES public.concepts(id) ON DELETE SET NULL;
+
+
 --
 -- Name: unique_product_clusters unique_product_clusters_representative_product_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: -
 --